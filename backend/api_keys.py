@@ -0,0 +1,213 @@
+"""
+API keys for server-to-server clients (batch coaching jobs, CRM sync)
+Keys look like lc_<prefix>_<secret>. Only the prefix (indexed, unique) and a
+keyed HMAC-SHA256 of the secret are stored, so a lookup is one indexed read
+plus one HMAC instead of a password hash, and validated keys are cached in
+memory. Each key is scoped to top-level API areas and rate limited. The
+/metrics endpoints expose data about every user, so they need a key created
+with the metrics scope; "*" does not cover it. No key can change the account
+itself (PUT /auth/me): that needs the user's own access token.
+
+    python api_keys.py create --email crm@partner.com --name crm-sync --scopes journal,goals
+    python api_keys.py create --email ops@lifecoach.ai --name monitoring --scopes metrics
+    python api_keys.py list
+    python api_keys.py revoke <prefix>
+"""
+import argparse
+import asyncio
+import hashlib
+import hmac
+import logging
+import secrets
+import sys
+import os
+import time
+from datetime import datetime, timezone
+sys.path.append(os.path.dirname(__file__))
+
+from fastapi import HTTPException
+from sqlalchemy.future import select
+
+from database import async_session, engine, ApiKey, User
+
+API_KEY_PREFIX = "lc_"
+API_KEY_SECRET = os.getenv("API_KEY_SECRET")
+CACHE_TTL_SECONDS = 60  # also the worst-case delay before a revocation takes effect
+ALL_SCOPES = "*"
+METRICS_SCOPE = "metrics"
+# Scopes that "*" does not grant: they must be listed on the key
+EXPLICIT_SCOPES = frozenset({METRICS_SCOPE})
+
+# prefix -> (cache expiry, key record)
+_key_cache: dict[str, tuple[float, dict]] = {}
+# prefix -> [available tokens, last refill time]
+_rate_buckets: dict[str, list[float]] = {}
+
+
+def digest_secret(secret: str) -> str:
+    return hmac.new(API_KEY_SECRET.encode(), secret.encode(), hashlib.sha256).hexdigest()
+
+
+def generate_api_key() -> tuple[str, str, str]:
+    """Return (full key shown once to the client, prefix, stored digest)"""
+    prefix = secrets.token_hex(6)
+    secret = secrets.token_urlsafe(32)
+    return f"{API_KEY_PREFIX}{prefix}_{secret}", prefix, digest_secret(secret)
+
+
+def scope_for_path(path: str) -> str:
+    """/journal/entries -> journal, /chat/history -> chat, /auth/me -> auth"""
+    return path.strip("/").split("/", 1)[0]
+
+
+async def _load_key(prefix: str, session) -> dict | None:
+    cached = _key_cache.get(prefix)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+
+    result = await session.execute(
+        select(ApiKey, User.id, User.language, User.is_premium)
+        .join(User, User.email == ApiKey.user_email)
+        .where(ApiKey.prefix == prefix, ApiKey.revoked_at.is_(None))
+    )
+    row = result.first()
+    if row is None:
+        _key_cache.pop(prefix, None)
+        return None
+
+    api_key, user_id, language, is_premium = row
+    record = {
+        "prefix": api_key.prefix,
+        "digest": api_key.digest,
+        "user_email": api_key.user_email,
+        "user_id": user_id,
+        "scopes": frozenset(s.strip() for s in (api_key.scopes or "").split(",") if s.strip()),
+        "rate_limit_per_minute": api_key.rate_limit_per_minute or 0,
+        "language": language or "tr",
+        "tier": "premium" if is_premium else "free",
+    }
+    _key_cache[prefix] = (time.monotonic() + CACHE_TTL_SECONDS, record)
+    return record
+
+
+def _take_rate_token(prefix: str, limit_per_minute: int) -> bool:
+    """Token bucket: bursts up to the per-minute limit, refills continuously"""
+    if limit_per_minute <= 0:
+        return True
+    now = time.monotonic()
+    bucket = _rate_buckets.setdefault(prefix, [float(limit_per_minute), now])
+    bucket[0] = min(limit_per_minute, bucket[0] + (now - bucket[1]) * limit_per_minute / 60)
+    bucket[1] = now
+    if bucket[0] < 1:
+        return False
+    bucket[0] -= 1
+    return True
+
+
+async def authenticate_api_key(raw_key: str, scope: str, session) -> dict:
+    """Validate a raw key for the given scope and return its record (session: the request's)"""
+    invalid = HTTPException(
+        status_code=401,
+        detail="Invalid API key",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    if not API_KEY_SECRET:
+        logging.warning("API key presented but API_KEY_SECRET is not configured")
+        raise invalid
+    try:
+        prefix, secret = raw_key[len(API_KEY_PREFIX):].split("_", 1)
+    except ValueError:
+        raise invalid
+
+    record = await _load_key(prefix, session)
+    if record is None or not hmac.compare_digest(record["digest"], digest_secret(secret)):
+        logging.warning(f"API key validation failed for prefix {prefix}")
+        raise invalid
+    if scope not in record["scopes"] and (ALL_SCOPES not in record["scopes"] or scope in EXPLICIT_SCOPES):
+        raise HTTPException(status_code=403, detail=f"API key is not allowed to access '{scope}'")
+    if not _take_rate_token(prefix, record["rate_limit_per_minute"]):
+        raise HTTPException(status_code=429, detail="API key rate limit exceeded", headers={"Retry-After": "60"})
+    return record
+
+
+async def create_key(email: str, name: str, scopes: str, rate_limit: int) -> str:
+    full_key, prefix, digest = generate_api_key()
+    async with async_session() as session:
+        result = await session.execute(select(User.id).where(User.email == email))
+        if result.scalar_one_or_none() is None:
+            raise ValueError(f"No user with email {email}")
+        session.add(ApiKey(
+            prefix=prefix,
+            digest=digest,
+            user_email=email,
+            name=name,
+            scopes=scopes,
+            rate_limit_per_minute=rate_limit,
+            created_at=datetime.now(timezone.utc),
+        ))
+        await session.commit()
+    return full_key
+
+
+async def revoke_key(prefix: str) -> bool:
+    async with async_session() as session:
+        result = await session.execute(select(ApiKey).where(ApiKey.prefix == prefix))
+        api_key = result.scalar_one_or_none()
+        if api_key is None:
+            return False
+        api_key.revoked_at = datetime.now(timezone.utc)
+        await session.commit()
+    return True
+
+
+async def list_keys() -> list[ApiKey]:
+    async with async_session() as session:
+        result = await session.execute(select(ApiKey).order_by(ApiKey.created_at))
+        return result.scalars().all()
+
+
+async def run_command(args):
+    try:
+        if args.command == "create":
+            key = await create_key(args.email, args.name, args.scopes, args.rate_limit)
+            print(f"API key (shown only once): {key}")
+        elif args.command == "revoke":
+            if not await revoke_key(args.prefix):
+                logging.error(f"No API key with prefix {args.prefix}")
+                sys.exit(1)
+            logging.info(f"Revoked {args.prefix}; cached copies expire within {CACHE_TTL_SECONDS}s")
+        else:
+            for k in await list_keys():
+                status = "revoked" if k.revoked_at else "active"
+                print(f"{k.prefix}  {k.name}  {k.user_email}  scopes={k.scopes}  "
+                      f"limit={k.rate_limit_per_minute}/min  {status}")
+    finally:
+        await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage API keys for server-to-server clients")
+    sub = parser.add_subparsers(dest="command", required=True)
+    create = sub.add_parser("create")
+    create.add_argument("--email", required=True, help="account the integration acts as")
+    create.add_argument("--name", required=True)
+    create.add_argument("--scopes", default=ALL_SCOPES,
+                        help="comma-separated areas: auth, chat, journal, goals (default: all)")
+    create.add_argument("--rate-limit", type=int, default=600, help="requests per minute, 0 for unlimited")
+    revoke = sub.add_parser("revoke")
+    revoke.add_argument("prefix")
+    sub.add_parser("list")
+    args = parser.parse_args()
+
+    if args.command == "create" and not API_KEY_SECRET:
+        logging.error("Set API_KEY_SECRET before creating API keys")
+        sys.exit(1)
+    try:
+        asyncio.run(run_command(args))
+    except ValueError as e:
+        logging.error(str(e))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,37 @@
-from fastapi import APIRouter, HTTPException, Depends
-from fastapi.security import OAuth2PasswordBearer
+from fastapi import APIRouter, HTTPException, Depends, Request
+from fastapi.security import APIKeyHeader, OAuth2PasswordBearer
 from pydantic import BaseModel
-from passlib.context import CryptContext
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
+from typing import Annotated
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 import sys
 import os
+import time
+from collections import OrderedDict
 sys.path.append(os.path.dirname(__file__))
 import logging
 
-from database import async_session, User
+from database import DbSession, User
+from hashing import load_hash_policy, build_crypt_context
+from jwt_keys import ASYMMETRIC_ALGORITHMS, KeyRing
+from api_keys import API_KEY_PREFIX, METRICS_SCOPE, authenticate_api_key, scope_for_path
+from replicas import mark_write, pick_replica, primary_until
+from shards import shard_engines, user_session
 
-pwd_context = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto")
+# Scheme and cost come from the host calibration (see calibrate_hashing.py)
+pwd_context = build_crypt_context(load_hash_policy())
 SECRET_KEY = os.getenv("JWT_SECRET_KEY")
-ALGORITHM = "HS256"
+# HS256 uses the shared JWT_SECRET_KEY; ES256/RS256 sign with the key ring (see jwt_keys.py)
+ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
+key_ring = KeyRing() if ALGORITHM in ASYMMETRIC_ALGORITHMS else None
 ACCESS_TOKEN_EXPIRE_MINUTES = 1440  # 24 hours
 
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+# auto_error is off so requests authenticated by X-API-Key alone get through
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token", auto_error=False)
+api_key_header = APIKeyHeader(name="X-API-Key", auto_error=False)
 
 class UserCreate(BaseModel):
     email: str
@@ -27,9 +41,16 @@ class UserLogin(BaseModel):
     email: str
     password: str
 
+class ProfileUpdate(BaseModel):
+    language: str = None
+
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
+def verify_and_update_password(plain_password, hashed_password):
+    """Verify a password; also return a new hash if the stored one is off-policy"""
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
 def get_password_hash(password):
     return pwd_context.hash(password)
 
@@ -40,97 +61,300 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
     else:
         expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-    return encoded_jwt
+    if key_ring is None:
+        return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    signing_key = key_ring.signing_key()
+    if signing_key is None:
+        raise RuntimeError("No active JWT signing key on this node")
+    kid, key = signing_key
+    return jwt.encode(to_encode, key, algorithm=ALGORITHM, headers={"kid": kid})
+
+def can_issue_tokens() -> bool:
+    if key_ring is None:
+        return bool(SECRET_KEY)
+    return key_ring.signing_key() is not None
+
+def decode_access_token(token: str) -> dict:
+    if key_ring is None:
+        return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    kid = jwt.get_unverified_header(token).get("kid")
+    key = key_ring.verification_key(kid) if kid else None
+    if key is None:
+        raise JWTError(f"Unknown signing key id: {kid}")
+    return jwt.decode(token, key, algorithms=[ALGORITHM])
+
+class TokenClaims(BaseModel):
+    """Profile data carried in the access token so handlers skip the users table"""
+    email: str
+    user_id: int | None = None  # absent in tokens issued before the uid claim
+    language: str = "tr"
+    tier: str = "free"
+    profile_version: int = 0
+    api_key_prefix: str | None = None  # set when an API key, not a user token, authenticated the request
+
+# Tokens whose pv claim is below users.profile_version were minted before a
+# profile change and must be re-issued via /auth/refresh. The column is read
+# when a token is checked and kept per user for a short while, so a change
+# made through another worker is enforced here within the TTL.
+PROFILE_VERSION_TTL_SECONDS = 30
+PROFILE_VERSIONS_MAX = 100_000
+# email -> (expiry, profile_version), least recently used first
+profile_versions: OrderedDict[str, tuple[float, int]] = OrderedDict()
+
+def remember_profile_version(email: str, version: int):
+    profile_versions[email] = (time.monotonic() + PROFILE_VERSION_TTL_SECONDS, version)
+    profile_versions.move_to_end(email)
+    if len(profile_versions) > PROFILE_VERSIONS_MAX:
+        profile_versions.popitem(last=False)
+
+async def current_profile_version(email: str, session: AsyncSession) -> int:
+    cached = profile_versions.get(email)
+    if cached and cached[0] > time.monotonic():
+        profile_versions.move_to_end(email)
+        return cached[1]
+    row = (await session.execute(select(User.profile_version).where(User.email == email))).first()
+    if row is None:
+        raise credentials_exception()
+    version = row.profile_version or 1
+    remember_profile_version(email, version)
+    return version
+
+def profile_claims(user: User) -> dict:
+    return {
+        "uid": user.id,
+        "lang": user.language or "tr",
+        "tier": "premium" if user.is_premium else "free",
+        "pv": user.profile_version or 1,
+    }
 
-def get_current_user(token: str = Depends(oauth2_scheme)):
-    credentials_exception = HTTPException(
+def issue_access_token(user: User) -> str:
+    remember_profile_version(user.email, user.profile_version or 1)
+    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    return create_access_token(
+        data={"sub": user.email, **profile_claims(user)}, expires_delta=access_token_expires
+    )
+
+def credentials_exception():
+    return HTTPException(
         status_code=401,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+def decode_claims(token: str) -> TokenClaims:
+    """Check signature and expiry only; profile freshness is checked separately"""
+    if not token:
+        raise credentials_exception()
     # Basic logging to assist debugging token validation issues
     try:
         logging.info(f"Validating token: {str(token)[:12]}...")
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = decode_access_token(token)
         email: str = payload.get("sub")
         if email is None:
             logging.warning("Token decoded but 'sub' claim is missing")
-            raise credentials_exception
+            raise credentials_exception()
+        return TokenClaims(
+            email=email,
+            user_id=payload.get("uid"),
+            language=payload.get("lang", "tr"),
+            tier=payload.get("tier", "free"),
+            profile_version=payload.get("pv", 0),
+        )
+    except HTTPException:
+        raise
     except JWTError as e:
         logging.warning(f"Token validation error: {str(e)}")
-        raise credentials_exception
+        raise credentials_exception()
     except Exception as e:
         logging.error(f"Unexpected error validating token: {str(e)}")
-        raise credentials_exception
-    return email
+        raise credentials_exception()
+
+async def get_current_claims(
+    request: Request,
+    session: DbSession,
+    token: str = Depends(oauth2_scheme),
+    api_key: str = Depends(api_key_header),
+) -> TokenClaims:
+    # Server-to-server clients send an API key, either as X-API-Key or as the bearer token
+    raw_key = api_key or (token if token and token.startswith(API_KEY_PREFIX) else None)
+    if raw_key:
+        record = await authenticate_api_key(raw_key, scope_for_path(request.url.path), session)
+        return TokenClaims(email=record["user_email"], user_id=record["user_id"],
+                           language=record["language"], tier=record["tier"], api_key_prefix=record["prefix"])
+
+    claims = decode_claims(token)
+    if claims.profile_version < await current_profile_version(claims.email, session):
+        raise HTTPException(
+            status_code=401,
+            detail="Profile changed, token must be refreshed",
+            headers={"WWW-Authenticate": 'Bearer error="invalid_token"'},
+        )
+    return claims
+
+async def require_metrics_key(
+    session: DbSession,
+    token: str = Depends(oauth2_scheme),
+    api_key: str = Depends(api_key_header),
+):
+    """Guard for the /metrics routers: an API key with the metrics scope, never a user token"""
+    raw_key = api_key or (token if token and token.startswith(API_KEY_PREFIX) else None)
+    if not raw_key:
+        raise HTTPException(
+            status_code=401,
+            detail=f"An API key with the '{METRICS_SCOPE}' scope is required",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    await authenticate_api_key(raw_key, METRICS_SCOPE, session)
+
+def get_current_user(claims: TokenClaims = Depends(get_current_claims)):
+    return claims.email
+
+def get_token_user(claims: TokenClaims = Depends(get_current_claims)):
+    """Like get_current_user, but only for the user's own token: account changes
+    are not open to API keys, whatever their scopes"""
+    if claims.api_key_prefix is not None:
+        raise HTTPException(status_code=403, detail="This action needs a user access token, not an API key")
+    return claims.email
+
+async def _shard_user_id(session: AsyncSession, claims: TokenClaims) -> int:
+    if claims.user_id is not None:
+        return claims.user_id
+    # Tokens issued before the uid claim
+    user_id = (await session.execute(select(User.id).where(User.email == claims.email))).scalar()
+    if user_id is None:
+        raise HTTPException(status_code=401, detail="Could not validate credentials")
+    return user_id
+
+async def get_user_db(session: DbSession, claims: TokenClaims = Depends(get_current_claims)):
+    """Session for the user's own rows: their shard, or the request session when unsharded"""
+    if shard_engines is None:
+        yield session
+        return
+    async with user_session(await _shard_user_id(session, claims), claims.email) as shard_session:
+        yield shard_session
+
+UserDbSession = Annotated[AsyncSession, Depends(get_user_db, scope="function")]
+
+async def get_read_db(request: Request, session: DbSession, claims: TokenClaims = Depends(get_current_claims)):
+    """Session for read-only handlers: a replica when one is usable, else the request session
+
+    With sharding the user's shard serves their reads (shards have no replicas).
+    """
+    if shard_engines is not None:
+        async with user_session(await _shard_user_id(session, claims), claims.email) as shard_session:
+            yield shard_session
+        return
+    replica = pick_replica(claims.email, primary_until(request.cookies))
+    if replica is None:
+        yield session
+        return
+    async with replica.sessionmaker() as replica_session:
+        yield replica_session
+
+ReadDbSession = Annotated[AsyncSession, Depends(get_read_db, scope="function")]
 
 router = APIRouter()
 
 @router.post("/register")
-async def register(user: UserCreate):
+async def register(user: UserCreate, session: DbSession):
     try:
         hashed_password = get_password_hash(user.password)
-        async with async_session() as session:
-            new_user = User(email=user.email, password=hashed_password)
-            session.add(new_user)
-            await session.commit()
-            await session.refresh(new_user)
+        new_user = User(email=user.email, password=hashed_password)
+        session.add(new_user)
+        await session.flush()
+        mark_write(new_user.email)
 
-        # Ensure JWT secret is configured
-        if not SECRET_KEY:
-            raise HTTPException(status_code=500, detail="Server configuration error: JWT secret not set")
+        # Ensure JWT signing is configured
+        if not can_issue_tokens():
+            raise HTTPException(status_code=500, detail="Server configuration error: JWT signing key not set")
 
         # Create access token so frontend can use it immediately after sign-up
-        access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-        access_token = create_access_token(
-            data={"sub": user.email}, expires_delta=access_token_expires
-        )
+        access_token = issue_access_token(new_user)
 
         return {"access_token": access_token, "token_type": "bearer", "email": user.email}
+    except IntegrityError:
+        # Unique email violation, reported the same way by SQLite and PostgreSQL
+        raise HTTPException(status_code=400, detail="Bu e-posta zaten kayıtlı")
     except Exception as e:
-        error_msg = str(e)
-        # Check if it's a duplicate email error
-        if "UNIQUE constraint failed" in error_msg or "duplicate key" in error_msg.lower():
-            raise HTTPException(status_code=400, detail="Bu e-posta zaten kayıtlı")
-        raise HTTPException(status_code=400, detail=f"Kayıt hatası: {error_msg}")
+        raise HTTPException(status_code=400, detail=f"Kayıt hatası: {str(e)}")
 
 @router.post("/login")
-async def login(user: UserLogin):
+async def login(user: UserLogin, session: DbSession):
     try:
-        async with async_session() as session:
-            result = await session.execute(select(User).where(User.email == user.email))
-            db_user = result.scalar_one_or_none()
-            if not db_user:
-                raise HTTPException(status_code=400, detail="Böyle bir hesap yok")
-            if not verify_password(user.password, db_user.password):
-                raise HTTPException(status_code=400, detail="E-posta veya şifre hatalı")
-            access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-            access_token = create_access_token(
-                data={"sub": user.email}, expires_delta=access_token_expires
-            )
-            return {"access_token": access_token, "token_type": "bearer"}
+        result = await session.execute(select(User).where(User.email == user.email))
+        db_user = result.scalar_one_or_none()
+        if not db_user:
+            raise HTTPException(status_code=400, detail="Böyle bir hesap yok")
+        valid, new_hash = verify_and_update_password(user.password, db_user.password)
+        if not valid:
+            raise HTTPException(status_code=400, detail="E-posta veya şifre hatalı")
+        if new_hash:
+            # Stored hash predates the current policy; upgrade it transparently
+            db_user.password = new_hash
+        access_token = issue_access_token(db_user)
+        return {"access_token": access_token, "token_type": "bearer"}
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+@router.post("/refresh")
+async def refresh_token(session: DbSession, token: str = Depends(oauth2_scheme)):
+    """Re-issue a token with current profile claims (accepts outdated profile versions)"""
+    claims = decode_claims(token)
+    result = await session.execute(select(User).where(User.email == claims.email))
+    user = result.scalar_one_or_none()
+    if not user:
+        raise HTTPException(status_code=401, detail="Could not validate credentials")
+    return {"access_token": issue_access_token(user), "token_type": "bearer"}
+
+@router.put("/me")
+async def update_profile(update: ProfileUpdate, session: DbSession, current_user: str = Depends(get_token_user)):
+    try:
+        result = await session.execute(select(User).where(User.email == current_user))
+        user = result.scalar_one_or_none()
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+
+        if update.language is not None:
+            user.language = update.language
+        # Any profile change invalidates the claims in previously issued tokens
+        user.profile_version = (user.profile_version or 1) + 1
+        await session.flush()
+        mark_write(current_user)
+        return {
+            "access_token": issue_access_token(user),
+            "token_type": "bearer",
+            "language": user.language,
+        }
+    except HTTPException:
+        raise
+    except Exception:
+        logging.exception("Error in update_profile")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+@router.get("/jwks.json")
+async def get_jwks():
+    """Public signing keys for verification-only nodes"""
+    if key_ring is None:
+        raise HTTPException(status_code=404, detail="JWKS is only available with asymmetric JWT signing")
+    return key_ring.jwks()
+
 @router.get("/me")
-async def get_current_user_info(current_user: str = Depends(get_current_user)):
+async def get_current_user_info(session: ReadDbSession, current_user: str = Depends(get_current_user)):
     try:
-        async with async_session() as session:
-            result = await session.execute(select(User).where(User.email == current_user))
-            user = result.scalar_one_or_none()
-            if not user:
-                raise HTTPException(status_code=404, detail="User not found")
-
-            return {
-                "email": user.email,
-                "user_type": "premium" if user.is_premium else "free",
-                "language": user.language or "tr",
-                "message_count": user.message_count or 0,
-                "last_message_date": user.last_message_date
-            }
+        result = await session.execute(select(User).where(User.email == current_user))
+        user = result.scalar_one_or_none()
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+
+        return {
+            "email": user.email,
+            "user_type": "premium" if user.is_premium else "free",
+            "language": user.language or "tr",
+            "message_count": user.message_count or 0,
+            "last_message_date": user.last_message_date
+        }
     except Exception as e:
         # Propagate HTTPException (like 404) unchanged so caller gets correct status code.
         if isinstance(e, HTTPException):
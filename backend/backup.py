@@ -0,0 +1,288 @@
+"""
+Online backups of the SQLite databases for LifeCoach AI
+Copies DATABASE_URL and every shard file while the API keeps serving, with
+SQLite's backup API: DB_BACKUP_PAGES_PER_STEP pages per step and a
+DB_BACKUP_STEP_PAUSE_MS pause between steps. The copy reads one pinned WAL
+snapshot, so writers never wait on it and their commits do not make it start
+over. In other journal modes any write between steps restarts the copy, so
+there it runs as a single step and writers wait until it is done. The copy
+is then compressed (DB_BACKUP_COMPRESSION: gzip, zstd or off) into
+DB_BACKUP_DIR as <name>-<UTC time>.db.gz, and only the newest
+DB_BACKUP_KEEP snapshots of each file are kept.
+
+benchmarks/bench_backup.py measures what a backup costs the journal write
+path, in WAL and rollback-journal mode.
+
+main.py runs backup_loop() every DB_BACKUP_INTERVAL seconds. By hand:
+
+    python backup.py run                              # back up every file now
+    python backup.py list
+    python backup.py verify                           # restore the newest snapshots to a temp dir and check them
+    python backup.py verify backups/lifecoach-20261019T030000Z.db.gz
+    python backup.py restore backups/lifecoach-20261019T030000Z.db.gz --to lifecoach.db --force
+
+Restore with the API stopped; it replaces the file and drops its -wal/-shm.
+A snapshot from an older schema is upgraded by migrations.py on startup.
+"""
+import argparse
+import asyncio
+import gzip
+import logging
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+sys.path.append(os.path.dirname(__file__))
+
+from sqlalchemy.engine import make_url
+
+from database import db_settings
+from migrations import HEAD
+from shards import shard_engines
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logging.basicConfig(level=logging.INFO)
+
+SUFFIXES = {"OFF": ".db", "GZIP": ".db.gz", "ZSTD": ".db.zst"}
+_SNAPSHOT = re.compile(r"^(?P<name>.+)-(?P<stamp>\d{8}T\d{6}Z)\.db(\.gz|\.zst)?$")
+COPY_CHUNK_BYTES = 1024 * 1024
+
+if db_settings.backup_compression == "ZSTD" and zstandard is None:
+    raise RuntimeError("DB_BACKUP_COMPRESSION=zstd needs the zstandard package (pip install zstandard)")
+
+
+def database_files() -> list[tuple[str, str]]:
+    """(name, path) for DATABASE_URL and every existing shard file"""
+    path = make_url(db_settings.url).database
+    files = [(os.path.splitext(os.path.basename(path))[0], path)]
+    if shard_engines is not None:
+        for index in range(db_settings.shard_count):
+            if os.path.exists(shard_engines.path(index)):
+                files.append((f"shard_{index:03d}", shard_engines.path(index)))
+    return files
+
+
+def _compress(source: str, target: str, compression: str):
+    part = target + ".part"
+    with open(source, "rb") as raw:
+        if compression == "GZIP":
+            with gzip.open(part, "wb", compresslevel=6) as out:
+                shutil.copyfileobj(raw, out, COPY_CHUNK_BYTES)
+        elif compression == "ZSTD":
+            with open(part, "wb") as out:
+                zstandard.ZstdCompressor(level=3).copy_stream(raw, out)
+        else:
+            with open(part, "wb") as out:
+                shutil.copyfileobj(raw, out, COPY_CHUNK_BYTES)
+    os.replace(part, target)
+
+
+def _decompress(snapshot: str, target: str):
+    with open(snapshot, "rb") as raw, open(target, "wb") as out:
+        if snapshot.endswith(".gz"):
+            with gzip.open(raw, "rb") as src:
+                shutil.copyfileobj(src, out, COPY_CHUNK_BYTES)
+        elif snapshot.endswith(".zst"):
+            if zstandard is None:
+                raise RuntimeError("Snapshot is zstd-compressed; install zstandard to read it")
+            zstandard.ZstdDecompressor().copy_stream(raw, out)
+        else:
+            shutil.copyfileobj(raw, out, COPY_CHUNK_BYTES)
+
+
+def backup_file(name: str, path: str, directory: str, pages_per_step: int = None,
+                pause_ms: int = None, compression: str = None) -> dict:
+    """Snapshot one SQLite file while it stays in use (blocking; run in a thread)"""
+    pages_per_step = pages_per_step or db_settings.backup_pages_per_step
+    pause = (db_settings.backup_step_pause_ms if pause_ms is None else pause_ms) / 1000
+    compression = compression or db_settings.backup_compression
+    os.makedirs(directory, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    target = os.path.join(directory, f"{name}-{stamp}{SUFFIXES[compression]}")
+    copy = os.path.join(directory, f".{name}-{stamp}.copy")
+
+    steps = 0
+
+    def progress(status, remaining, total):
+        nonlocal steps
+        steps += 1
+        if remaining:
+            time.sleep(pause)
+
+    start = time.perf_counter()
+    source = sqlite3.connect(path, timeout=db_settings.sqlite_busy_timeout_ms / 1000, isolation_level=None)
+    destination = sqlite3.connect(copy)
+    try:
+        if source.execute("PRAGMA journal_mode").fetchone()[0] == "wal":
+            # Pin one read snapshot for the whole copy: WAL writers carry on
+            # and their commits do not make the backup start over
+            source.execute("BEGIN")
+            source.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+        else:
+            # Without WAL a write between steps restarts the copy; under
+            # steady writes a paced copy would never finish
+            pages_per_step = -1
+        source.backup(destination, pages=pages_per_step, progress=progress)
+        if source.in_transaction:
+            source.execute("ROLLBACK")
+        pages, page_size = (destination.execute(f"PRAGMA {p}").fetchone()[0] for p in ("page_count", "page_size"))
+    finally:
+        source.close()
+        destination.close()
+    copied = time.perf_counter()
+    try:
+        _compress(copy, target, compression)
+    finally:
+        os.remove(copy)
+
+    return {
+        "name": name,
+        "snapshot": target,
+        "pages": pages,
+        "steps": steps,
+        "copy_seconds": round(copied - start, 3),
+        "compress_seconds": round(time.perf_counter() - copied, 3),
+        "database_bytes": pages * page_size,
+        "snapshot_bytes": os.path.getsize(target),
+    }
+
+
+def snapshots(directory: str) -> dict[str, list[str]]:
+    """Snapshot paths per database name, oldest first"""
+    found: dict[str, list[tuple[str, str]]] = {}
+    if os.path.isdir(directory):
+        for entry in os.listdir(directory):
+            match = _SNAPSHOT.match(entry)
+            if match:
+                found.setdefault(match["name"], []).append((match["stamp"], os.path.join(directory, entry)))
+    return {name: [path for _, path in sorted(items)] for name, items in found.items()}
+
+
+def prune(directory: str, keep: int) -> list[str]:
+    """Delete all but the newest `keep` snapshots of each database; returns the deleted paths"""
+    removed = []
+    for paths in snapshots(directory).values():
+        for path in paths[:-keep]:
+            os.remove(path)
+            removed.append(path)
+    return removed
+
+
+def check_database(path: str) -> dict:
+    """Integrity check, schema version and row counts of a restored file"""
+    conn = sqlite3.connect(path)
+    try:
+        integrity = conn.execute("PRAGMA integrity_check").fetchone()[0]
+        try:
+            version = conn.execute("SELECT version FROM schema_version").fetchone()[0]
+        except sqlite3.OperationalError:
+            version = None
+        tables = [name for (name,) in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name")]
+        rows = {table: conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0] for table in tables}
+    finally:
+        conn.close()
+    return {"ok": integrity == "ok" and version is not None and version <= HEAD,
+            "integrity": integrity, "version": version, "rows": rows}
+
+
+def verify_snapshot(snapshot: str) -> dict:
+    """Restore a snapshot into a temporary directory and check it"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "restored.db")
+        _decompress(snapshot, path)
+        return check_database(path)
+
+
+def restore_snapshot(snapshot: str, target: str, force: bool = False) -> dict:
+    """Replace target with a verified copy of the snapshot (API stopped)"""
+    if os.path.exists(target) and not force:
+        raise FileExistsError(f"{target} exists; pass --force to replace it")
+    part = target + ".restore"
+    _decompress(snapshot, part)
+    result = check_database(part)
+    if not result["ok"]:
+        os.remove(part)
+        raise ValueError(f"{snapshot} failed verification: {result['integrity']}, version {result['version']}")
+    # A leftover WAL of the old file would be replayed onto the restored one
+    for suffix in ("-wal", "-shm"):
+        if os.path.exists(target + suffix):
+            os.remove(target + suffix)
+    os.replace(part, target)
+    return result
+
+
+async def backup(directory: str = None) -> list[dict]:
+    """Back up every database file, one after the other, then apply DB_BACKUP_KEEP"""
+    directory = directory or db_settings.backup_dir
+    results = []
+    for name, path in database_files():
+        result = await asyncio.to_thread(backup_file, name, path, directory)
+        logging.info(
+            f"Backed up {name}: {result['pages']} pages in {result['steps']} steps, "
+            f"{result['copy_seconds']}s copy + {result['compress_seconds']}s compress, "
+            f"{result['database_bytes']} -> {result['snapshot_bytes']} bytes"
+        )
+        results.append(result)
+    for path in prune(directory, db_settings.backup_keep):
+        logging.info(f"Removed old snapshot {path}")
+    return results
+
+
+async def backup_loop(interval: int):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await backup()
+        except Exception as e:
+            logging.error(f"Backup failed: {str(e)}")
+
+
+def _latest() -> list[str]:
+    return [paths[-1] for paths in snapshots(db_settings.backup_dir).values()]
+
+
+async def run_command(args):
+    if not db_settings.is_sqlite or db_settings.is_memory_sqlite:
+        sys.exit("Online backups cover SQLite database files; back up PostgreSQL with pg_dump")
+    if args.command == "run":
+        await backup()
+    elif args.command == "list":
+        for name, paths in sorted(snapshots(db_settings.backup_dir).items()):
+            for path in paths:
+                print(f"{name}\t{os.path.getsize(path)} bytes\t{path}")
+    elif args.command == "verify":
+        failed = False
+        for snapshot in args.snapshots or _latest():
+            result = await asyncio.to_thread(verify_snapshot, snapshot)
+            failed = failed or not result["ok"]
+            rows = ", ".join(f"{table}={count}" for table, count in result["rows"].items())
+            print(f"{'ok' if result['ok'] else 'FAIL'}\t{snapshot}\tintegrity={result['integrity']}\t"
+                  f"version={result['version']}\t{rows}")
+        if failed:
+            sys.exit(1)
+    elif args.command == "restore":
+        result = await asyncio.to_thread(restore_snapshot, args.snapshot, args.to, args.force)
+        logging.info(f"Restored {args.snapshot} to {args.to} (schema version {result['version']})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Online backups of the SQLite databases")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("run", help="back up DATABASE_URL and every shard now")
+    commands.add_parser("list", help="snapshots in DB_BACKUP_DIR")
+    verify_parser = commands.add_parser("verify", help="restore snapshots to a temp dir and check them")
+    verify_parser.add_argument("snapshots", nargs="*", help="default: the newest snapshot of each database")
+    restore_parser = commands.add_parser("restore", help="replace a database file with a snapshot")
+    restore_parser.add_argument("snapshot")
+    restore_parser.add_argument("--to", required=True, help="database file to write")
+    restore_parser.add_argument("--force", action="store_true", help="replace an existing file")
+    asyncio.run(run_command(parser.parse_args()))
@@ -0,0 +1,106 @@
+"""
+SQLite vs PostgreSQL parity benchmark
+Runs the same API workload (journal and goal writes, list reads, chat turns)
+against a temporary SQLite file and a temporary local PostgreSQL server
+(see local_postgres.py) and reports requests/s per phase.
+
+    python benchmarks/bench_backends.py --users 10 --requests 50 --concurrency 10
+"""
+import argparse
+import asyncio
+import json
+import subprocess
+import sys
+import os
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BACKEND_DIR)
+RESULT_MARKER = "BENCH_RESULT "
+
+
+async def run_child(users: int, requests: int, concurrency: int):
+    import httpx
+    import main
+    from database import engine, Base
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+
+    transport = httpx.ASGITransport(app=main.app)
+    semaphore = asyncio.Semaphore(concurrency)
+    results = {}
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        tokens = []
+        for n in range(users):
+            r = await client.post("/auth/register", json={"email": f"user{n}@example.com", "password": "bench"})
+            tokens.append({"Authorization": f"Bearer {r.json()['access_token']}"})
+
+        async def call(method, url, headers, **kwargs):
+            async with semaphore:
+                r = await client.request(method, url, headers=headers, **kwargs)
+                r.raise_for_status()
+
+        phases = {
+            "journal writes": lambda h, i: call("POST", "/journal/entries", h,
+                                                json={"title": f"t{i}", "content": "x" * 500}),
+            "goal writes": lambda h, i: call("POST", "/goals", h, json={"title": f"g{i}", "description": "d"}),
+            "chat turns": lambda h, i: call("POST", "/chat", h, json={"message": f"merhaba {i}"}),
+            "list reads": lambda h, i: call("GET", ["/journal/entries", "/goals", "/chat/history"][i % 3], h),
+        }
+        for phase, make_call in phases.items():
+            start = time.perf_counter()
+            await asyncio.gather(*(make_call(h, i) for h in tokens for i in range(requests)))
+            results[phase] = users * requests / (time.perf_counter() - start)
+    await engine.dispose()
+    print(RESULT_MARKER + json.dumps(results), flush=True)
+
+
+def run_variant(database_url: str, args, cwd: str) -> dict:
+    env = dict(os.environ, DB_ECHO="0", DATABASE_URL=database_url, JWT_SECRET_KEY="bench-secret",
+               JWT_ALGORITHM="HS256", GEMINI_API_KEY="")
+    proc = subprocess.run(
+        [sys.executable, __file__, "--child", "--users", str(args.users),
+         "--requests", str(args.requests), "--concurrency", str(args.concurrency)],
+        env=env, cwd=cwd, capture_output=True, text=True, check=True,
+    )
+    for line in proc.stdout.splitlines():
+        if line.startswith(RESULT_MARKER):
+            return json.loads(line[len(RESULT_MARKER):])
+    raise RuntimeError(f"Benchmark child produced no result:\n{proc.stderr[-2000:]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare API throughput on SQLite and PostgreSQL")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=30, help="requests per user per phase")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        asyncio.run(run_child(args.users, args.requests, args.concurrency))
+        return
+
+    from local_postgres import local_postgres
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        results["sqlite"] = run_variant(f"sqlite+aiosqlite:///{tmp}/bench.db", args, tmp)
+        try:
+            with local_postgres() as url:
+                results["postgresql"] = run_variant(url, args, tmp)
+        except RuntimeError as e:
+            print(f"Skipping PostgreSQL: {e}")
+
+    phases = list(results["sqlite"])
+    print(f"{args.users} users x {args.requests} requests per phase, concurrency {args.concurrency} (req/s)")
+    print(f"{'phase':<16}" + "".join(f"{backend:>12}" for backend in results))
+    for phase in phases:
+        print(f"{phase:<16}" + "".join(f"{results[b][phase]:>12.1f}" for b in results))
+
+
+if __name__ == "__main__":
+    main()
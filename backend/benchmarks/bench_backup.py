@@ -0,0 +1,121 @@
+"""
+Writer latency during an online backup
+Seeds a temporary SQLite database (schema from migrations.py) with --rows
+journal entries, then runs the journal write path (insert an entry and bump
+user_stats, one transaction each) from --workers concurrent tasks while:
+
+    idle      no backup, for --idle-seconds
+    paced     backup.py's copy: DB_BACKUP_PAGES_PER_STEP pages per step, DB_BACKUP_STEP_PAUSE_MS pause
+    one-shot  the whole file in one backup step, no pause
+
+and prints commits/s and write latency for each, plus how long the copy took.
+With --journal-mode DELETE, backup.py copies in a single step too.
+
+    python benchmarks/bench_backup.py --rows 200000 --workers 8
+"""
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def seed(path: str, rows: int):
+    conn = sqlite3.connect(path)
+    conn.execute("INSERT INTO users (id, email, password) VALUES (1, 'member@lifecoach-example.com', 'x')")
+    now = datetime.now(timezone.utc).isoformat(" ")
+    conn.executemany(
+        "INSERT INTO journal_entries (user_email, user_id, title, content, created_at, updated_at) "
+        "VALUES ('member@lifecoach-example.com', 1, 'Bugün', ?, ?, ?)",
+        ((f"Kendimi iyi hissettim, {n}. gün. " * 10, now, now) for n in range(rows)),
+    )
+    conn.commit()
+    conn.close()
+
+
+async def measure(args, copy=None) -> dict:
+    """Write latencies while copy() runs in a thread (or for --idle-seconds)"""
+    from database import async_session, JournalEntry
+    from stats import update_stats
+
+    latencies = []
+    stop = asyncio.Event()
+
+    async def worker():
+        while not stop.is_set():
+            start = time.perf_counter()
+            async with async_session() as session:
+                now = datetime.now(timezone.utc)
+                session.add(JournalEntry(user_email="member@lifecoach-example.com", user_id=1, title="Bugün",
+                                         content="Kendimi iyi hissettim. " * 20, created_at=now, updated_at=now))
+                await update_stats(session, "member@lifecoach-example.com", 1, journal=1, journal_created_at=now)
+                await session.commit()
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    workers = [asyncio.create_task(worker()) for _ in range(args.workers)]
+    start = time.perf_counter()
+    if copy is None:
+        await asyncio.sleep(args.idle_seconds)
+    else:
+        await asyncio.to_thread(copy)
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await asyncio.gather(*workers)
+
+    latencies.sort()
+    return {"seconds": elapsed, "commits_per_s": len(latencies) / elapsed, "p50": statistics.median(latencies),
+            "p99": latencies[int(len(latencies) * 0.99)], "max": latencies[-1]}
+
+
+async def run(args, tmp: str, path: str):
+    from backup import backup_file
+    from database import engine
+    from migrations import upgrade
+
+    await upgrade()
+    await engine.dispose()
+    seed(path, args.rows)
+    size_mb = os.path.getsize(path) / 1e6
+
+    modes = {
+        "idle": None,
+        "paced": lambda: backup_file("paced", path, tmp, compression="OFF"),
+        "one-shot": lambda: backup_file("oneshot", path, tmp, pages_per_step=2 ** 31 - 1, pause_ms=0, compression="OFF"),
+    }
+    print(f"{args.journal_mode}, {size_mb:.0f} MB, {args.workers} writers")
+    print(f"{'mode':<10}{'copy s':>8}{'commits/s':>11}{'p50 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    for name, copy in modes.items():
+        result = await measure(args, copy)
+        copy_seconds = f"{result['seconds']:.2f}" if copy else "-"
+        print(f"{name:<10}{copy_seconds:>8}{result['commits_per_s']:>11.0f}{result['p50']:>9.2f}"
+              f"{result['p99']:>9.2f}{result['max']:>9.2f}")
+    await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure write latency during an online SQLite backup")
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--idle-seconds", type=float, default=3.0)
+    parser.add_argument("--journal-mode", default="WAL", choices=["WAL", "DELETE"])
+    args = parser.parse_args()
+
+    random.seed(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        os.environ.update(DB_ECHO="0", DATABASE_URL=f"sqlite+aiosqlite:///{path}",
+                          DB_SQLITE_JOURNAL_MODE=args.journal_mode, DB_SQLITE_BUSY_TIMEOUT_MS="60000",
+                          DB_POOL_SIZE=str(args.workers), DB_MAX_OVERFLOW="0")
+        sys.path.append(BACKEND_DIR)
+        asyncio.run(run(args, tmp, path))
+
+
+if __name__ == "__main__":
+    main()
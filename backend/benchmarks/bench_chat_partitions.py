@@ -0,0 +1,138 @@
+"""
+Chat history: one table vs. monthly partitions
+Seeds two temporary SQLite databases (schema from migrations.py) with the
+same --rows chat turns spread evenly over the last --months months and
+--users users: one keeps everything in the plain chat_history table, the
+other in chat_history_YYYY_MM partitions. Reports for each layout:
+
+    recent   one user's last 30 days (GET /chat/history?since=...), median ms
+    full     one user's whole history, median ms
+    expire   removing the oldest --expire months: DELETE vs. DROP TABLE, ms
+
+    python benchmarks/bench_chat_partitions.py --rows 200000 --months 24 --users 200
+"""
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def seed(path: str, rows: list, users: int, partitioned: bool):
+    from sqlalchemy import create_engine, insert
+    from chat_partitions import create_partition, month_of
+    from database import ChatHistory, User
+
+    db_engine = create_engine(f"sqlite:///{path}")
+    by_table: dict = {}
+    for n, created_at in rows:
+        key = month_of(created_at) if partitioned else None
+        by_table.setdefault(key, []).append({
+            "user_email": f"member.{n:06d}@lifecoach-example.com", "user_id": n + 1, "feature": "chat",
+            "message": "Bugün ne yapmalıyım?", "response": "Küçük bir adımla başla.", "created_at": created_at,
+        })
+    with db_engine.begin() as conn:
+        conn.execute(insert(User), [{"id": n + 1, "email": f"member.{n:06d}@lifecoach-example.com", "password": "x"}
+                                    for n in range(users)])
+        for month, values in by_table.items():
+            table = create_partition(conn, month) if partitioned else ChatHistory.__table__
+            conn.execute(insert(table), values)
+    db_engine.dispose()
+
+
+async def read_latency(url: str, users: int, queries: int, since: datetime | None) -> float:
+    from sqlalchemy.ext.asyncio import create_async_engine
+    import chat_partitions
+    from chat import history_query
+    from database import ChatHistory
+
+    db_engine = create_async_engine(url)
+    timings = []
+    async with db_engine.connect() as conn:
+        for _ in range(queries):
+            n = random.randrange(users)
+            start = time.perf_counter()
+            tables = await chat_partitions.partitions(conn, since) or [ChatHistory.__table__]
+            result = await conn.execute(history_query(tables, f"member.{n:06d}@lifecoach-example.com", n + 1, since))
+            result.all()
+            timings.append((time.perf_counter() - start) * 1000)
+    await db_engine.dispose()
+    return statistics.median(timings)
+
+
+def expire(path: str, cutoff: datetime, partitioned: bool) -> float:
+    from chat_partitions import month_of, partition_name
+
+    conn = sqlite3.connect(path, isolation_level=None)
+    start = time.perf_counter()
+    conn.execute("BEGIN")
+    if partitioned:
+        names = [name for (name,) in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE 'chat_history_%'")]
+        for name in names:
+            if name < partition_name(month_of(cutoff)):
+                conn.execute(f"DROP TABLE {name}")
+    else:
+        conn.execute("DELETE FROM chat_history WHERE created_at < ?", (cutoff.strftime("%Y-%m-%d %H:%M:%S.%f"),))
+    conn.execute("COMMIT")
+    elapsed = (time.perf_counter() - start) * 1000
+    conn.close()
+    return elapsed
+
+
+async def run(args, tmp: str):
+    from chat_partitions import add_months, month_of
+    from database import db_settings
+    from migrations import upgrade
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    db_settings.user_key = "id"
+    now = datetime.now(timezone.utc)
+    first = add_months(month_of(now), 1 - args.months)
+    span = (now - datetime(first.year, first.month, 1, tzinfo=timezone.utc)).total_seconds()
+    rng = random.Random(0)
+    rows = [(rng.randrange(args.users), now - timedelta(seconds=span * (1 - i / args.rows)))
+            for i in range(args.rows)]
+    cutoff_month = add_months(first, args.expire)
+    cutoff = datetime(cutoff_month.year, cutoff_month.month, 1, tzinfo=timezone.utc)
+
+    print(f"{'layout':<12}{'recent ms':>10}{'full ms':>10}{'expire ms':>11}"
+          f"  ({args.rows // args.users} rows per user, dropping {args.expire} of {args.months} months)")
+    for name, partitioned in (("one table", False), ("partitions", True)):
+        path = os.path.join(tmp, f"{'partitioned' if partitioned else 'single'}.db")
+        url = f"sqlite+aiosqlite:///{path}"
+        db_engine = create_async_engine(url)
+        await upgrade(db_engine)
+        await db_engine.dispose()
+
+        seed(path, rows, args.users, partitioned)
+        recent = await read_latency(url, args.users, args.queries, now - timedelta(days=30))
+        full = await read_latency(url, args.users, args.queries, None)
+        print(f"{name:<12}{recent:>10.2f}{full:>10.2f}{expire(path, cutoff, partitioned):>11.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare chat history reads and retention with and without monthly partitions")
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--months", type=int, default=24)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--expire", type=int, default=12, help="oldest months to remove")
+    args = parser.parse_args()
+
+    random.seed(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ.update(DB_ECHO="0", DATABASE_URL=f"sqlite+aiosqlite:///{tmp}/bench.db")
+        sys.path.append(BACKEND_DIR)
+        asyncio.run(run(args, tmp))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+Chat text compression: database size and read latency
+Seeds one temporary SQLite database (schema from migrations.py) per storage
+mode with the same --rows chat history rows, Gemini-style responses built
+from a shared pool of coaching phrases, spread over --users users. Reports
+the used file size and the latency of the /chat/history query for one user.
+
+    off       plain TEXT (the previous storage)
+    zlib      DB_COMPRESSION=zlib
+    zstd      DB_COMPRESSION=zstd (skipped without zstandard)
+    zstd+dict zstd with a dictionary trained on --train-samples responses
+
+    python benchmarks/bench_compression.py --rows 50000 --users 500 --queries 200
+"""
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+OPENERS = [
+    "Harika bir soru!", "Bunu paylaştığın için teşekkürler.", "Seni çok iyi anlıyorum.",
+    "Great question!", "Thanks for sharing this with me.", "That sounds like a lot to carry.",
+]
+ADVICE = [
+    "Hedefini küçük, ölçülebilir adımlara bölmeyi deneyebilirsin.",
+    "Her sabah 10 dakika nefes egzersizi yapmak stresi azaltmaya yardımcı olur.",
+    "Uyku düzenin motivasyonunu doğrudan etkiler; her gün aynı saatte yatmaya çalış.",
+    "Bir günlük tutmak düşüncelerini netleştirmenin en etkili yollarından biridir.",
+    "Kendine karşı sabırlı ol; değişim zaman alır ve bu tamamen normal.",
+    "Haftalık bir plan yapıp ilerlemeni her pazar gözden geçirebilirsin.",
+    "Try breaking your goal into small, measurable steps you can finish this week.",
+    "A short walk after lunch is one of the simplest ways to reset your focus.",
+    "Write down three things that went well today, however small they seem.",
+    "Progress is rarely linear; a setback does not erase the work you have done.",
+    "Consider setting a fixed time for deep work and protecting it like a meeting.",
+    "Drinking enough water and moving every hour makes a surprising difference.",
+]
+CLOSERS = [
+    "Unutma, her gün küçük bir adım bile büyük bir fark yaratır. 💪",
+    "Yarın nasıl hissettiğini bana yazmayı unutma!",
+    "Remember: small steps every day add up to big changes. 🌱",
+    "Let me know how it goes tomorrow!",
+]
+
+
+def response_text(rng: random.Random) -> str:
+    body = " ".join(rng.choice(ADVICE) for _ in range(rng.randint(6, 16)))
+    return f"{rng.choice(OPENERS)} {body} Bugün {rng.randint(1, 30)}. gün. {rng.choice(CLOSERS)}"
+
+
+def message_text(rng: random.Random) -> str:
+    return " ".join(rng.choice(ADVICE).split()[:rng.randint(4, 12)]) + "?"
+
+
+def used_bytes(path: str) -> int:
+    conn = sqlite3.connect(path)
+    page_size, pages, free = (conn.execute(f"PRAGMA {p}").fetchone()[0]
+                              for p in ("page_size", "page_count", "freelist_count"))
+    conn.close()
+    return page_size * (pages - free)
+
+
+def seed(path: str, rows: list, users: int):
+    import compression
+
+    conn = sqlite3.connect(path)
+    conn.executemany("INSERT INTO users (id, email, password) VALUES (?, ?, 'x')",
+                     [(n + 1, f"member.{n:06d}@lifecoach-example.com") for n in range(users)])
+    conn.executemany(
+        "INSERT INTO chat_history (user_email, user_id, message, response, feature, created_at) "
+        "VALUES (?, ?, ?, ?, 'chat', ?)",
+        [(f"member.{n:06d}@lifecoach-example.com", n + 1, compression.compress(message),
+          compression.compress(response), created_at) for n, message, response, created_at in rows],
+    )
+    conn.commit()
+    conn.close()
+
+
+async def read_latency(url: str, users: int, queries: int) -> float:
+    from sqlalchemy.ext.asyncio import create_async_engine
+    from chat import history_query
+    from database import ChatHistory
+
+    db_engine = create_async_engine(url)
+    timings = []
+    async with db_engine.connect() as conn:
+        for _ in range(queries):
+            n = random.randrange(users)
+            start = time.perf_counter()
+            result = await conn.execute(history_query([ChatHistory.__table__],
+                                                      f"member.{n:06d}@lifecoach-example.com", n + 1))
+            result.all()
+            timings.append((time.perf_counter() - start) * 1000)
+    await db_engine.dispose()
+    return statistics.median(timings)
+
+
+async def run(args, tmp: str):
+    import compression
+    from database import db_settings
+    from migrations import upgrade
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    db_settings.user_key = "id"
+    rng = random.Random(0)
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    rows = [(rng.randrange(args.users), message_text(rng), response_text(rng),
+             (start + timedelta(seconds=i * 30)).isoformat(" ")) for i in range(args.rows)]
+
+    modes = {"off": ("OFF", 0), "zlib": ("ZLIB", 0)}
+    if compression.zstandard is not None:
+        modes["zstd"] = ("ZSTD", 0)
+        samples = [response.encode("utf-8") for _, _, response, _ in rows[:args.train_samples]]
+        dictionary = compression.zstandard.train_dictionary(args.dictionary_size, samples)
+        compression.add_dictionary(1, dictionary.as_bytes())
+        modes["zstd+dict"] = ("ZSTD", 1)
+
+    print(f"{'mode':<10}{'MB':>9}{'ratio':>8}{'p50 ms':>9}  (history of one user, ~{args.rows // args.users} rows)")
+    baseline = None
+    for name, (algorithm, dictionary_id) in modes.items():
+        db_settings.compression, db_settings.compression_dictionary_id = algorithm, dictionary_id
+        compression.configure(db_settings)
+        path = os.path.join(tmp, f"{name.replace('+', '_')}.db")
+        url = f"sqlite+aiosqlite:///{path}"
+        db_engine = create_async_engine(url)
+        await upgrade(db_engine)
+        await db_engine.dispose()
+
+        seed(path, rows, args.users)
+        size = used_bytes(path)
+        baseline = baseline or size
+        latency = await read_latency(url, args.users, args.queries)
+        print(f"{name:<10}{size / 1e6:>9.1f}{baseline / size:>7.1f}x{latency:>9.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare chat history storage size and read latency per compression mode")
+    parser.add_argument("--rows", type=int, default=50_000)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--train-samples", type=int, default=2000)
+    parser.add_argument("--dictionary-size", type=int, default=112_640)
+    args = parser.parse_args()
+
+    random.seed(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ.update(DB_ECHO="0", DATABASE_URL=f"sqlite+aiosqlite:///{tmp}/bench.db")
+        sys.path.append(BACKEND_DIR)
+        asyncio.run(run(args, tmp))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Request throughput with and without SQL echo
+Runs the same authenticated list requests against the app in two child
+processes, one with DB_ECHO=1 and one with DB_ECHO=0, and compares requests/s.
+
+    python benchmarks/bench_echo.py --requests 2000 --concurrency 20
+"""
+import argparse
+import asyncio
+import json
+import subprocess
+import sys
+import os
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULT_MARKER = "BENCH_RESULT "
+
+
+async def run_child(requests: int, concurrency: int):
+    sys.path.append(BACKEND_DIR)
+    import httpx
+    import main
+    from database import engine
+    from migrations import upgrade
+
+    await upgrade()
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        r = await client.post("/auth/register", json={"email": "bench@example.com", "password": "bench"})
+        headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+        for i in range(20):
+            await client.post("/journal/entries", json={"title": f"t{i}", "content": "x" * 200}, headers=headers)
+
+        remaining = requests
+
+        async def worker():
+            nonlocal remaining
+            while remaining > 0:
+                remaining -= 1
+                await client.get("/journal/entries", headers=headers)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    await engine.dispose()
+    print(RESULT_MARKER + json.dumps({"requests_per_second": requests / elapsed}), flush=True)
+
+
+def run_variant(echo: bool, requests: int, concurrency: int) -> float:
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(
+            os.environ,
+            DB_ECHO="1" if echo else "0",
+            DATABASE_URL=f"sqlite+aiosqlite:///{tmp}/bench.db",
+            JWT_SECRET_KEY="bench-secret",
+            JWT_ALGORITHM="HS256",
+            GEMINI_API_KEY="",
+        )
+        proc = subprocess.run(
+            [sys.executable, __file__, "--child", "--requests", str(requests), "--concurrency", str(concurrency)],
+            env=env, cwd=tmp, capture_output=True, text=True, check=True,
+        )
+    for line in proc.stdout.splitlines():
+        if line.startswith(RESULT_MARKER):
+            return json.loads(line[len(RESULT_MARKER):])["requests_per_second"]
+    raise RuntimeError(f"Benchmark child produced no result:\n{proc.stderr[-2000:]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare request throughput with SQL echo on and off")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        asyncio.run(run_child(args.requests, args.concurrency))
+        return
+
+    with_echo = run_variant(True, args.requests, args.concurrency)
+    without_echo = run_variant(False, args.requests, args.concurrency)
+    print(f"GET /journal/entries x{args.requests}, concurrency {args.concurrency}")
+    print(f"echo on : {with_echo:8.1f} req/s")
+    print(f"echo off: {without_echo:8.1f} req/s  ({without_echo / with_echo:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+JWT sign/verify benchmark for LifeCoach AI
+Compares the current HS256 shared-secret tokens with the asymmetric
+algorithms supported by the key ring (ES256, RS256).
+
+    python benchmarks/bench_jwt.py --iterations 5000
+
+EdDSA is not included: python-jose does not implement it.
+"""
+import argparse
+import secrets
+import sys
+import os
+import time
+from datetime import datetime, timedelta
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from jose import jwk, jwt
+
+from jwt_keys import generate_private_pem, public_jwk
+
+
+def bench(fn, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    elapsed = time.perf_counter() - start
+    return iterations / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark JWT signing algorithms")
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    claims = {"sub": "bench@example.com", "exp": datetime.utcnow() + timedelta(minutes=5)}
+    secret = secrets.token_urlsafe(32)
+    keys = {"HS256": (secret, secret)}
+    for alg in ("ES256", "RS256"):
+        pem = generate_private_pem(alg)
+        public = public_jwk(pem, alg, kid="bench")
+        keys[alg] = (jwk.construct(pem, alg), jwk.construct(public, alg))
+
+    print(f"{'alg':<8}{'sign/s':>12}{'verify/s':>12}{'verify us':>12}{'token bytes':>13}")
+    for alg, (signing_key, verification_key) in keys.items():
+        token = jwt.encode(claims, signing_key, algorithm=alg)
+        sign_rate = bench(lambda: jwt.encode(claims, signing_key, algorithm=alg), args.iterations)
+        verify_rate = bench(lambda: jwt.decode(token, verification_key, algorithms=[alg]), args.iterations)
+        print(f"{alg:<8}{sign_rate:>12.0f}{verify_rate:>12.0f}{1e6 / verify_rate:>12.1f}{len(token):>13}")
+
+
+if __name__ == "__main__":
+    main()
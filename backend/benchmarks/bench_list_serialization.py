@@ -0,0 +1,119 @@
+"""
+List endpoint cost: ORM hydration vs column projection
+Seeds one user with 1k, 10k and 100k journal entries in a temporary SQLite
+database (schema from migrations.py) and times building the GET
+/journal/entries response body three ways:
+
+    orm          select(JournalEntry), per-row dicts and .isoformat(), then
+                 jsonable_encoder + JSONResponse (the previous handler)
+    core+json    entries_query() column projection, FastJSONResponse with the
+                 standard library encoder
+    core+orjson  the same with orjson (skipped if it is not installed)
+
+    python benchmarks/bench_list_serialization.py --sizes 1000 10000 100000 --repeat 5
+"""
+import argparse
+import asyncio
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def seed(path: str, user_id: int, rows: int):
+    conn = sqlite3.connect(path)
+    email = f"member.{user_id:06d}@lifecoach-example.com"
+    conn.execute("INSERT INTO users (id, email, password) VALUES (?, ?, 'x')", (user_id, email))
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    content = "Bugün kendimi daha iyi hissettim. " * 12
+    conn.executemany(
+        "INSERT INTO journal_entries (user_email, user_id, title, content, created_at, updated_at) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        [(email, user_id, f"Entry {i}", content, (start + timedelta(minutes=i)).isoformat(" "),
+          (start + timedelta(minutes=i, seconds=30)).isoformat(" ")) for i in range(rows)],
+    )
+    conn.commit()
+    conn.close()
+    return email
+
+
+async def time_paths(email: str, user_id: int, repeat: int) -> dict:
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+    from sqlalchemy.future import select
+    import fast_json
+    from database import async_session, JournalEntry
+    from journal import entries_query
+
+    async def orm():
+        async with async_session() as session:
+            result = await session.execute(
+                select(JournalEntry).where(JournalEntry.user_id == user_id)
+                .order_by(JournalEntry.created_at.desc(), JournalEntry.id.desc())
+            )
+            entries = result.scalars().all()
+            body = [{"id": e.id, "title": e.title, "content": e.content, "created_at": e.created_at.isoformat(),
+                     "updated_at": e.updated_at.isoformat() if e.updated_at else None} for e in entries]
+            return JSONResponse(jsonable_encoder(body)).body
+
+    async def core():
+        async with async_session() as session:
+            result = await session.execute(entries_query(email, user_id))
+            return fast_json.FastJSONResponse(fast_json.rows_as_dicts(result)).body
+
+    orjson = fast_json.orjson
+    paths = {"orm": (orm, None), "core+json": (core, None)}
+    if orjson is not None:
+        paths["core+orjson"] = (core, orjson)
+
+    results = {}
+    for name, (build, encoder) in paths.items():
+        fast_json.orjson = encoder
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            body = await build()
+            timings.append((time.perf_counter() - start) * 1000)
+        results[name] = (statistics.median(timings), len(body))
+    fast_json.orjson = orjson
+    return results
+
+
+async def run(args):
+    from migrations import upgrade
+    from database import engine, db_settings
+
+    db_settings.user_key = "id"
+    await upgrade()
+    await engine.dispose()
+    path = engine.url.database
+
+    print(f"{'rows':>8}  {'path':<12}{'median ms':>11}{'KB':>9}{'speedup':>9}")
+    for n, rows in enumerate(args.sizes, start=1):
+        email = seed(path, n, rows)
+        results = await time_paths(email, n, args.repeat)
+        baseline = results["orm"][0]
+        for name, (ms, size) in results.items():
+            print(f"{rows:>8}  {name:<12}{ms:>11.1f}{size / 1024:>9.0f}{baseline / ms:>8.1f}x")
+    await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time ORM vs column-projected list responses")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ.update(DB_ECHO="0", DATABASE_URL=f"sqlite+aiosqlite:///{tmp}/bench.db")
+        sys.path.append(BACKEND_DIR)
+        asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+List reads with and without the query result cache
+Runs the frontend's tab-switch pattern (GET /journal/entries, then GET /goals)
+against the app in two child processes, one with DB_QUERY_CACHE_MB=0 and one
+with the cache on. Every --write-every requests one journal entry is added,
+which invalidates that user's cached journal list. Prints requests/s, p50 and
+p99 latency, and the cache's hit ratio.
+
+    python benchmarks/bench_query_cache.py --requests 4000 --entries 200 --write-every 50
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import subprocess
+import sys
+import os
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULT_MARKER = "BENCH_RESULT "
+
+
+async def run_child(args):
+    sys.path.append(BACKEND_DIR)
+    import httpx
+    import main
+    import query_cache
+    from database import engine
+    from migrations import upgrade
+
+    await upgrade()
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        r = await client.post("/auth/register", json={"email": "bench@example.com", "password": "bench"})
+        headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+        for i in range(args.entries):
+            await client.post("/journal/entries", json={"title": f"t{i}", "content": "Bugün iyi geçti. " * 20}, headers=headers)
+            await client.post("/goals", json={"title": f"g{i}", "description": "Her gün yürü"}, headers=headers)
+
+        latencies = []
+        start = time.perf_counter()
+        for n in range(args.requests):
+            if args.write_every and n % args.write_every == args.write_every - 1:
+                await client.post("/journal/entries", json={"title": "yeni", "content": "Kısa not"}, headers=headers)
+            began = time.perf_counter()
+            await client.get("/journal/entries" if n % 2 == 0 else "/goals", headers=headers)
+            latencies.append((time.perf_counter() - began) * 1000)
+        elapsed = time.perf_counter() - start
+    await engine.dispose()
+    latencies.sort()
+    hits, misses = query_cache.counters["hits"], query_cache.counters["misses"]
+    print(RESULT_MARKER + json.dumps({
+        "requests_per_second": args.requests / elapsed, "p50": statistics.median(latencies),
+        "p99": latencies[int(len(latencies) * 0.99)], "hit_ratio": hits / (hits + misses) if hits + misses else None,
+    }), flush=True)
+
+
+def run_variant(cache_mb: int, args) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(
+            os.environ,
+            DB_ECHO="0",
+            DB_QUERY_CACHE_MB=str(cache_mb),
+            DATABASE_URL=f"sqlite+aiosqlite:///{tmp}/bench.db",
+            JWT_SECRET_KEY="bench-secret",
+            JWT_ALGORITHM="HS256",
+            GEMINI_API_KEY="",
+        )
+        proc = subprocess.run(
+            [sys.executable, __file__, "--child", "--requests", str(args.requests), "--entries", str(args.entries),
+             "--write-every", str(args.write_every)],
+            env=env, cwd=tmp, capture_output=True, text=True, check=True,
+        )
+    for line in proc.stdout.splitlines():
+        if line.startswith(RESULT_MARKER):
+            return json.loads(line[len(RESULT_MARKER):])
+    raise RuntimeError(f"Benchmark child produced no result:\n{proc.stderr[-2000:]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare list read latency with the query result cache on and off")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--entries", type=int, default=100, help="journal entries and goals seeded")
+    parser.add_argument("--write-every", type=int, default=50, help="requests between journal writes, 0 for none")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        asyncio.run(run_child(args))
+        return
+
+    print(f"{'cache':<8}{'req/s':>8}{'p50 ms':>9}{'p99 ms':>9}{'hit ratio':>11}")
+    for name, cache_mb in (("off", 0), ("64 MB", 64)):
+        result = run_variant(cache_mb, args)
+        hit_ratio = f"{result['hit_ratio']:.2f}" if result["hit_ratio"] is not None else "-"
+        print(f"{name:<8}{result['requests_per_second']:>8.0f}{result['p50']:>9.2f}{result['p99']:>9.2f}{hit_ratio:>11}")
+
+
+if __name__ == "__main__":
+    main()
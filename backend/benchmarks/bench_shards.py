@@ -0,0 +1,92 @@
+"""
+Write throughput vs. shard count
+Runs the journal write path (insert an entry and bump user_stats, one
+transaction each) from --workers concurrent tasks for users spread over
+--users ids, against 1, 2, 4 and 8 SQLite shard files in a temporary
+directory, and prints commits/s for each layout.
+
+    python benchmarks/bench_shards.py --writes 4000 --workers 32
+    python benchmarks/bench_shards.py --synchronous FULL   # fsync every commit
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+async def measure(directory: str, shard_count: int, args) -> dict:
+    from database import JournalEntry
+    from shards import ShardEngines, jump_hash
+    from stats import update_stats
+
+    engines = ShardEngines(directory, max_open=shard_count)
+    for index in range(shard_count):
+        async with engines.use(index):
+            pass
+
+    latencies = []
+
+    async def worker(writes: int):
+        for _ in range(writes):
+            user_id = random.randint(1, args.users)
+            email = f"member.{user_id:06d}@lifecoach-example.com"
+            start = time.perf_counter()
+            async with engines.use(jump_hash(user_id, shard_count)) as (_, sessionmaker), sessionmaker() as session:
+                now = datetime.now(timezone.utc)
+                session.add(JournalEntry(user_email=email, user_id=user_id, title="Bugün",
+                                         content="Kendimi iyi hissettim. " * 20, created_at=now, updated_at=now))
+                await update_stats(session, email, user_id, journal=1, journal_created_at=now)
+                await session.commit()
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    per_worker = args.writes // args.workers
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(per_worker) for _ in range(args.workers)))
+    elapsed = time.perf_counter() - start
+    await engines.dispose()
+
+    latencies.sort()
+    return {"commits_per_s": len(latencies) / elapsed, "p50": statistics.median(latencies),
+            "p95": latencies[int(len(latencies) * 0.95)]}
+
+
+async def run(args, tmp: str):
+    print(f"{'shards':>7}{'commits/s':>12}{'p50 ms':>10}{'p95 ms':>10}{'scaling':>9}")
+    baseline = None
+    for shard_count in args.shards:
+        result = await measure(os.path.join(tmp, f"layout_{shard_count}"), shard_count, args)
+        baseline = baseline or result["commits_per_s"]
+        print(f"{shard_count:>7}{result['commits_per_s']:>12.0f}{result['p50']:>10.2f}{result['p95']:>10.2f}"
+              f"{result['commits_per_s'] / baseline:>8.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure write throughput across SQLite shard counts")
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--writes", type=int, default=4000)
+    parser.add_argument("--workers", type=int, default=32)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--synchronous", default="NORMAL", choices=["OFF", "NORMAL", "FULL"])
+    args = parser.parse_args()
+
+    random.seed(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ.update(DB_ECHO="0", DATABASE_URL=f"sqlite+aiosqlite:///{tmp}/bench.db",
+                          DB_SQLITE_SYNCHRONOUS=args.synchronous,
+                          # SQLite's busy handler is not fair; a single file with many
+                          # waiting writers starves some of them past the 5 s default
+                          DB_SQLITE_BUSY_TIMEOUT_MS="60000",
+                          DB_POOL_SIZE=str(args.workers), DB_MAX_OVERFLOW="0")
+        sys.path.append(BACKEND_DIR)
+        asyncio.run(run(args, tmp))
+
+
+if __name__ == "__main__":
+    main()
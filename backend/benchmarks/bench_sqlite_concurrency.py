@@ -0,0 +1,129 @@
+"""
+SQLite read latency under concurrent writes: rollback journal vs WAL
+Each variant runs in a child process with DB_SQLITE_JOURNAL_MODE set, starts
+writer tasks committing chat history rows and reader tasks listing journal
+entries, and reports read latency percentiles, write throughput and
+"database is locked" errors.
+
+    python benchmarks/bench_sqlite_concurrency.py --seconds 10 --writers 4 --readers 8
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import subprocess
+import sys
+import os
+import tempfile
+import time
+from datetime import datetime, timezone
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULT_MARKER = "BENCH_RESULT "
+
+
+async def run_child(seconds: float, writers: int, readers: int):
+    sys.path.append(BACKEND_DIR)
+    from sqlalchemy.future import select
+    from database import engine, async_session, Base, ChatHistory, JournalEntry
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with async_session() as session:
+        now = datetime.now(timezone.utc)
+        session.add_all(
+            JournalEntry(user_email="reader@example.com", title=f"t{i}", content="x" * 500,
+                         created_at=now, updated_at=now)
+            for i in range(50)
+        )
+        await session.commit()
+
+    deadline = time.perf_counter() + seconds
+    read_latencies = []
+    stats = {"writes": 0, "locked_errors": 0}
+
+    async def writer(n: int):
+        while time.perf_counter() < deadline:
+            try:
+                async with async_session() as session:
+                    session.add(ChatHistory(user_email=f"writer{n}@example.com", message="m" * 200,
+                                            response="r" * 1000, created_at=datetime.now(timezone.utc)))
+                    await session.commit()
+                stats["writes"] += 1
+            except Exception as e:
+                if "locked" in str(e):
+                    stats["locked_errors"] += 1
+                else:
+                    raise
+
+    async def reader():
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                async with async_session() as session:
+                    result = await session.execute(
+                        select(JournalEntry).where(JournalEntry.user_email == "reader@example.com")
+                    )
+                    result.scalars().all()
+                read_latencies.append((time.perf_counter() - start) * 1000)
+            except Exception as e:
+                if "locked" in str(e):
+                    stats["locked_errors"] += 1
+                else:
+                    raise
+
+    await asyncio.gather(*[writer(n) for n in range(writers)], *[reader() for _ in range(readers)])
+    await engine.dispose()
+
+    read_latencies.sort()
+    print(RESULT_MARKER + json.dumps({
+        "reads": len(read_latencies),
+        "read_p50_ms": statistics.median(read_latencies) if read_latencies else 0,
+        "read_p99_ms": read_latencies[int(len(read_latencies) * 0.99) - 1] if read_latencies else 0,
+        "writes_per_second": stats["writes"] / seconds,
+        "locked_errors": stats["locked_errors"],
+    }), flush=True)
+
+
+def run_variant(journal_mode: str, args) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(
+            os.environ,
+            DB_ECHO="0",
+            DB_SQLITE_JOURNAL_MODE=journal_mode,
+            DB_POOL_SIZE=str(args.writers + args.readers),
+            DATABASE_URL=f"sqlite+aiosqlite:///{tmp}/bench.db",
+        )
+        proc = subprocess.run(
+            [sys.executable, __file__, "--child", "--seconds", str(args.seconds),
+             "--writers", str(args.writers), "--readers", str(args.readers)],
+            env=env, cwd=tmp, capture_output=True, text=True, check=True,
+        )
+    for line in proc.stdout.splitlines():
+        if line.startswith(RESULT_MARKER):
+            return json.loads(line[len(RESULT_MARKER):])
+    raise RuntimeError(f"Benchmark child produced no result:\n{proc.stderr[-2000:]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare SQLite journal modes under concurrent reads and writes")
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        asyncio.run(run_child(args.seconds, args.writers, args.readers))
+        return
+
+    print(f"{args.writers} writers, {args.readers} readers, {args.seconds}s per mode")
+    print(f"{'mode':<8}{'reads':>8}{'read p50 ms':>13}{'read p99 ms':>13}{'writes/s':>10}{'locked':>8}")
+    for mode in ("DELETE", "WAL"):
+        r = run_variant(mode, args)
+        print(f"{mode:<8}{r['reads']:>8}{r['read_p50_ms']:>13.2f}{r['read_p99_ms']:>13.2f}"
+              f"{r['writes_per_second']:>10.1f}{r['locked_errors']:>8}")
+
+
+if __name__ == "__main__":
+    main()
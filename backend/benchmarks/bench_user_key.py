@@ -0,0 +1,130 @@
+"""
+user_email vs user_id: index size and per-user query latency
+Seeds a temporary SQLite database (schema from migrations.py) with --rows chat
+history rows spread over --users users, then reports the on-disk size of the
+email and integer-id indexes and the latency of the /chat/history query
+filtered each way.
+
+    python benchmarks/bench_user_key.py --rows 1000000 --users 10000 --queries 2000
+"""
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The index that serves the list query for each key
+INDEXES = {
+    "email": "ix_chat_history_user_email_created_at_id",
+    "id": "ix_chat_history_user_id_created_at_id",
+}
+
+
+def seed(path: str, rows: int, users: int):
+    conn = sqlite3.connect(path)
+    emails = [f"member.{n:06d}@lifecoach-example.com" for n in range(users)]
+    conn.executemany("INSERT INTO users (id, email, password) VALUES (?, ?, 'x')",
+                     [(n + 1, email) for n, email in enumerate(emails)])
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    batch = []
+    for i in range(rows):
+        n = random.randrange(users)
+        batch.append((emails[n], n + 1, "message", "response", "chat",
+                      (start + timedelta(seconds=i * 30)).isoformat(" ")))
+        if len(batch) == 50_000:
+            conn.executemany("INSERT INTO chat_history (user_email, user_id, message, response, feature, created_at) "
+                             "VALUES (?, ?, ?, ?, ?, ?)", batch)
+            batch.clear()
+    if batch:
+        conn.executemany("INSERT INTO chat_history (user_email, user_id, message, response, feature, created_at) "
+                         "VALUES (?, ?, ?, ?, ?, ?)", batch)
+    conn.commit()
+    conn.execute("ANALYZE")
+    conn.close()
+    return emails
+
+
+def index_sizes(path: str) -> dict | None:
+    conn = sqlite3.connect(path)
+    try:
+        sizes = dict(conn.execute("SELECT name, SUM(pgsize) FROM dbstat GROUP BY name").fetchall())
+    except sqlite3.OperationalError:
+        return None  # SQLite built without the dbstat virtual table
+    finally:
+        conn.close()
+    return {key: sizes.get(name, 0) for key, name in INDEXES.items()}
+
+
+async def measure(emails: list[str], queries: int) -> dict:
+    from sqlalchemy.future import select
+    from database import engine, async_session, ChatHistory
+
+    picks = [random.randrange(len(emails)) for _ in range(queries)]
+    filters = {
+        "email": lambda n: ChatHistory.user_email == emails[n],
+        "id": lambda n: ChatHistory.user_id == n + 1,
+    }
+    results = {}
+    for key, make_filter in filters.items():
+        timings = []
+        async with async_session() as session:
+            for n in picks:
+                start = time.perf_counter()
+                result = await session.execute(
+                    select(ChatHistory).where(make_filter(n)).order_by(ChatHistory.created_at, ChatHistory.id)
+                )
+                result.scalars().all()
+                session.expunge_all()
+                timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        results[key] = {"mean": statistics.mean(timings), "p50": timings[len(timings) // 2],
+                        "p95": timings[int(len(timings) * 0.95)]}
+    await engine.dispose()
+    return results
+
+
+async def run(args):
+    from migrations import upgrade
+    from database import engine
+
+    await upgrade()
+    await engine.dispose()
+    path = engine.url.database
+
+    start = time.perf_counter()
+    emails = seed(path, args.rows, args.users)
+    print(f"Seeded {args.rows} rows for {args.users} users in {time.perf_counter() - start:.1f}s")
+
+    sizes = index_sizes(path)
+    latencies = await measure(emails, args.queries)
+
+    print(f"{'key':<8}{'index MB':>10}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}")
+    for key in ("email", "id"):
+        size = f"{sizes[key] / 1e6:>10.1f}" if sizes else f"{'n/a':>10}"
+        lat = latencies[key]
+        print(f"{key:<8}{size}{lat['mean']:>10.3f}{lat['p50']:>10.3f}{lat['p95']:>10.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-user queries keyed by email and by integer user_id")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--queries", type=int, default=2000)
+    args = parser.parse_args()
+
+    random.seed(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ.update(DB_ECHO="0", DATABASE_URL=f"sqlite+aiosqlite:///{tmp}/bench.db")
+        sys.path.append(BACKEND_DIR)
+        asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
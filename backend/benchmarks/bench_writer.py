@@ -0,0 +1,103 @@
+"""
+Write throughput: independent commits vs the single writer with group commit
+Each variant runs in a child process: --tasks concurrent coroutines each
+insert --writes chat history rows through submit_write(), once with
+DB_SINGLE_WRITER=0 (one transaction per write) and once with DB_SINGLE_WRITER=1.
+
+    python benchmarks/bench_writer.py --tasks 50 --writes 40 --synchronous FULL
+"""
+import argparse
+import asyncio
+import json
+import subprocess
+import sys
+import os
+import tempfile
+import time
+from datetime import datetime, timezone
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULT_MARKER = "BENCH_RESULT "
+
+
+async def run_child(tasks: int, writes: int):
+    sys.path.append(BACKEND_DIR)
+    from database import engine, Base, ChatHistory
+    from writer import submit_write, write_queue
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    if write_queue is not None:
+        write_queue.start()
+
+    errors = 0
+
+    async def client(n: int):
+        nonlocal errors
+        for i in range(writes):
+            async def add_chat(session):
+                session.add(ChatHistory(user_email=f"user{n}@example.com", message=f"message {i}",
+                                        response="r" * 500, created_at=datetime.now(timezone.utc)))
+            try:
+                await submit_write(add_chat)
+            except Exception:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(n) for n in range(tasks)))
+    elapsed = time.perf_counter() - start
+
+    transactions = None
+    if write_queue is not None:
+        await write_queue.stop()
+        transactions = write_queue.transactions
+    await engine.dispose()
+    print(RESULT_MARKER + json.dumps({
+        "writes_per_second": (tasks * writes - errors) / elapsed,
+        "errors": errors,
+        "transactions": transactions if transactions is not None else tasks * writes - errors,
+    }), flush=True)
+
+
+def run_variant(single_writer: bool, args) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(
+            os.environ,
+            DB_ECHO="0",
+            DB_SINGLE_WRITER="1" if single_writer else "0",
+            DB_SQLITE_SYNCHRONOUS=args.synchronous,
+            DB_POOL_SIZE=str(min(args.tasks, 20)),
+            DATABASE_URL=f"sqlite+aiosqlite:///{tmp}/bench.db",
+        )
+        proc = subprocess.run(
+            [sys.executable, __file__, "--child", "--tasks", str(args.tasks), "--writes", str(args.writes)],
+            env=env, cwd=tmp, capture_output=True, text=True, check=True,
+        )
+    for line in proc.stdout.splitlines():
+        if line.startswith(RESULT_MARKER):
+            return json.loads(line[len(RESULT_MARKER):])
+    raise RuntimeError(f"Benchmark child produced no result:\n{proc.stderr[-2000:]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-request commits with the group-committing single writer")
+    parser.add_argument("--tasks", type=int, default=50)
+    parser.add_argument("--writes", type=int, default=20)
+    parser.add_argument("--synchronous", default="FULL", choices=["OFF", "NORMAL", "FULL"])
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        asyncio.run(run_child(args.tasks, args.writes))
+        return
+
+    print(f"{args.tasks} concurrent tasks x {args.writes} writes, synchronous={args.synchronous}")
+    print(f"{'mode':<16}{'writes/s':>10}{'transactions':>14}{'errors':>8}")
+    for single_writer in (False, True):
+        r = run_variant(single_writer, args)
+        label = "single writer" if single_writer else "per-request"
+        print(f"{label:<16}{r['writes_per_second']:>10.1f}{r['transactions']:>14}{r['errors']:>8}")
+
+
+if __name__ == "__main__":
+    main()
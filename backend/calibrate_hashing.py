@@ -0,0 +1,126 @@
+"""
+Password hashing calibration for LifeCoach AI
+Benchmarks pbkdf2_sha256, bcrypt and argon2 on this host, picks the cost that
+hits the target verify latency and stores it as the hashing policy.
+
+    python calibrate_hashing.py --target-ms 150
+    python calibrate_hashing.py --scheme bcrypt --dry-run
+"""
+import argparse
+import logging
+import math
+import platform
+import statistics
+import sys
+import os
+import time
+from datetime import datetime, timezone
+sys.path.append(os.path.dirname(__file__))
+
+from passlib.registry import get_crypt_handler
+
+from hashing import HASH_POLICY_FILE, save_hash_policy
+
+logging.basicConfig(level=logging.INFO)
+
+# Preferred order when no scheme is forced: memory-hard first
+SCHEME_PREFERENCE = ["argon2", "bcrypt", "pbkdf2_sha256"]
+SAMPLE_PASSWORD = "calibration-Password-123!"
+
+
+def scheme_available(scheme: str) -> bool:
+    handler = get_crypt_handler(scheme)
+    has_backend = getattr(handler, "has_backend", None)
+    return has_backend() if has_backend else True
+
+
+def measure_verify_ms(scheme: str, cost: int, samples: int, memory_cost: int = None) -> float:
+    """Median time of one verify() at the given cost, in milliseconds"""
+    settings = {"rounds": cost}
+    if scheme == "argon2" and memory_cost:
+        settings["memory_cost"] = memory_cost
+    handler = get_crypt_handler(scheme).using(**settings)
+    hashed = handler.hash(SAMPLE_PASSWORD)
+    timings = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        handler.verify(SAMPLE_PASSWORD, hashed)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def estimate_cost(scheme: str, probe_cost: int, probe_ms: float, target_ms: float) -> int:
+    handler = get_crypt_handler(scheme)
+    if scheme == "bcrypt":
+        # bcrypt cost is log2 of the work factor
+        cost = round(probe_cost + math.log2(target_ms / probe_ms))
+    else:
+        cost = probe_cost * target_ms / probe_ms
+        if scheme == "pbkdf2_sha256":
+            cost = round(cost, -3)
+        cost = round(cost)
+    return max(handler.min_rounds, min(handler.max_rounds, int(cost)))
+
+
+def calibrate_scheme(scheme: str, target_ms: float, samples: int, memory_cost: int = None) -> dict:
+    """Probe once, extrapolate, then refine with a second measurement"""
+    probe_cost = {"pbkdf2_sha256": 10000, "bcrypt": 8, "argon2": 2}[scheme]
+    probe_ms = measure_verify_ms(scheme, probe_cost, samples, memory_cost)
+    cost = estimate_cost(scheme, probe_cost, probe_ms, target_ms)
+    measured_ms = measure_verify_ms(scheme, cost, samples, memory_cost)
+    refined = estimate_cost(scheme, cost, measured_ms, target_ms)
+    if refined != cost:
+        cost = refined
+        measured_ms = measure_verify_ms(scheme, cost, samples, memory_cost)
+
+    result = {"scheme": scheme, "cost": cost, "measured_ms": round(measured_ms, 2)}
+    if scheme == "argon2" and memory_cost:
+        result["memory_cost"] = memory_cost
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Calibrate password hashing cost for this host")
+    parser.add_argument("--target-ms", type=float, default=150.0,
+                        help="target verify latency per login in milliseconds")
+    parser.add_argument("--scheme", choices=SCHEME_PREFERENCE,
+                        help="force a scheme instead of the best available one")
+    parser.add_argument("--argon2-memory-kib", type=int, default=65536,
+                        help="argon2 memory_cost in KiB")
+    parser.add_argument("--samples", type=int, default=5)
+    parser.add_argument("--output", default=HASH_POLICY_FILE)
+    parser.add_argument("--dry-run", action="store_true", help="print results without saving")
+    args = parser.parse_args()
+
+    schemes = [args.scheme] if args.scheme else SCHEME_PREFERENCE
+    results = []
+    for scheme in schemes:
+        if not scheme_available(scheme):
+            logging.info(f"{scheme}: no backend installed, skipping")
+            continue
+        memory_cost = args.argon2_memory_kib if scheme == "argon2" else None
+        result = calibrate_scheme(scheme, args.target_ms, args.samples, memory_cost)
+        logging.info(f"{scheme}: cost={result['cost']} verify={result['measured_ms']}ms")
+        results.append(result)
+
+    if not results:
+        logging.error("No usable hashing scheme found")
+        sys.exit(1)
+
+    chosen = results[0]
+    policy = {
+        **chosen,
+        "target_ms": args.target_ms,
+        "host": platform.node(),
+        "calibrated_at": datetime.now(timezone.utc).isoformat(),
+    }
+    if args.dry_run:
+        print(policy)
+        return
+    save_hash_policy(policy, args.output)
+    logging.info(f"Saved {chosen['scheme']} policy to {args.output}; "
+                 f"existing hashes are upgraded on next successful login")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,18 @@
 from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel
-from sqlalchemy.future import select
 import sys
 import os
 sys.path.append(os.path.dirname(__file__))
 
-from auth import get_current_user
-from database import async_session, User, ChatHistory
+from auth import get_current_claims, TokenClaims, ReadDbSession, UserDbSession
+from database import owned_by, owner_id
+from writer import submit_write
+from fast_json import FastJSONResponse, rows_as_dicts
+from stats import update_stats
+import query_cache
+import chat_partitions
 import logging
-from datetime import datetime, timezone, timedelta
+from datetime import datetime, timezone
 import httpx
 from dotenv import load_dotenv
 
@@ -25,78 +29,37 @@ class ChatMessage(BaseModel):
 
 router = APIRouter()
 
-async def get_user_data(email: str):
-    """Get user data from database"""
-    try:
-        async with async_session() as session:
-            result = await session.execute(select(User).where(User.email == email))
-            user = result.scalar_one_or_none()
-            if user:
-                return {
-                    "user_type": "free",
-                    "language": user.language or "tr",
-                    "message_count": user.message_count or 0,
-                    "last_message_date": user.last_message_date
-                }
-        return {"user_type": "free", "language": "tr", "message_count": 0, "last_message_date": None}
-    except Exception as e:
-        logging.error(f"Error getting user data: {str(e)}")
-        return {"user_type": "free", "language": "tr", "message_count": 0, "last_message_date": None}
-
-def check_message_limit(user_data: dict) -> tuple[bool, int]:
-    """Check if user can send message and return remaining messages"""
-    return True, -1  # Unlimited for all users
-
-async def reset_message_count_if_needed(email: str, user_data: dict) -> bool:
-    """Reset message count if cooldown period has passed. Returns True if reset occurred."""
-    last_message_date = user_data.get("last_message_date")
-    if not last_message_date:
-        return False
-
-    try:
-        last_message_time = datetime.fromisoformat(last_message_date.replace('Z', '+00:00'))
-        current_time = datetime.now(timezone.utc)
-        cooldown_period = timedelta(hours=5)
-
-        if current_time - last_message_time >= cooldown_period:
-            # Reset count
-            async with async_session() as session:
-                result = await session.execute(select(User).where(User.email == email))
-                user = result.scalar_one_or_none()
-                if user:
-                    user.message_count = 0
-                    user.last_message_date = None
-                    await session.commit()
-                    user_data["message_count"] = 0
-                    user_data["last_message_date"] = None
-                    return True
-    except Exception as e:
-        logging.error(f"Error resetting message count: {e}")
-
-    return False
-
-async def update_message_count(email: str, user_data: dict):
-    """Update user's message count"""
-    now = datetime.now(timezone.utc).isoformat()
-    new_count = user_data["message_count"] + 1
-
-    try:
-        async with async_session() as session:
-            result = await session.execute(select(User).where(User.email == email))
-            user = result.scalar_one_or_none()
-            if user:
-                user.message_count = new_count
-                user.last_message_date = now
-                await session.commit()
-    except Exception as e:
-        logging.error(f"Error updating message count: {str(e)}")
+HISTORY_COLUMNS = ("message", "response", "created_at")
+
+def history_query(tables: list, email: str, user_id: int | None, since: datetime = None, until: datetime = None):
+    """Oldest first over the given monthly partitions; a backward scan of each
+    one's (key, created_at DESC, id DESC) index"""
+    return chat_partitions.history_select(tables, HISTORY_COLUMNS, lambda c: owned_by(c, email, user_id),
+                                          since, until)
+
+async def save_chat_history(claims: TokenClaims, message: ChatMessage, response_text: str, session):
+    """Store one chat turn"""
+    email = claims.email
+
+    async def add_chat(session):
+        await chat_partitions.add_message(
+            session,
+            user_email=email,
+            user_id=owner_id(email, claims.user_id),
+            message=message.message,
+            response=response_text,
+            feature=message.feature,
+            created_at=datetime.now(timezone.utc)
+        )
+        await update_stats(session, email, claims.user_id, messages=1)
+        query_cache.bump_on_commit(session, email, "chat_history")
+
+    await submit_write(add_chat, email, session)
 
 @router.post("/chat")
-async def chat(message: ChatMessage, current_user: str = Depends(get_current_user)):
+async def chat(message: ChatMessage, user_session: UserDbSession, claims: TokenClaims = Depends(get_current_claims)):
+    current_user = claims.email
     try:
-        # Get user data
-        user_data = await get_user_data(current_user)
-        
         # Try Ollama local server first (if available). Otherwise use built-in fallbacks.
         msg = message.message.lower()
 
@@ -143,16 +106,7 @@ async def chat(message: ChatMessage, current_user: str = Depends(get_current_use
                     response_payload = {"text": ai_response, "source": "gemini", "model": "gemini-1.5-pro"}
 
                     # Save history and return
-                    async with async_session() as session:
-                        new_chat = ChatHistory(
-                            user_email=current_user,
-                            message=message.message,
-                            response=response_payload["text"],
-                            feature=message.feature,
-                            created_at=datetime.now(timezone.utc)
-                        )
-                        session.add(new_chat)
-                        await session.commit()
+                    await save_chat_history(claims, message, response_payload["text"], user_session)
 
                     return {"response": response_payload, "remaining_messages": -1}
         except Exception:
@@ -193,16 +147,7 @@ async def chat(message: ChatMessage, current_user: str = Depends(get_current_use
         }
 
         # Save chat history
-        async with async_session() as session:
-            new_chat = ChatHistory(
-                user_email=current_user,
-                message=message.message,
-                response=response_payload["text"],
-                feature=message.feature,
-                created_at=datetime.now(timezone.utc)
-            )
-            session.add(new_chat)
-            await session.commit()
+        await save_chat_history(claims, message, response_payload["text"], user_session)
 
         return {
             "response": response_payload,
@@ -213,15 +158,24 @@ async def chat(message: ChatMessage, current_user: str = Depends(get_current_use
         logging.error(f"Chat error: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
-@router.get("/chat/history")
-async def get_chat_history(current_user: str = Depends(get_current_user)):
+@router.get("/chat/history", response_class=FastJSONResponse)
+async def get_chat_history(session: ReadDbSession, since: datetime | None = None, until: datetime | None = None,
+                           claims: TokenClaims = Depends(get_current_claims)):
+    """Chat turns oldest first; since/until (ISO 8601, UTC if no offset) limit
+    the range and with it the monthly partitions that are read"""
+    current_user = claims.email
+    since = chat_partitions.as_utc(since) if since else None
+    until = chat_partitions.as_utc(until) if until else None
     try:
-        async with async_session() as session:
-            result = await session.execute(
-                select(ChatHistory).where(ChatHistory.user_email == current_user).order_by(ChatHistory.created_at)
-            )
-            chats = result.scalars().all()
-            return [{"message": c.message, "response": c.response, "created_at": c.created_at.isoformat()} for c in chats]
+        async def fetch():
+            tables = await chat_partitions.partitions(session, since, until)
+            result = await session.execute(history_query(tables, current_user, claims.user_id, since, until))
+            return rows_as_dicts(result, HISTORY_COLUMNS)
+
+        # The retention window moves at month boundaries, and with it the rows that are served
+        oldest = chat_partitions.oldest_kept_month(datetime.now(timezone.utc))
+        return await query_cache.cached_json(current_user, "chat_history", ("chat_history",), fetch,
+                                             (since, until, oldest))
     except Exception as e:
         logging.error(f"History error: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal server error")
\ No newline at end of file
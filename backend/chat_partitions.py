@@ -0,0 +1,252 @@
+"""
+Monthly chat history partitions for LifeCoach AI
+Chat turns are stored in one table per calendar month (UTC),
+chat_history_YYYY_MM, with the columns and indexes of ChatHistory. Writes go
+to the partition of the row's created_at, creating it on first use; reads
+name only the partitions that overlap the requested time range, so a query
+on recent conversations never touches older months. Retention drops whole
+partitions instead of deleting rows:
+
+    DB_CHAT_RETENTION_MONTHS=12   # keep the current month and the 12 before it
+
+Partitions older than that are skipped by reads at once and dropped by the
+purger's next pass (purger.py). The plain chat_history table only holds rows
+written before partitioning until migration 10 moves them.
+
+Which months exist is cached per database (primary, shards, replicas). The
+current and next month are created ahead of time at startup and on every
+purge pass, so user transactions rarely create a table; when another worker
+has created the current month first, the next read notices and refreshes.
+"""
+import re
+from datetime import date, datetime, timezone
+
+from sqlalchemy import inspect, insert, literal, select, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from sqlalchemy.schema import CreateIndex, CreateTable, DropTable
+
+from database import db_settings, Base, ChatHistory
+
+PREFIX = "chat_history_"
+_NAME = re.compile(r"^chat_history_(\d{4})_(\d{2})$")
+# Arbitrary application-wide key for pg_advisory_xact_lock
+PARTITION_LOCK_ID = 0x4C434350
+
+# database URL -> months that have a partition there
+_months: dict[str, set[date]] = {}
+
+
+def month_of(moment: datetime) -> date:
+    return date(moment.year, moment.month, 1)
+
+
+def add_months(month: date, count: int) -> date:
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{PREFIX}{month:%Y_%m}"
+
+
+def partition_table(month: date):
+    """Table object for one month, same columns and indexes as ChatHistory"""
+    name = partition_name(month)
+    table = Base.metadata.tables.get(name)
+    if table is None:
+        table = ChatHistory.__table__.to_metadata(Base.metadata, name=name)
+        for index in table.indexes:
+            index.name = index.name.replace(ChatHistory.__tablename__, name, 1)
+        table.info["month"] = month
+    return table
+
+
+def oldest_kept_month(now: datetime = None) -> date | None:
+    """First month still readable under DB_CHAT_RETENTION_MONTHS (None: keep all)"""
+    if not db_settings.chat_retention_months:
+        return None
+    return add_months(month_of(now or datetime.now(timezone.utc)), -db_settings.chat_retention_months)
+
+
+def as_utc(moment: datetime) -> datetime:
+    """Aware UTC datetime; naive values are taken to be UTC already"""
+    return moment.replace(tzinfo=timezone.utc) if moment.tzinfo is None else moment.astimezone(timezone.utc)
+
+
+def _month_start(month: date) -> datetime:
+    return datetime(month.year, month.month, 1, tzinfo=timezone.utc)
+
+
+def overlaps(table, start: datetime = None, end: datetime = None) -> bool:
+    """Whether a partition can hold rows with start <= created_at < end"""
+    month = table.info.get("month")
+    if month is None:  # the unpartitioned chat_history table
+        return True
+    return ((start is None or _month_start(add_months(month, 1)) > as_utc(start))
+            and (end is None or _month_start(month) < as_utc(end)))
+
+
+def _connection(sync):
+    return sync.connection() if isinstance(sync, Session) else sync
+
+
+def _url(db) -> str:
+    bind = db.get_bind() if isinstance(db, AsyncSession) else db.engine
+    return str(bind.url)
+
+
+def existing_months(sync) -> set[date]:
+    """Months with a partition, read from the schema (sync connection or session)"""
+    months = set()
+    for name in inspect(_connection(sync)).get_table_names():
+        match = _NAME.match(name)
+        if match:
+            months.add(date(int(match[1]), int(match[2]), 1))
+    return months
+
+
+async def _known_months(db, refresh: bool = False) -> set[date]:
+    key = _url(db)
+    if refresh or key not in _months:
+        _months[key] = await db.run_sync(existing_months)
+    return _months[key]
+
+
+async def partitions(db, start: datetime = None, end: datetime = None) -> list:
+    """Existing partitions overlapping [start, end), oldest first
+
+    db is an AsyncSession or AsyncConnection. Months past the retention
+    window are left out even before the purger drops them.
+    """
+    now = datetime.now(timezone.utc)
+    months = await _known_months(db)
+    if month_of(now) not in months:
+        months = await _known_months(db, refresh=True)
+    oldest = oldest_kept_month(now)
+    tables = [partition_table(month) for month in sorted(months) if oldest is None or month >= oldest]
+    return [table for table in tables if overlaps(table, start, end)]
+
+
+async def all_partitions(db) -> list:
+    """Every partition in the schema, retention ignored (admin tools)"""
+    return [partition_table(month) for month in sorted(await _known_months(db, refresh=True))]
+
+
+def create_partition(sync, month: date):
+    """CREATE TABLE/INDEX IF NOT EXISTS for one month (sync connection or session)"""
+    conn = _connection(sync)
+    table = partition_table(month)
+    if conn.dialect.name == "postgresql":
+        # Concurrent CREATE TABLE IF NOT EXISTS can still collide in pg_class;
+        # the lock makes later creators wait and then find the table
+        conn.exec_driver_sql(f"SELECT pg_advisory_xact_lock({PARTITION_LOCK_ID})")
+    conn.execute(CreateTable(table, if_not_exists=True))
+    for index in table.indexes:
+        conn.execute(CreateIndex(index, if_not_exists=True))
+    return table
+
+
+async def ensure_upcoming(db_engine):
+    """Create this month's and next month's partitions in their own transaction"""
+    this_month = month_of(datetime.now(timezone.utc))
+    upcoming = (this_month, add_months(this_month, 1))
+    async with db_engine.begin() as conn:
+        months = await _known_months(conn, refresh=True)
+        for month in upcoming:
+            if month not in months:
+                await conn.run_sync(create_partition, month)
+    # Only cached once committed
+    months.update(upcoming)
+
+
+async def add_message(session, **values):
+    """INSERT one chat turn into the partition of its created_at"""
+    month = month_of(values["created_at"])
+    if month not in await _known_months(session):
+        # Not cached here: the table only exists if this transaction commits
+        await session.run_sync(create_partition, month)
+    await session.execute(insert(partition_table(month)).values(**values))
+
+
+def history_select(tables: list, columns: tuple, where, start: datetime = None, end: datetime = None):
+    """One SELECT over the given partitions, ordered by created_at then id
+
+    where(table.c) returns one partition's row filter. Rows of different
+    months never interleave, so the order matches the old single table.
+    Over several partitions the rows end with an extra row_id column. The
+    partitions are combined with UNION ALL and the row filter and ORDER BY go
+    on the outside, so each partition is read through its index in order:
+    SQLite pushes the filter down and merges the scans, and PostgreSQL only
+    plans a Merge Append when the filter is on the union rather than in it.
+    """
+    if not tables:
+        return select(*(literal(None).label(name) for name in columns)).where(literal(False))
+
+    def in_range(query, table):
+        if start is not None:
+            query = query.where(table.c.created_at >= start)
+        if end is not None:
+            query = query.where(table.c.created_at < end)
+        return query
+
+    if len(tables) == 1:
+        table = tables[0]
+        query = select(*(table.c[name] for name in columns)).where(where(table.c))
+        return in_range(query, table).order_by(table.c.created_at, table.c.id)
+    combined = union_all(*(
+        in_range(select(*(c for c in table.c if c.name != "id"), table.c.id.label("row_id")), table)
+        for table in tables
+    )).subquery()
+    return (select(*(combined.c[name] for name in columns), combined.c.row_id).where(where(combined.c))
+            .order_by(combined.c.created_at, combined.c.row_id))
+
+
+async def drop_expired(db_engine) -> list[str]:
+    """Drop partitions older than DB_CHAT_RETENTION_MONTHS; returns their names"""
+    oldest = oldest_kept_month()
+    if oldest is None:
+        return []
+    async with db_engine.begin() as conn:
+        months = await _known_months(conn, refresh=True)
+        expired = sorted(month for month in months if month < oldest)
+        for month in expired:
+            await conn.execute(DropTable(partition_table(month), if_exists=True))
+            months.discard(month)
+    return [partition_name(month) for month in expired]
+
+
+def move_legacy_rows(conn, batch_size: int = 5000) -> int:
+    """Move chat_history rows into monthly partitions (migration 10)
+
+    Takes the migration's sync connection; every batch is moved in its own
+    transaction from conn.engine. Rows keep their created_at and order but
+    get new ids. Rows without created_at go to the oldest partition.
+    """
+    legacy = ChatHistory.__table__
+    columns = [c.name for c in legacy.columns if c.name != "id"]
+    fallback = conn.execute(select(legacy.c.created_at).where(legacy.c.created_at.is_not(None))
+                            .order_by(legacy.c.created_at).limit(1)).scalar()
+    fallback = month_of(fallback or datetime.now(timezone.utc))
+    created = set()
+    moved = 0
+    while True:
+        rows = conn.execute(select(legacy.c.id, legacy.c.created_at).order_by(legacy.c.id).limit(batch_size)).all()
+        if not rows:
+            return moved
+        by_month = {}
+        for row_id, created_at in rows:
+            by_month.setdefault(month_of(created_at) if created_at else fallback, []).append(row_id)
+        # SQLite's driver commits DDL outside the transaction, so the
+        # partitions are created first and the move itself is all DML
+        if by_month.keys() - created:
+            with conn.engine.begin() as batch:
+                for month in sorted(by_month.keys() - created):
+                    create_partition(batch, month)
+            created.update(by_month)
+        with conn.engine.begin() as batch:
+            for month, ids in sorted(by_month.items()):
+                source = select(*(legacy.c[name] for name in columns)).where(legacy.c.id.in_(ids)).order_by(legacy.c.id)
+                batch.execute(insert(partition_table(month)).from_select(columns, source))
+            batch.execute(legacy.delete().where(legacy.c.id.in_([row_id for row_id, _ in rows])))
+        moved += len(rows)
@@ -0,0 +1,139 @@
+"""
+Upgrade check from a pre-migrations database
+Builds a scratch SQLite database with the tables as they were before
+migrations.py existed, adds a user with a journal entry, a goal and a chat
+turn, runs every revision up to HEAD and exits with status 1 if the upgrade
+fails or the rows and their user_stats counters did not come through. Run it
+after adding a revision, since each revision has to work against the schema
+of its own time rather than today's models. With --postgres the baseline is
+built in the empty PostgreSQL database at DATABASE_URL instead:
+
+    python check_migrations.py
+    python local_postgres.py -- python check_migrations.py --postgres
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+from datetime import datetime, timezone
+sys.path.append(os.path.dirname(__file__))
+
+# The original models' tables, without any revision applied. {id} and
+# {datetime} stand for the types create_all gave Integer primary keys and
+# DateTime columns on each backend.
+BASELINE_SCHEMA = """
+CREATE TABLE users (
+    id {id}, email VARCHAR, password VARCHAR, is_premium BOOLEAN, language VARCHAR,
+    message_count INTEGER, last_message_date VARCHAR, stripe_customer_id VARCHAR, subscription_id VARCHAR,
+    subscription_status VARCHAR
+);
+CREATE UNIQUE INDEX ix_users_email ON users (email);
+CREATE INDEX ix_users_id ON users (id);
+CREATE TABLE chat_history (
+    id {id}, user_email VARCHAR, message TEXT, response TEXT, feature VARCHAR,
+    created_at {datetime}
+);
+CREATE INDEX ix_chat_history_user_email ON chat_history (user_email);
+CREATE TABLE journal_entries (
+    id {id}, user_email VARCHAR, title VARCHAR, content TEXT,
+    created_at {datetime}, updated_at {datetime}
+);
+CREATE INDEX ix_journal_entries_user_email ON journal_entries (user_email);
+CREATE TABLE goals (
+    id {id}, user_email VARCHAR, title VARCHAR, description TEXT, progress INTEGER,
+    created_at {datetime}, updated_at {datetime}
+);
+CREATE INDEX ix_goals_user_email ON goals (user_email);
+"""
+BASELINE_TYPES = {
+    "sqlite": {"id": "INTEGER NOT NULL PRIMARY KEY", "datetime": "DATETIME"},
+    "postgresql": {"id": "SERIAL PRIMARY KEY", "datetime": "TIMESTAMP WITHOUT TIME ZONE"},
+}
+BASELINE_ROWS = (
+    "INSERT INTO users (email, password, is_premium, language, message_count) "
+    "VALUES (:email, 'x', :no, 'tr', 0)",
+    "INSERT INTO journal_entries (user_email, title, content, created_at, updated_at) "
+    "VALUES (:email, 'Bugün', 'Kendimi iyi hissettim.', :now, :now)",
+    "INSERT INTO goals (user_email, title, description, progress, created_at, updated_at) "
+    "VALUES (:email, 'Yürü', 'Her gün', 100, :now, :now)",
+    "INSERT INTO chat_history (user_email, message, response, feature, created_at) "
+    "VALUES (:email, 'Merhaba', 'Merhaba!', 'chat', :now)",
+)
+
+
+async def build_baseline(db_engine):
+    from sqlalchemy import inspect, text
+
+    values = {"email": "member@lifecoach-example.com", "no": False,
+              "now": datetime.now(timezone.utc).replace(tzinfo=None)}
+    async with db_engine.begin() as conn:
+        if await conn.run_sync(lambda c: inspect(c).get_table_names()):
+            raise RuntimeError(f"{db_engine.url.render_as_string(hide_password=True)} is not empty")
+        schema = BASELINE_SCHEMA.format(**BASELINE_TYPES[conn.dialect.name])
+        for statement in schema.split(";"):
+            if statement.strip():
+                await conn.exec_driver_sql(statement)
+        for statement in BASELINE_ROWS:
+            await conn.execute(text(statement), values)
+
+
+async def upgrade_and_check() -> list[str]:
+    """Problems found after upgrading the baseline database (empty: none)"""
+    from sqlalchemy import select
+    from chat_partitions import partitions
+    from database import engine, Goal, JournalEntry, UserStats
+    from migrations import HEAD, current_version, upgrade
+
+    problems = []
+    try:
+        await build_baseline(engine)
+        await upgrade()
+        version = await current_version()
+        if version != HEAD:
+            problems.append(f"schema is at revision {version}, expected {HEAD}")
+        async with engine.connect() as conn:
+            journal = (await conn.execute(select(JournalEntry.user_id, JournalEntry.deleted_at))).all()
+            goals = (await conn.execute(select(Goal.user_id))).all()
+            chat = 0
+            for table in await partitions(conn):
+                chat += len((await conn.execute(select(table.c.id))).all())
+            stats = (await conn.execute(select(UserStats))).first()
+        if journal != [(1, None)] or goals != [(1,)]:
+            problems.append(f"journal entries {journal} and goals {goals} were not kept with user_id 1")
+        if chat != 1:
+            problems.append(f"{chat} chat turns readable after the upgrade, expected 1")
+        if stats is None or (stats.journal_entries, stats.goals, stats.goals_completed, stats.messages) != (1, 1, 1, 1):
+            problems.append(f"user_stats was not seeded from the existing rows: {stats}")
+    finally:
+        await engine.dispose()
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Upgrade a pre-migrations database to HEAD and check its rows")
+    parser.add_argument("--postgres", action="store_true",
+                        help="use the empty PostgreSQL database at DATABASE_URL (see local_postgres.py)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DB_ECHO"] = "0"
+        if args.postgres:
+            if not os.getenv("DATABASE_URL", "").startswith("postgres"):
+                sys.exit("--postgres needs DATABASE_URL pointing at an empty PostgreSQL database")
+        else:
+            os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(tmp, 'baseline.db')}"
+        try:
+            problems = asyncio.run(upgrade_and_check())
+        except Exception as e:
+            problems = [f"upgrade failed: {e}"]
+
+    for problem in problems:
+        print(f"FAIL  {problem}")
+    if problems:
+        sys.exit(1)
+    print("ok    baseline database upgraded to HEAD")
+
+
+if __name__ == "__main__":
+    main()
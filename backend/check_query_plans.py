@@ -0,0 +1,159 @@
+"""
+EXPLAIN QUERY PLAN check for the hot queries
+Builds a scratch SQLite database from migrations.py (or uses --database),
+runs EXPLAIN QUERY PLAN on the queries the API issues on every request and
+exits with status 1 if any of them scans a table or index end to end or sorts
+through a temporary B-tree. Run it after changing a query or an index:
+
+    python check_query_plans.py
+    python check_query_plans.py --database ./lifecoach.db
+
+With --postgres it builds the schema in the empty PostgreSQL database at
+DATABASE_URL and fails on a Seq Scan or Sort node in EXPLAIN instead. The
+tables are empty there, so sequential scans and sorts are switched off for
+the session: one only shows up when no index can serve the query.
+
+    python local_postgres.py -- python check_query_plans.py --postgres
+"""
+import argparse
+import asyncio
+import os
+import sqlite3
+import sys
+import tempfile
+from datetime import datetime, timezone
+sys.path.append(os.path.dirname(__file__))
+
+
+def hot_queries() -> dict:
+    """Name -> SQLAlchemy statement, for both DB_USER_KEY modes"""
+    from sqlalchemy.future import select
+    from database import db_settings, User, ApiKey, JournalEntry, Goal, UserStats, owned_by
+    from journal import entries_query
+    from goals import goals_query
+    from chat import history_query
+    from chat_partitions import add_months, month_of, partition_table
+
+    email, user_id = "someone@example.com", 1
+    # Startup creates this month's and next month's partitions
+    this_month = month_of(datetime.now(timezone.utc))
+    partitions = [partition_table(this_month), partition_table(add_months(this_month, 1))]
+    queries = {
+        "login user lookup": select(User).where(User.email == email),
+        "api key lookup": (select(ApiKey, User.id, User.language, User.is_premium)
+                           .join(User, User.email == ApiKey.user_email)
+                           .where(ApiKey.prefix == "abc", ApiKey.revoked_at.is_(None))),
+        "stats row (id)": select(UserStats).where(UserStats.user_id == user_id),
+        "purge batch": (select(JournalEntry.id)
+                        .where(JournalEntry.deleted_at.is_not(None), JournalEntry.deleted_at < "2026-01-01")
+                        .limit(500)),
+        "stats row (email)": (select(UserStats).join(User, User.id == UserStats.user_id)
+                              .where(User.email == email)),
+    }
+    configured = db_settings.user_key
+    try:
+        for key in ("email", "id"):
+            db_settings.user_key = key
+            queries[f"journal list ({key})"] = entries_query(email, user_id)
+            queries[f"goals list ({key})"] = goals_query(email, user_id)
+            queries[f"chat history, one month ({key})"] = history_query(partitions[:1], email, user_id)
+            queries[f"chat history, two months ({key})"] = history_query(partitions, email, user_id)
+            queries[f"journal entry by id ({key})"] = select(JournalEntry).where(
+                JournalEntry.id == 1, owned_by(JournalEntry, email, user_id), JournalEntry.deleted_at.is_(None))
+            queries[f"goal by id ({key})"] = select(Goal).where(
+                Goal.id == 1, owned_by(Goal, email, user_id), Goal.deleted_at.is_(None))
+    finally:
+        db_settings.user_key = configured
+    return queries
+
+
+def plan_problems(plan: list[str]) -> list[str]:
+    problems = []
+    for detail in plan:
+        if detail.startswith("SCAN ") and detail != "SCAN CONSTANT ROW":
+            problems.append(detail)
+        elif "USE TEMP B-TREE" in detail:
+            problems.append(detail)
+    return problems
+
+
+def pg_plan_problems(plan: list[str]) -> list[str]:
+    return [node for node in plan if node.startswith(("Seq Scan", "Sort", "Incremental Sort"))]
+
+
+def check(path: str) -> bool:
+    from sqlalchemy.dialects import sqlite
+
+    conn = sqlite3.connect(path)
+    ok = True
+    for name, statement in hot_queries().items():
+        sql = str(statement.compile(dialect=sqlite.dialect(), compile_kwargs={"literal_binds": True}))
+        plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}")]
+        problems = plan_problems(plan)
+        print(f"{'FAIL' if problems else 'ok':<6}{name}: {' | '.join(plan)}")
+        ok = ok and not problems
+    conn.close()
+    return ok
+
+
+async def check_postgres() -> bool:
+    from sqlalchemy.dialects import postgresql
+    from database import engine
+
+    ok = True
+    try:
+        async with engine.connect() as conn:
+            await conn.exec_driver_sql("SET enable_seqscan = off")
+            await conn.exec_driver_sql("SET enable_sort = off")
+            for name, statement in hot_queries().items():
+                sql = str(statement.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+                lines = [row[0] for row in await conn.exec_driver_sql(f"EXPLAIN {sql}")]
+                # Plan nodes only, without their costs
+                plan = [line.split("  (cost=")[0].strip().removeprefix("->").strip()
+                        for line in lines if "(cost=" in line]
+                problems = pg_plan_problems(plan)
+                print(f"{'FAIL' if problems else 'ok':<6}{name}: {' | '.join(plan)}")
+                ok = ok and not problems
+    finally:
+        await engine.dispose()
+    return ok
+
+
+async def build_scratch_database():
+    from migrations import upgrade
+    from database import engine
+    from chat_partitions import ensure_upcoming
+
+    await upgrade()
+    await ensure_upcoming(engine)
+    await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fail if a hot query plan scans a table or sorts in a temp B-tree")
+    parser.add_argument("--database", help="existing SQLite file to check (default: fresh scratch database)")
+    parser.add_argument("--postgres", action="store_true",
+                        help="check the empty PostgreSQL database at DATABASE_URL (see local_postgres.py)")
+    args = parser.parse_args()
+
+    if args.postgres:
+        if not os.getenv("DATABASE_URL", "").startswith("postgres"):
+            sys.exit("--postgres needs DATABASE_URL pointing at an empty PostgreSQL database")
+        os.environ["DB_ECHO"] = "0"
+        asyncio.run(build_scratch_database())
+        ok = asyncio.run(check_postgres())
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = args.database or os.path.join(tmp, "plans.db")
+            os.environ.update(DB_ECHO="0", DATABASE_URL=f"sqlite+aiosqlite:///{path}")
+            if not args.database:
+                asyncio.run(build_scratch_database())
+            ok = check(path)
+
+    if not ok:
+        print("Query plan regression: add or fix an index, or change the query to match one")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Admin commands for compressed chat and journal text (see compression.py)
+
+    python compress_text.py status                 # stored formats and bytes per column
+    python compress_text.py train --samples 5000   # train a zstd dictionary on existing rows
+    python compress_text.py recompress             # compress long values still stored as text
+    python compress_text.py recompress --all       # also rewrite compressed values
+
+Typical switch to a dictionary: run train, set DB_COMPRESSION=zstd and
+DB_COMPRESSION_DICTIONARY_ID to the printed id, restart the API, then run
+recompress --all. With DB_COMPRESSION=off, recompress --all turns every
+value back into plain text. Every command covers DATABASE_URL and, with
+DB_SHARD_COUNT set, every shard.
+"""
+import argparse
+import asyncio
+import logging
+import sys
+import os
+from datetime import datetime, timezone
+sys.path.append(os.path.dirname(__file__))
+
+from sqlalchemy import func, insert, select
+
+import compression
+from compression import COMPRESSED_COLUMNS, recompress_column
+from database import engine, db_settings, load_compression_dictionaries, CompressionDictionary, JournalEntry
+import chat_partitions
+from purger import incremental_vacuum
+from shards import shard_engines, databases
+
+logging.basicConfig(level=logging.INFO)
+
+
+async def compressed_columns(conn) -> list[tuple[str, str]]:
+    """COMPRESSED_COLUMNS plus message/response of every chat history partition"""
+    partitions = await chat_partitions.all_partitions(conn)
+    return list(COMPRESSED_COLUMNS) + [(table.name, column) for table in partitions
+                                       for column in ("message", "response")]
+
+
+async def status():
+    for name, db_engine in [item async for item in databases()]:
+        async with db_engine.connect() as conn:
+            for table, column in await compressed_columns(conn):
+                # Group BLOBs by their header: the marker, plus the dictionary id for "d"
+                rows = await conn.exec_driver_sql(
+                    f"SELECT CASE WHEN typeof({column}) != 'blob' THEN typeof({column}) "
+                    f"WHEN substr({column}, 1, 1) = x'64' THEN substr({column}, 1, 5) "
+                    f"ELSE substr({column}, 1, 1) END, "
+                    f"COUNT(*), SUM(length(CAST({column} AS BLOB))) FROM {table} GROUP BY 1 ORDER BY 1"
+                )
+                for stored, count, size in rows:
+                    stored = compression.stored_format(stored) if isinstance(stored, bytes) else stored
+                    print(f"{name}\t{table}.{column}\t{stored}\t{count} rows\t{size or 0} bytes")
+
+
+async def train(samples: int, size: int) -> int:
+    if compression.zstandard is None:
+        sys.exit("Training needs the zstandard package (pip install zstandard)")
+    texts = []
+    async for _, db_engine in databases():
+        async with db_engine.connect() as conn:
+            # The latest months are the closest to what new rows look like
+            recent = (await chat_partitions.all_partitions(conn))[-3:]
+            columns = [table.c[name] for table in recent for name in ("response", "message")]
+            for column in columns + [JournalEntry.content]:
+                result = await conn.execute(
+                    select(column).where(column.is_not(None)).order_by(func.random()).limit(samples)
+                )
+                texts.extend(value.encode("utf-8") for value in result.scalars())
+    if not texts:
+        sys.exit("No rows to train on")
+
+    try:
+        dictionary = compression.zstandard.train_dictionary(size, texts)
+    except compression.zstandard.ZstdError as e:
+        sys.exit(f"Could not train a dictionary from {len(texts)} values ({e}); more rows are needed")
+    async with engine.begin() as conn:
+        result = await conn.execute(
+            insert(CompressionDictionary)
+            .values(data=dictionary.as_bytes(), samples=len(texts), created_at=datetime.now(timezone.utc))
+            .returning(CompressionDictionary.id)
+        )
+        dictionary_id = result.scalar()
+    logging.info(f"Stored a {len(dictionary.as_bytes())} byte dictionary trained on {len(texts)} values")
+    print(f"Set DB_COMPRESSION=zstd DB_COMPRESSION_DICTIONARY_ID={dictionary_id}, restart, "
+          f"then run: python compress_text.py recompress --all")
+    return dictionary_id
+
+
+async def recompress(rewrite_compressed: bool, batch_size: int):
+    async for name, db_engine in databases():
+        async with db_engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            for table, column in await compressed_columns(conn):
+                totals = await conn.run_sync(recompress_column, table, column, batch_size, rewrite_compressed)
+                logging.info(f"{name} {table}.{column}: {totals['rows']} rows, "
+                             f"{totals['before']} -> {totals['after']} bytes")
+        # Give the freed pages back to the filesystem
+        async with db_engine.connect() as conn:
+            free_pages = (await conn.exec_driver_sql("PRAGMA freelist_count")).scalar()
+        if free_pages:
+            await incremental_vacuum(free_pages, db_engine)
+
+
+async def run_command(args):
+    if not db_settings.is_sqlite:
+        sys.exit("Compression only applies to SQLite; PostgreSQL compresses large values itself")
+    try:
+        await load_compression_dictionaries()
+        if args.command == "status":
+            await status()
+        elif args.command == "train":
+            await train(args.samples, args.size)
+        elif args.command == "recompress":
+            await recompress(args.all, args.batch_size)
+    finally:
+        if shard_engines is not None:
+            await shard_engines.dispose()
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect and rewrite compressed chat and journal text")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("status", help="stored formats and sizes per column")
+    train_parser = commands.add_parser("train", help="train and store a zstd dictionary")
+    train_parser.add_argument("--samples", type=int, default=5000, help="values sampled per column and database")
+    train_parser.add_argument("--size", type=int, default=112_640, help="dictionary size in bytes")
+    recompress_parser = commands.add_parser("recompress", help="compress existing values with the current settings")
+    recompress_parser.add_argument("--all", action="store_true", help="also rewrite values that are already compressed")
+    recompress_parser.add_argument("--batch-size", type=int, default=1000)
+    asyncio.run(run_command(parser.parse_args()))
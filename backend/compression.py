@@ -0,0 +1,190 @@
+"""
+Transparent compression of long text columns for LifeCoach AI
+Gemini responses are long and repeat the same phrasing across users, so
+ChatHistory.message/response and JournalEntry.content use CompressedText:
+on SQLite a value of at least DB_COMPRESSION_MIN_BYTES (UTF-8) is stored as
+a BLOB holding a one-byte format marker and the compressed text, and short
+values stay plain TEXT. Reads decompress only the BLOBs, so old rows and
+rows written with another DB_COMPRESSION keep working. A value is
+decompressed when its column is loaded: queries that do not return the text
+(stats, purging, ownership checks) select narrower columns and never pay for it.
+
+    z  zlib stream
+    s  zstd frame
+    d  4-byte dictionary id (compression_dictionaries.id), then a zstd
+       frame made with that trained dictionary
+
+zstd needs the zstandard package (pip install zstandard). A shared
+dictionary, trained on existing rows with `python compress_text.py train`,
+lets zstd compress even a single short response well. Dictionaries are
+kept in DATABASE_URL and loaded at startup; never delete one that rows
+still use.
+
+PostgreSQL already compresses large text values (TOAST), so there the
+column is plain TEXT. Compressed values cannot be searched or compared in
+SQL (LIKE, =).
+"""
+import struct
+import zlib
+
+from sqlalchemy import Text
+from sqlalchemy.types import TypeDecorator
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+ZLIB, ZSTD, ZSTD_DICT = b"z", b"s", b"d"
+DEFAULT_LEVELS = {"ZLIB": 6, "ZSTD": 3}
+_DICT_ID = struct.Struct(">I")
+
+_settings = None
+# compression_dictionaries.id -> zstandard.ZstdCompressionDict
+_dictionaries: dict = {}
+# Compressor objects are reused; they are only used from the event loop thread
+_compressors: dict = {}
+_decompressors: dict = {}
+
+
+def configure(settings):
+    """Take DB_COMPRESSION* from the validated settings (called by database.py)"""
+    global _settings
+    _settings = settings
+    if settings.compression == "ZSTD" and zstandard is None:
+        raise RuntimeError("DB_COMPRESSION=zstd needs the zstandard package (pip install zstandard)")
+    _compressors.clear()
+
+
+def add_dictionary(dictionary_id: int, data: bytes):
+    if zstandard is None:
+        raise RuntimeError("Rows use a zstd dictionary; install zstandard to read them")
+    _dictionaries[dictionary_id] = zstandard.ZstdCompressionDict(data)
+    _decompressors.pop(dictionary_id, None)
+    _compressors.clear()
+
+
+def _compressor(dictionary_id: int):
+    if dictionary_id not in _compressors:
+        level = _settings.compression_level or DEFAULT_LEVELS["ZSTD"]
+        dictionary = _dictionaries.get(dictionary_id)
+        _compressors[dictionary_id] = zstandard.ZstdCompressor(level=level, dict_data=dictionary)
+    return _compressors[dictionary_id]
+
+
+def _decompressor(dictionary_id: int):
+    if dictionary_id not in _decompressors:
+        if zstandard is None:
+            raise RuntimeError("Rows are zstd-compressed; install zstandard to read them")
+        dictionary = None
+        if dictionary_id:
+            dictionary = _dictionaries.get(dictionary_id)
+            if dictionary is None:
+                raise LookupError(f"Compression dictionary {dictionary_id} is not loaded")
+        _decompressors[dictionary_id] = zstandard.ZstdDecompressor(dict_data=dictionary)
+    return _decompressors[dictionary_id]
+
+
+def compress(value: str):
+    """BLOB for value, or value itself when it is short or does not shrink"""
+    settings = _settings
+    data = value.encode("utf-8")
+    if settings.compression == "OFF" or len(data) < settings.compression_min_bytes:
+        return value
+
+    if settings.compression == "ZLIB":
+        blob = ZLIB + zlib.compress(data, settings.compression_level or DEFAULT_LEVELS["ZLIB"])
+    else:
+        # The dictionary is used once it is loaded (after startup or training)
+        dictionary_id = settings.compression_dictionary_id if settings.compression_dictionary_id in _dictionaries else 0
+        frame = _compressor(dictionary_id).compress(data)
+        blob = ZSTD_DICT + _DICT_ID.pack(dictionary_id) + frame if dictionary_id else ZSTD + frame
+    return blob if len(blob) < len(data) else value
+
+
+def decompress(blob: bytes) -> str:
+    marker, body = blob[:1], blob[1:]
+    if marker == ZLIB:
+        data = zlib.decompress(body)
+    elif marker == ZSTD:
+        data = _decompressor(0).decompress(body)
+    elif marker == ZSTD_DICT:
+        (dictionary_id,) = _DICT_ID.unpack_from(body)
+        data = _decompressor(dictionary_id).decompress(body[_DICT_ID.size:])
+    else:
+        raise ValueError(f"Unknown compressed text format {marker!r}")
+    return data.decode("utf-8")
+
+
+def stored_format(value) -> str:
+    """'text', 'zlib', 'zstd' or 'zstd+dict<id>' for a raw column value"""
+    if not isinstance(value, bytes):
+        return "text"
+    if value[:1] == ZSTD_DICT:
+        return f"zstd+dict{_DICT_ID.unpack_from(value, 1)[0]}"
+    return {ZLIB: "zlib", ZSTD: "zstd"}.get(value[:1], "unknown")
+
+
+class CompressedText(TypeDecorator):
+    """Text column stored compressed on SQLite above a size threshold"""
+    impl = Text
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None or dialect.name != "sqlite":
+            return value
+        return compress(value)
+
+    def process_result_value(self, value, dialect):
+        if isinstance(value, bytes):
+            return decompress(value)
+        return value
+
+
+COMPRESSED_COLUMNS = (
+    ("chat_history", "message"),
+    ("chat_history", "response"),
+    ("journal_entries", "content"),
+)
+
+
+def _size(value) -> int:
+    return len(value) if isinstance(value, bytes) else len(value.encode("utf-8"))
+
+
+def recompress_column(conn, table: str, column: str, batch_size: int = 1000,
+                      rewrite_compressed: bool = False) -> dict:
+    """Compress a column's existing values with the current settings
+
+    Takes a sync SQLite connection, used for reads; each batch is written in
+    its own short transaction from conn.engine. Plain TEXT values long enough
+    are compressed; with rewrite_compressed, BLOBs are decompressed and
+    compressed again (e.g. after training a dictionary). Returns bytes
+    before/after and rows changed.
+    """
+    totals = {"rows": 0, "before": 0, "after": 0}
+    if rewrite_compressed:
+        where, min_length = "1", 1
+    else:
+        where, min_length = f"typeof({column}) = 'text'", _settings.compression_min_bytes
+    last_id = 0
+    while True:
+        rows = conn.exec_driver_sql(
+            f"SELECT id, {column} FROM {table} WHERE id > ? AND {column} IS NOT NULL AND {where} "
+            f"AND length(CAST({column} AS BLOB)) >= ? ORDER BY id LIMIT ?",
+            (last_id, min_length, batch_size),
+        ).all()
+        if not rows:
+            return totals
+        last_id = rows[-1][0]
+        updates = []
+        for row_id, raw in rows:
+            stored = compress(decompress(raw) if isinstance(raw, bytes) else raw)
+            if stored != raw:
+                totals["before"] += _size(raw)
+                totals["after"] += _size(stored)
+                updates.append((stored, row_id))
+        if updates:
+            with conn.engine.begin() as batch:
+                batch.exec_driver_sql(f"UPDATE {table} SET {column} = ? WHERE id = ?", updates)
+            totals["rows"] += len(updates)
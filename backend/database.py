@@ -1,16 +1,34 @@
+from fastapi import Depends
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
 from sqlalchemy.orm import DeclarativeBase
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text
-import os
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, LargeBinary, Index, ForeignKey, event, func, inspect, select, text
+from typing import Annotated
 from dotenv import load_dotenv
 
+from settings import load_database_settings, engine_options, sqlite_pragmas
+import compression
+from compression import CompressedText
+
 load_dotenv()
 
-DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./lifecoach.db")
+# Profile-based engine settings (APP_ENV + DB_* overrides), validated at import
+db_settings = load_database_settings()
+DATABASE_URL = db_settings.url
+compression.configure(db_settings)
 
-engine = create_async_engine(DATABASE_URL, echo=True)
+engine = create_async_engine(DATABASE_URL, **engine_options(db_settings))
 async_session = async_sessionmaker(engine, expire_on_commit=False)
 
+def apply_sqlite_pragmas(dbapi_connection, connection_record):
+    """WAL, sync level, cache and busy timeout for each new SQLite connection"""
+    cursor = dbapi_connection.cursor()
+    for pragma in sqlite_pragmas(db_settings):
+        cursor.execute(pragma)
+    cursor.close()
+
+if db_settings.is_sqlite:
+    event.listen(engine.sync_engine, "connect", apply_sqlite_pragmas)
+
 class Base(DeclarativeBase):
     pass
 
@@ -27,38 +45,162 @@ class User(Base):
     stripe_customer_id = Column(String, nullable=True)
     subscription_id = Column(String, nullable=True)
     subscription_status = Column(String, nullable=True)  # active, canceled, past_due, etc.
+    profile_version = Column(Integer, default=1)  # bumped when token claims (language, tier) change
+
+@event.listens_for(User.is_premium, "set")
+def outdate_tier_claims(user, value, oldvalue, initiator):
+    """Bump profile_version when an existing user's is_premium changes
+
+    Tokens carry a tier claim taken from is_premium; auth.py rejects tokens
+    minted before the bump. Core UPDATEs of is_premium must bump it themselves.
+    """
+    state = inspect(user)
+    if not state.has_identity or value == oldvalue:
+        return
+    current = state.dict.get("profile_version")
+    # Incremented in SQL when the column is not loaded, so it is never lazy-loaded here
+    user.profile_version = current + 1 if isinstance(current, int) else func.coalesce(User.profile_version, 1) + 1
 
+# Rows live in monthly copies of this table (chat_partitions.py); chat_history
+# itself only holds rows from before partitioning until migration 10 moves them
 class ChatHistory(Base):
     __tablename__ = "chat_history"
+    __table_args__ = (
+        Index("ix_chat_history_user_email_created_at_id", "user_email", text("created_at DESC"), text("id DESC")),
+        Index("ix_chat_history_user_id_created_at_id", "user_id", text("created_at DESC"), text("id DESC")),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    user_email = Column(String, index=True)
-    message = Column(Text)
-    response = Column(Text)
+    user_email = Column(String)
+    user_id = Column(Integer, ForeignKey("users.id"))
+    message = Column(CompressedText)
+    response = Column(CompressedText)
     feature = Column(String, default="chat")
-    created_at = Column(DateTime, default=None)
+    created_at = Column(DateTime(timezone=True), default=None)
 
 class JournalEntry(Base):
     __tablename__ = "journal_entries"
+    __table_args__ = (
+        # Partial: list queries only read rows that are not soft-deleted
+        Index("ix_journal_entries_user_email_live", "user_email", text("created_at DESC"), text("id DESC"),
+              sqlite_where=text("deleted_at IS NULL"), postgresql_where=text("deleted_at IS NULL")),
+        Index("ix_journal_entries_user_id_live", "user_id", text("created_at DESC"), text("id DESC"),
+              sqlite_where=text("deleted_at IS NULL"), postgresql_where=text("deleted_at IS NULL")),
+        Index("ix_journal_entries_deleted_at", "deleted_at",
+              sqlite_where=text("deleted_at IS NOT NULL"), postgresql_where=text("deleted_at IS NOT NULL")),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    user_email = Column(String, index=True)
+    user_email = Column(String)
+    user_id = Column(Integer, ForeignKey("users.id"))
     title = Column(String)
-    content = Column(Text)
-    created_at = Column(DateTime, default=None)
-    updated_at = Column(DateTime, default=None)
+    content = Column(CompressedText)
+    created_at = Column(DateTime(timezone=True), default=None)
+    updated_at = Column(DateTime(timezone=True), default=None)
+    deleted_at = Column(DateTime(timezone=True), nullable=True)  # soft delete; purger.py removes the row later
 
 class Goal(Base):
     __tablename__ = "goals"
+    __table_args__ = (
+        # Partial: list queries only read rows that are not soft-deleted
+        Index("ix_goals_user_email_live", "user_email", text("created_at DESC"), text("id DESC"),
+              sqlite_where=text("deleted_at IS NULL"), postgresql_where=text("deleted_at IS NULL")),
+        Index("ix_goals_user_id_live", "user_id", text("created_at DESC"), text("id DESC"),
+              sqlite_where=text("deleted_at IS NULL"), postgresql_where=text("deleted_at IS NULL")),
+        Index("ix_goals_deleted_at", "deleted_at",
+              sqlite_where=text("deleted_at IS NOT NULL"), postgresql_where=text("deleted_at IS NOT NULL")),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    user_email = Column(String, index=True)
+    user_email = Column(String)
+    user_id = Column(Integer, ForeignKey("users.id"))
     title = Column(String)
     description = Column(Text)
     progress = Column(Integer, default=0)  # 0-100
-    created_at = Column(DateTime, default=None)
-    updated_at = Column(DateTime, default=None)
+    created_at = Column(DateTime(timezone=True), default=None)
+    updated_at = Column(DateTime(timezone=True), default=None)
+    deleted_at = Column(DateTime(timezone=True), nullable=True)  # soft delete; purger.py removes the row later
+
+class ApiKey(Base):
+    __tablename__ = "api_keys"
+
+    id = Column(Integer, primary_key=True, index=True)
+    prefix = Column(String, unique=True, index=True)  # public part of the key, used for lookup
+    digest = Column(String)  # HMAC-SHA256 of the secret part
+    user_email = Column(String, index=True)  # account the integration acts as
+    name = Column(String)
+    scopes = Column(String, default="*")  # comma-separated: auth, chat, journal, goals
+    rate_limit_per_minute = Column(Integer, default=600)
+    created_at = Column(DateTime(timezone=True), default=None)
+    revoked_at = Column(DateTime(timezone=True), nullable=True)
+
+class UserStats(Base):
+    """Dashboard counters per user, kept current by the write paths (see stats.py)"""
+    __tablename__ = "user_stats"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    journal_entries = Column(Integer, default=0, nullable=False)
+    journal_week = Column(String)  # ISO week the weekly count belongs to, e.g. 2026-W42
+    journal_week_count = Column(Integer, default=0, nullable=False)
+    goals = Column(Integer, default=0, nullable=False)
+    goals_completed = Column(Integer, default=0, nullable=False)
+    progress_sum = Column(Integer, default=0, nullable=False)  # average progress = progress_sum / goals
+    messages = Column(Integer, default=0, nullable=False)
+    messages_day = Column(String)  # UTC date the daily count belongs to
+    messages_day_count = Column(Integer, default=0, nullable=False)
+    updated_at = Column(DateTime(timezone=True), default=None)
+
+class CompressionDictionary(Base):
+    """Trained zstd dictionaries for CompressedText (see compression.py)"""
+    __tablename__ = "compression_dictionaries"
+
+    id = Column(Integer, primary_key=True)
+    data = Column(LargeBinary, nullable=False)
+    samples = Column(Integer)  # values it was trained on
+    created_at = Column(DateTime(timezone=True), default=None)
+
+async def load_compression_dictionaries(db_engine=None):
+    """Load every stored dictionary, so rows compressed with any of them can be read"""
+    async with (db_engine or engine).connect() as conn:
+        rows = (await conn.execute(select(CompressionDictionary.id, CompressionDictionary.data))).all()
+    for dictionary_id, data in rows:
+        compression.add_dictionary(dictionary_id, data)
+    wanted = db_settings.compression_dictionary_id
+    if wanted and wanted not in {row[0] for row in rows}:
+        raise RuntimeError(f"DB_COMPRESSION_DICTIONARY_ID={wanted} is not in compression_dictionaries")
+    return len(rows)
+
+def owned_by(model, email: str, user_id: int | None):
+    """Per-user filter on the column selected by DB_USER_KEY
+
+    Tokens issued before the uid claim carry no user id, so they keep
+    filtering on email until they are refreshed.
+    """
+    if db_settings.user_key == "id" and user_id is not None:
+        return model.user_id == user_id
+    return model.user_email == email
+
+def owner_id(email: str, user_id: int | None):
+    """Value for user_id on new rows; a subquery when the token has no uid"""
+    if user_id is not None:
+        return user_id
+    return select(User.id).where(User.email == email).scalar_subquery()
 
 async def get_db():
+    """Unit of work for one request
+
+    The handler and every helper it calls share this session (one connection,
+    one identity map). It is committed once when the handler returns and
+    rolled back if it raises.
+    """
     async with async_session() as session:
-        yield session
\ No newline at end of file
+        try:
+            yield session
+            await session.commit()
+        except Exception:
+            await session.rollback()
+            raise
+
+# Function scope closes the unit of work before the response is sent, so a
+# failed commit turns into an error response instead of a silent 200
+DbSession = Annotated[AsyncSession, Depends(get_db, scope="function")]
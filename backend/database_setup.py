@@ -1,6 +1,7 @@
 """
 Database setup script for LifeCoach AI
-Run this once to initialize the database schema
+Run this once to initialize the database schema, or again to apply
+pending migrations (see migrations.py)
 """
 import asyncio
 import logging
@@ -8,19 +9,21 @@ import sys
 import os
 sys.path.append(os.path.dirname(__file__))
 
-from database import engine, Base
+from database import engine
+from migrations import upgrade, HEAD
 
 logging.basicConfig(level=logging.INFO)
 
 async def setup_database():
     """Setup database tables"""
     try:
-        async with engine.begin() as conn:
-            await conn.run_sync(Base.metadata.create_all)
-        logging.info("Database setup completed")
+        applied = await upgrade()
+        logging.info(f"Database setup completed (revision {HEAD}, {applied} migrations applied)")
 
     except Exception as e:
         logging.error(f"Database setup error: {str(e)}")
+    finally:
+        await engine.dispose()
 
 if __name__ == "__main__":
     asyncio.run(setup_database())
\ No newline at end of file
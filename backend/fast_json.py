@@ -0,0 +1,43 @@
+"""
+JSON responses for the list endpoints
+The list handlers select plain columns and hand the rows to FastJSONResponse,
+skipping ORM objects, per-row .isoformat() calls and FastAPI's
+jsonable_encoder pass. With orjson installed (pip install orjson) encoding is
+done in Rust and handles datetimes itself; without it the standard library
+produces the same output.
+"""
+import json
+from datetime import date
+
+from fastapi.responses import Response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(value):
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":"), default=_default).encode("utf-8")
+
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+def rows_as_dicts(result, keys: tuple = None) -> list[dict]:
+    """Rows of a column-projected SELECT as {column: value} dicts; with keys,
+    only those leading columns"""
+    keys = keys or tuple(result.keys())
+    return [dict(zip(keys, row)) for row in result]
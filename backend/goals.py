@@ -1,12 +1,17 @@
 from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel
 from sqlalchemy.future import select
+from sqlalchemy import update
 import sys
 import os
 sys.path.append(os.path.dirname(__file__))
 
-from auth import get_current_user
-from database import async_session, Goal
+from auth import get_current_claims, TokenClaims, ReadDbSession, UserDbSession
+from database import Goal, owned_by, owner_id
+from writer import submit_write
+from fast_json import FastJSONResponse, rows_as_dicts
+from stats import update_stats, update_progress_stats, is_completed
+import query_cache
 from datetime import datetime, timezone
 
 class GoalCreate(BaseModel):
@@ -20,25 +25,35 @@ class GoalUpdate(BaseModel):
 
 router = APIRouter()
 
-@router.get("/goals")
-async def get_goals(current_user: str = Depends(get_current_user)):
+# Columns of a goal in API responses
+GOAL_COLUMNS = (Goal.id, Goal.title, Goal.description, Goal.progress, Goal.created_at, Goal.updated_at)
+
+def goals_query(email: str, user_id: int | None):
+    """Newest first; served by the partial (key, created_at DESC, id DESC) index"""
+    return (select(*GOAL_COLUMNS).where(owned_by(Goal, email, user_id), Goal.deleted_at.is_(None))
+            .order_by(Goal.created_at.desc(), Goal.id.desc()))
+
+@router.get("/goals", response_class=FastJSONResponse)
+async def get_goals(session: ReadDbSession, claims: TokenClaims = Depends(get_current_claims)):
+    current_user = claims.email
     try:
-        async with async_session() as session:
-            result = await session.execute(
-                select(Goal).where(Goal.user_email == current_user).order_by(Goal.created_at.desc())
-            )
-            goals = result.scalars().all()
-            return [{"id": g.id, "title": g.title, "description": g.description, "progress": g.progress, "created_at": g.created_at.isoformat(), "updated_at": g.updated_at.isoformat() if g.updated_at else None} for g in goals]
+        async def fetch():
+            return rows_as_dicts(await session.execute(goals_query(current_user, claims.user_id)))
+
+        return await query_cache.cached_json(current_user, "goals", ("goals",), fetch)
     except Exception as e:
         raise HTTPException(status_code=500, detail="Internal server error")
 
 @router.post("/goals")
-async def create_goal(goal: GoalCreate, current_user: str = Depends(get_current_user)):
+async def create_goal(goal: GoalCreate, session: UserDbSession, claims: TokenClaims = Depends(get_current_claims)):
+    current_user = claims.email
     try:
         now = datetime.now(timezone.utc)
-        async with async_session() as session:
+
+        async def add_goal(session):
             new_goal = Goal(
                 user_email=current_user,
+                user_id=owner_id(current_user, claims.user_id),
                 title=goal.title,
                 description=goal.description,
                 progress=0,
@@ -46,49 +61,72 @@ async def create_goal(goal: GoalCreate, current_user: str = Depends(get_current_
                 updated_at=now
             )
             session.add(new_goal)
-            await session.commit()
-            await session.refresh(new_goal)
-            return {"id": new_goal.id, "title": new_goal.title, "description": new_goal.description, "progress": new_goal.progress, "created_at": new_goal.created_at.isoformat(), "updated_at": new_goal.updated_at.isoformat()}
+            query_cache.bump_on_commit(session, current_user, "goals")
+            await session.flush()
+            await update_stats(session, current_user, claims.user_id, goals=1)
+            return new_goal
+
+        new_goal = await submit_write(add_goal, current_user, session)
+        return {"id": new_goal.id, "title": new_goal.title, "description": new_goal.description, "progress": new_goal.progress, "created_at": new_goal.created_at.isoformat(), "updated_at": new_goal.updated_at.isoformat()}
     except Exception as e:
         raise HTTPException(status_code=500, detail="Internal server error")
 
 @router.put("/goals/{goal_id}")
-async def update_goal(goal_id: int, goal: GoalUpdate, current_user: str = Depends(get_current_user)):
+async def update_goal(goal_id: int, goal: GoalUpdate, session: UserDbSession, claims: TokenClaims = Depends(get_current_claims)):
+    current_user = claims.email
     try:
-        async with async_session() as session:
+        changes = {"title": goal.title, "description": goal.description}
+        if goal.progress is not None:
+            changes["progress"] = max(0, min(100, goal.progress))  # Clamp between 0-100
+
+        async def apply_update(session):
+            if goal.progress is not None:
+                await update_progress_stats(session, current_user, claims.user_id, goal_id, changes["progress"])
+            query_cache.bump_on_commit(session, current_user, "goals")
+            # One UPDATE ... RETURNING instead of loading the row first
             result = await session.execute(
-                select(Goal).where(Goal.id == goal_id, Goal.user_email == current_user)
+                update(Goal)
+                .where(Goal.id == goal_id, owned_by(Goal, current_user, claims.user_id), Goal.deleted_at.is_(None))
+                .values(**{k: v for k, v in changes.items() if v is not None}, updated_at=datetime.now(timezone.utc))
+                .returning(*GOAL_COLUMNS)
+                .execution_options(synchronize_session=False)
             )
-            db_goal = result.scalar_one_or_none()
-            if not db_goal:
-                raise HTTPException(status_code=404, detail="Goal not found")
-
-            if goal.title is not None:
-                db_goal.title = goal.title
-            if goal.description is not None:
-                db_goal.description = goal.description
-            if goal.progress is not None:
-                db_goal.progress = max(0, min(100, goal.progress))  # Clamp between 0-100
-            db_goal.updated_at = datetime.now(timezone.utc)
+            return result.first()
 
-            await session.commit()
-            return {"id": db_goal.id, "title": db_goal.title, "description": db_goal.description, "progress": db_goal.progress, "created_at": db_goal.created_at.isoformat(), "updated_at": db_goal.updated_at.isoformat()}
+        db_goal = await submit_write(apply_update, current_user, session)
+        if not db_goal:
+            raise HTTPException(status_code=404, detail="Goal not found")
+        return {"id": db_goal.id, "title": db_goal.title, "description": db_goal.description, "progress": db_goal.progress, "created_at": db_goal.created_at.isoformat(), "updated_at": db_goal.updated_at.isoformat()}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail="Internal server error")
 
 @router.delete("/goals/{goal_id}")
-async def delete_goal(goal_id: int, current_user: str = Depends(get_current_user)):
+async def delete_goal(goal_id: int, session: UserDbSession, claims: TokenClaims = Depends(get_current_claims)):
+    current_user = claims.email
     try:
-        async with async_session() as session:
+        async def remove_goal(session):
+            # Soft delete: one indexed UPDATE now, purger.py removes the row later
             result = await session.execute(
-                select(Goal).where(Goal.id == goal_id, Goal.user_email == current_user)
+                update(Goal)
+                .where(Goal.id == goal_id, owned_by(Goal, current_user, claims.user_id), Goal.deleted_at.is_(None))
+                .values(deleted_at=datetime.now(timezone.utc))
+                .returning(Goal.progress)
+                .execution_options(synchronize_session=False)
             )
-            db_goal = result.scalar_one_or_none()
-            if not db_goal:
-                raise HTTPException(status_code=404, detail="Goal not found")
+            deleted = result.first()
+            if deleted is None:
+                return False
+            query_cache.bump_on_commit(session, current_user, "goals")
+            await update_stats(session, current_user, claims.user_id, goals=-1,
+                               progress=-(deleted.progress or 0), completed=-is_completed(deleted.progress))
+            return True
 
-            await session.delete(db_goal)
-            await session.commit()
-            return {"message": "Goal deleted successfully"}
+        if not await submit_write(remove_goal, current_user, session):
+            raise HTTPException(status_code=404, detail="Goal not found")
+        return {"message": "Goal deleted successfully"}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail="Internal server error")
\ No newline at end of file
@@ -0,0 +1,68 @@
+"""
+Password hashing policy for LifeCoach AI.
+The scheme and cost are chosen per host by calibrate_hashing.py and stored
+as JSON, so login latency is a deliberate setting instead of a passlib default.
+"""
+import json
+import logging
+import os
+
+from passlib.context import CryptContext
+
+HASH_POLICY_FILE = os.getenv(
+    "HASH_POLICY_FILE", os.path.join(os.path.dirname(__file__), "hash_policy.json")
+)
+
+# passlib setting that holds the work factor for each supported scheme
+COST_SETTINGS = {
+    "pbkdf2_sha256": "rounds",
+    "bcrypt": "rounds",
+    "argon2": "rounds",  # passlib maps argon2 rounds to time_cost
+}
+
+# Hashes created before calibration existed are pbkdf2_sha256 with passlib defaults
+LEGACY_SCHEME = "pbkdf2_sha256"
+DEFAULT_POLICY = {"scheme": LEGACY_SCHEME, "cost": None}
+
+
+def load_hash_policy(path: str = HASH_POLICY_FILE) -> dict:
+    """Load the calibrated policy, falling back to passlib defaults"""
+    if not os.path.exists(path):
+        return dict(DEFAULT_POLICY)
+    try:
+        with open(path, encoding="utf-8") as f:
+            policy = json.load(f)
+        if policy.get("scheme") not in COST_SETTINGS:
+            raise ValueError(f"unsupported scheme {policy.get('scheme')!r}")
+        return policy
+    except Exception as e:
+        logging.error(f"Invalid hash policy in {path}, using defaults: {str(e)}")
+        return dict(DEFAULT_POLICY)
+
+
+def save_hash_policy(policy: dict, path: str = HASH_POLICY_FILE):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(policy, f, indent=2)
+
+
+def build_crypt_context(policy: dict) -> CryptContext:
+    """Build a CryptContext whose needs_update() flags every hash off-policy"""
+    scheme = policy["scheme"]
+    # Every scheme a policy can name stays verifiable, so recalibrating from
+    # argon2 to bcrypt (or back) does not lock out users hashed under the old
+    # one; deprecated="auto" marks all but the first for rehash on login
+    schemes = [scheme] + [other for other in COST_SETTINGS if other != scheme]
+
+    settings = {}
+    cost = policy.get("cost")
+    if cost:
+        name = COST_SETTINGS[scheme]
+        # Pin min and max to the calibrated cost so hashes converge on it
+        # in both directions (too weak and too slow are both rehashed).
+        settings[f"{scheme}__default_{name}"] = cost
+        settings[f"{scheme}__min_{name}"] = cost
+        settings[f"{scheme}__max_{name}"] = cost
+    if scheme == "argon2" and policy.get("memory_cost"):
+        settings["argon2__memory_cost"] = policy["memory_cost"]
+
+    return CryptContext(schemes=schemes, deprecated="auto", **settings)
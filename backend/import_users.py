@@ -0,0 +1,175 @@
+"""
+Bulk user import for LifeCoach AI
+Reads users from CSV or NDJSON, hashes passwords across a process pool and
+inserts them in batched multi-row statements. Emails that already exist (in
+the database or earlier in the file) are skipped.
+
+    python import_users.py partner_users.csv
+    python import_users.py partner_users.ndjson --batch-size 1000 --workers 8
+
+Each record needs "email" and "password"; "language" and "is_premium" are optional.
+Run database_setup.py first so the users table exists.
+"""
+import argparse
+import asyncio
+import csv
+import json
+import logging
+import sys
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+sys.path.append(os.path.dirname(__file__))
+
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from database import engine, async_session, User
+from hashing import load_hash_policy, build_crypt_context
+
+logging.basicConfig(level=logging.INFO)
+
+TRUE_VALUES = {"1", "true", "yes", "y"}
+
+_pwd_context = None
+
+
+def hash_batch(rows: list[dict]) -> list[dict]:
+    """Runs in a worker process: replace plain passwords with hashes"""
+    global _pwd_context
+    if _pwd_context is None:
+        _pwd_context = build_crypt_context(load_hash_policy())
+    for row in rows:
+        row["password"] = _pwd_context.hash(row["password"])
+    return rows
+
+
+def read_records(path: str, fmt: str):
+    with open(path, encoding="utf-8", newline="") as f:
+        if fmt == "csv":
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+
+
+def normalize_record(record: dict) -> dict | None:
+    email = (record.get("email") or "").strip()
+    password = record.get("password") or ""
+    if not email or not password:
+        return None
+    is_premium = record.get("is_premium", False)
+    if isinstance(is_premium, str):
+        is_premium = is_premium.strip().lower() in TRUE_VALUES
+    return {
+        "email": email,
+        "password": password,
+        "language": (record.get("language") or "tr").strip(),
+        "is_premium": bool(is_premium),
+        "message_count": 0,
+    }
+
+
+def insert_ignoring_duplicates(rows: list[dict]):
+    """Multi-row INSERT that skips emails inserted concurrently by someone else"""
+    dialect = engine.dialect.name
+    if dialect == "sqlite":
+        stmt = sqlite.insert(User).values(rows)
+    elif dialect == "postgresql":
+        stmt = postgresql.insert(User).values(rows)
+    else:
+        raise RuntimeError(f"Bulk import does not support the {dialect} dialect")
+    return stmt.on_conflict_do_nothing(index_elements=["email"])
+
+
+async def existing_emails(emails: list[str]) -> set[str]:
+    async with async_session() as session:
+        result = await session.execute(select(User.email).where(User.email.in_(emails)))
+        return set(result.scalars().all())
+
+
+async def insert_batch(rows: list[dict]) -> int:
+    async with async_session() as session:
+        result = await session.execute(insert_ignoring_duplicates(rows))
+        await session.commit()
+        return result.rowcount
+
+
+async def import_users(path: str, fmt: str, batch_size: int, workers: int) -> dict:
+    stats = {"read": 0, "invalid": 0, "duplicates": 0, "inserted": 0}
+    start = time.perf_counter()
+
+    # Dedupe within the file first so no worker hashes a password twice
+    seen = set()
+    records = []
+    for record in read_records(path, fmt):
+        stats["read"] += 1
+        row = normalize_record(record)
+        if row is None:
+            stats["invalid"] += 1
+            continue
+        if row["email"] in seen:
+            stats["duplicates"] += 1
+            continue
+        seen.add(row["email"])
+        records.append(row)
+
+    batches = []
+    for i in range(0, len(records), batch_size):
+        batch = records[i:i + batch_size]
+        # Skip emails that are already registered before paying for their hashes
+        taken = await existing_emails([r["email"] for r in batch])
+        stats["duplicates"] += len(taken)
+        batch = [r for r in batch if r["email"] not in taken]
+        if batch:
+            batches.append(batch)
+
+    hash_seconds = 0.0
+    loop = asyncio.get_running_loop()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        hash_start = time.perf_counter()
+        futures = [loop.run_in_executor(pool, hash_batch, batch) for batch in batches]
+        # Insert each batch as soon as its hashes are ready, overlapping DB and CPU work
+        for future in asyncio.as_completed(futures):
+            rows = await future
+            inserted = await insert_batch(rows)
+            stats["inserted"] += inserted
+            stats["duplicates"] += len(rows) - inserted
+        hash_seconds = time.perf_counter() - hash_start
+
+    elapsed = time.perf_counter() - start
+    stats["seconds"] = round(elapsed, 2)
+    stats["users_per_second"] = round(stats["inserted"] / elapsed, 1) if elapsed else 0.0
+    stats["hash_and_insert_seconds"] = round(hash_seconds, 2)
+    return stats
+
+
+async def run(path: str, fmt: str, batch_size: int, workers: int) -> dict:
+    try:
+        return await import_users(path, fmt, batch_size, workers)
+    finally:
+        await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import users from CSV or NDJSON")
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=["csv", "ndjson"],
+                        help="input format (default: guessed from the file extension)")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    fmt = args.format or ("csv" if args.path.lower().endswith(".csv") else "ndjson")
+    stats = asyncio.run(run(args.path, fmt, args.batch_size, args.workers))
+    logging.info(
+        f"Imported {stats['inserted']} of {stats['read']} users in {stats['seconds']}s "
+        f"({stats['users_per_second']} users/s); {stats['duplicates']} duplicates, "
+        f"{stats['invalid']} invalid; hashing+insert took {stats['hash_and_insert_seconds']}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,17 @@
 from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel
 from sqlalchemy.future import select
+from sqlalchemy import update
 import sys
 import os
 sys.path.append(os.path.dirname(__file__))
 
-from auth import get_current_user
-from database import async_session, JournalEntry
+from auth import get_current_claims, TokenClaims, ReadDbSession, UserDbSession
+from database import JournalEntry, owned_by, owner_id
+from writer import submit_write
+from fast_json import FastJSONResponse, rows_as_dicts
+from stats import update_stats
+import query_cache
 from datetime import datetime, timezone
 
 class JournalEntryCreate(BaseModel):
@@ -19,72 +24,104 @@ class JournalEntryUpdate(BaseModel):
 
 router = APIRouter()
 
-@router.get("/journal/entries")
-async def get_journal_entries(current_user: str = Depends(get_current_user)):
+# Columns of an entry in API responses
+ENTRY_COLUMNS = (JournalEntry.id, JournalEntry.title, JournalEntry.content, JournalEntry.created_at, JournalEntry.updated_at)
+
+def entries_query(email: str, user_id: int | None):
+    """Newest first; served by the partial (key, created_at DESC, id DESC) index"""
+    return (select(*ENTRY_COLUMNS).where(owned_by(JournalEntry, email, user_id), JournalEntry.deleted_at.is_(None))
+            .order_by(JournalEntry.created_at.desc(), JournalEntry.id.desc()))
+
+@router.get("/journal/entries", response_class=FastJSONResponse)
+async def get_journal_entries(session: ReadDbSession, claims: TokenClaims = Depends(get_current_claims)):
+    current_user = claims.email
     try:
-        async with async_session() as session:
-            result = await session.execute(
-                select(JournalEntry).where(JournalEntry.user_email == current_user).order_by(JournalEntry.created_at.desc())
-            )
-            entries = result.scalars().all()
-            return [{"id": e.id, "title": e.title, "content": e.content, "created_at": e.created_at.isoformat(), "updated_at": e.updated_at.isoformat() if e.updated_at else None} for e in entries]
+        async def fetch():
+            return rows_as_dicts(await session.execute(entries_query(current_user, claims.user_id)))
+
+        return await query_cache.cached_json(current_user, "journal", ("journal_entries",), fetch)
     except Exception as e:
         raise HTTPException(status_code=500, detail="Internal server error")
 
 @router.post("/journal/entries")
-async def create_journal_entry(entry: JournalEntryCreate, current_user: str = Depends(get_current_user)):
+async def create_journal_entry(entry: JournalEntryCreate, session: UserDbSession, claims: TokenClaims = Depends(get_current_claims)):
+    current_user = claims.email
     try:
         now = datetime.now(timezone.utc)
-        async with async_session() as session:
+
+        async def add_entry(session):
             new_entry = JournalEntry(
                 user_email=current_user,
+                user_id=owner_id(current_user, claims.user_id),
                 title=entry.title,
                 content=entry.content,
                 created_at=now,
                 updated_at=now
             )
             session.add(new_entry)
-            await session.commit()
-            await session.refresh(new_entry)
-            return {"id": new_entry.id, "title": new_entry.title, "content": new_entry.content, "created_at": new_entry.created_at.isoformat(), "updated_at": new_entry.updated_at.isoformat()}
+            query_cache.bump_on_commit(session, current_user, "journal_entries")
+            await session.flush()
+            await update_stats(session, current_user, claims.user_id, journal=1, journal_created_at=now)
+            return new_entry
+
+        new_entry = await submit_write(add_entry, current_user, session)
+        return {"id": new_entry.id, "title": new_entry.title, "content": new_entry.content, "created_at": new_entry.created_at.isoformat(), "updated_at": new_entry.updated_at.isoformat()}
     except Exception as e:
         raise HTTPException(status_code=500, detail="Internal server error")
 
 @router.put("/journal/entries/{entry_id}")
-async def update_journal_entry(entry_id: int, entry: JournalEntryUpdate, current_user: str = Depends(get_current_user)):
+async def update_journal_entry(entry_id: int, entry: JournalEntryUpdate, session: UserDbSession, claims: TokenClaims = Depends(get_current_claims)):
+    current_user = claims.email
     try:
-        async with async_session() as session:
+        changes = {"title": entry.title, "content": entry.content}
+
+        async def apply_update(session):
+            query_cache.bump_on_commit(session, current_user, "journal_entries")
+            # One UPDATE ... RETURNING instead of loading the row first
             result = await session.execute(
-                select(JournalEntry).where(JournalEntry.id == entry_id, JournalEntry.user_email == current_user)
+                update(JournalEntry)
+                .where(JournalEntry.id == entry_id, owned_by(JournalEntry, current_user, claims.user_id),
+                       JournalEntry.deleted_at.is_(None))
+                .values(**{k: v for k, v in changes.items() if v is not None}, updated_at=datetime.now(timezone.utc))
+                .returning(*ENTRY_COLUMNS)
+                .execution_options(synchronize_session=False)
             )
-            db_entry = result.scalar_one_or_none()
-            if not db_entry:
-                raise HTTPException(status_code=404, detail="Entry not found")
-
-            if entry.title is not None:
-                db_entry.title = entry.title
-            if entry.content is not None:
-                db_entry.content = entry.content
-            db_entry.updated_at = datetime.now(timezone.utc)
-
-            await session.commit()
-            return {"id": db_entry.id, "title": db_entry.title, "content": db_entry.content, "created_at": db_entry.created_at.isoformat(), "updated_at": db_entry.updated_at.isoformat()}
+            return result.first()
+
+        db_entry = await submit_write(apply_update, current_user, session)
+        if not db_entry:
+            raise HTTPException(status_code=404, detail="Entry not found")
+        return {"id": db_entry.id, "title": db_entry.title, "content": db_entry.content, "created_at": db_entry.created_at.isoformat(), "updated_at": db_entry.updated_at.isoformat()}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail="Internal server error")
 
 @router.delete("/journal/entries/{entry_id}")
-async def delete_journal_entry(entry_id: int, current_user: str = Depends(get_current_user)):
+async def delete_journal_entry(entry_id: int, session: UserDbSession, claims: TokenClaims = Depends(get_current_claims)):
+    current_user = claims.email
     try:
-        async with async_session() as session:
+        async def remove_entry(session):
+            # Soft delete: one indexed UPDATE now, purger.py removes the row later
             result = await session.execute(
-                select(JournalEntry).where(JournalEntry.id == entry_id, JournalEntry.user_email == current_user)
+                update(JournalEntry)
+                .where(JournalEntry.id == entry_id, owned_by(JournalEntry, current_user, claims.user_id),
+                       JournalEntry.deleted_at.is_(None))
+                .values(deleted_at=datetime.now(timezone.utc))
+                .returning(JournalEntry.created_at)
+                .execution_options(synchronize_session=False)
             )
-            db_entry = result.scalar_one_or_none()
-            if not db_entry:
-                raise HTTPException(status_code=404, detail="Entry not found")
+            deleted = result.first()
+            if deleted is None:
+                return False
+            query_cache.bump_on_commit(session, current_user, "journal_entries")
+            await update_stats(session, current_user, claims.user_id, journal=-1, journal_created_at=deleted.created_at)
+            return True
 
-            await session.delete(db_entry)
-            await session.commit()
-            return {"message": "Entry deleted successfully"}
+        if not await submit_write(remove_entry, current_user, session):
+            raise HTTPException(status_code=404, detail="Entry not found")
+        return {"message": "Entry deleted successfully"}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail="Internal server error")
\ No newline at end of file
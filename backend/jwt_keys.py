@@ -0,0 +1,207 @@
+"""
+Asymmetric JWT signing keys for LifeCoach AI
+Auth nodes sign access tokens with a private key from the key ring; any node
+can verify them with the public JWKS alone, so verification-only nodes never
+hold a secret that can mint tokens.
+
+Key directory layout (JWT_KEY_DIR):
+    jwks.json   public keys of every non-retired key, plus "nbf" (activation time)
+    <kid>.pem   private key, present only on nodes that issue tokens
+
+Verification-only nodes point JWT_JWKS_FILE at a copy of jwks.json (or a file
+synced from GET /auth/jwks.json) and need no .pem files.
+
+    python jwt_keys.py rotate --alg ES256 --activate-in-hours 1
+    python jwt_keys.py list
+"""
+import argparse
+import json
+import logging
+import os
+import secrets
+import sys
+import threading
+import time
+
+from jose import jwk
+from jose.exceptions import JWKError
+
+logging.basicConfig(level=logging.INFO)
+
+ASYMMETRIC_ALGORITHMS = ("ES256", "RS256")
+JWT_KEY_DIR = os.getenv("JWT_KEY_DIR", os.path.join(os.path.dirname(__file__), "jwt_keys"))
+JWT_JWKS_FILE = os.getenv("JWT_JWKS_FILE") or os.path.join(JWT_KEY_DIR, "jwks.json")
+# How often a running node re-reads jwks.json to pick up rotations
+RELOAD_INTERVAL_SECONDS = 30
+
+
+class KeyRing:
+    """Thread-safe view of jwks.json and the private keys next to it"""
+
+    def __init__(self, jwks_file: str = JWT_JWKS_FILE, key_dir: str = JWT_KEY_DIR):
+        self.jwks_file = jwks_file
+        self.key_dir = key_dir
+        self._lock = threading.Lock()
+        self._entries = []
+        self._public_keys = {}
+        self._private_keys = {}
+        self._mtime = None
+        self._checked_at = 0.0
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now - self._checked_at < RELOAD_INTERVAL_SECONDS and self._mtime is not None:
+            return
+        with self._lock:
+            self._checked_at = now
+            try:
+                mtime = os.path.getmtime(self.jwks_file)
+            except OSError:
+                return
+            if mtime == self._mtime:
+                return
+            with open(self.jwks_file, encoding="utf-8") as f:
+                entries = json.load(f).get("keys", [])
+            # Constructing key objects is the slow part of verify; do it once per rotation
+            self._public_keys = {e["kid"]: jwk.construct(e, e["alg"]) for e in entries}
+            self._private_keys = {}
+            self._entries = sorted(entries, key=lambda e: e.get("nbf", 0))
+            self._mtime = mtime
+            logging.info(f"Loaded {len(entries)} JWT verification keys from {self.jwks_file}")
+
+    def verification_key(self, kid: str):
+        self._maybe_reload()
+        return self._public_keys.get(kid)
+
+    def signing_key(self):
+        """Newest activated key whose private half is on this node, as (kid, key)"""
+        self._maybe_reload()
+        now = time.time()
+        for entry in reversed(self._entries):
+            if entry.get("nbf", 0) > now:
+                continue  # published for verifiers, not active yet
+            kid = entry["kid"]
+            if kid not in self._private_keys:
+                path = os.path.join(self.key_dir, f"{kid}.pem")
+                if not os.path.exists(path):
+                    continue
+                with open(path, encoding="utf-8") as f:
+                    self._private_keys[kid] = jwk.construct(f.read(), entry["alg"])
+            return kid, self._private_keys[kid]
+        return None
+
+    def jwks(self) -> dict:
+        self._maybe_reload()
+        return {"keys": list(self._entries)}
+
+
+def generate_private_pem(alg: str) -> str:
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import ec, rsa
+
+    if alg == "ES256":
+        private_key = ec.generate_private_key(ec.SECP256R1())
+    elif alg == "RS256":
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    else:
+        raise ValueError(f"Unsupported signing algorithm: {alg}")
+    return private_key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    ).decode()
+
+
+def public_jwk(private_pem: str, alg: str, kid: str) -> dict:
+    entry = jwk.construct(private_pem, alg).public_key().to_dict()
+    entry.update({"kid": kid, "use": "sig", "alg": alg})
+    return entry
+
+
+def _read_entries(key_dir: str) -> list[dict]:
+    path = os.path.join(key_dir, "jwks.json")
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return json.load(f).get("keys", [])
+
+
+def _write_entries(key_dir: str, entries: list[dict]):
+    path = os.path.join(key_dir, "jwks.json")
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"keys": entries}, f, indent=2)
+    os.replace(tmp_path, path)  # verifiers never see a half-written file
+
+
+def rotate(key_dir: str, alg: str, activate_in_seconds: float, token_lifetime_seconds: float) -> str:
+    """Publish a new key that becomes the signer after a delay, and prune retired keys.
+
+    The delay lets verification-only nodes fetch the new public key before any
+    token is signed with it. A key is retired once its successor has been
+    active for longer than a token lives, so no valid token is orphaned.
+    """
+    os.makedirs(key_dir, exist_ok=True)
+    now = time.time()
+    entries = _read_entries(key_dir)
+
+    kid = f"{time.strftime('%Y%m%d', time.gmtime(now))}-{secrets.token_hex(4)}"
+    private_pem = generate_private_pem(alg)
+    pem_path = os.path.join(key_dir, f"{kid}.pem")
+    fd = os.open(pem_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(private_pem)
+    entry = public_jwk(private_pem, alg, kid)
+    entry["nbf"] = int(now + activate_in_seconds)
+    entries.append(entry)
+    entries.sort(key=lambda e: e["nbf"])
+
+    kept = []
+    for i, e in enumerate(entries):
+        later_active = [n["nbf"] for n in entries[i + 1:] if n["nbf"] <= now]
+        if later_active and now - min(later_active) > token_lifetime_seconds:
+            old_pem = os.path.join(key_dir, f"{e['kid']}.pem")
+            if os.path.exists(old_pem):
+                os.remove(old_pem)
+            logging.info(f"Retired JWT key {e['kid']}")
+            continue
+        kept.append(e)
+
+    _write_entries(key_dir, kept)
+    return kid
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the JWT signing key ring")
+    sub = parser.add_subparsers(dest="command", required=True)
+    rot = sub.add_parser("rotate", help="generate a new signing key and prune retired ones")
+    rot.add_argument("--alg", choices=ASYMMETRIC_ALGORITHMS, default=os.getenv("JWT_ALGORITHM", "ES256"))
+    rot.add_argument("--activate-in-hours", type=float, default=1.0,
+                     help="delay before the new key signs tokens (0 for the very first key)")
+    rot.add_argument("--token-lifetime-minutes", type=float, default=1440)
+    rot.add_argument("--key-dir", default=JWT_KEY_DIR)
+    lst = sub.add_parser("list", help="show published keys")
+    lst.add_argument("--key-dir", default=JWT_KEY_DIR)
+    args = parser.parse_args()
+
+    if args.command == "rotate":
+        if args.alg not in ASYMMETRIC_ALGORITHMS:
+            parser.error(f"--alg must be one of {', '.join(ASYMMETRIC_ALGORITHMS)}")
+        try:
+            kid = rotate(args.key_dir, args.alg, args.activate_in_hours * 3600,
+                         args.token_lifetime_minutes * 60)
+        except (ValueError, JWKError) as e:
+            logging.error(f"Key rotation failed: {str(e)}")
+            sys.exit(1)
+        logging.info(f"Published JWT key {kid}")
+    else:
+        now = time.time()
+        for e in _read_entries(args.key_dir):
+            has_private = os.path.exists(os.path.join(args.key_dir, f"{e['kid']}.pem"))
+            state = "pending" if e["nbf"] > now else "active"
+            print(f"{e['kid']}  {e['alg']}  {state}  nbf={time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(e['nbf']))}"
+                  f"  {'private+public' if has_private else 'public only'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Throwaway PostgreSQL server for tests and benchmarks, without Docker
+Runs initdb/pg_ctl from a local PostgreSQL installation into a temporary
+directory, starts it on a free port with fsync off, and removes it afterwards.
+The binaries are looked up in PG_BIN, then PATH, then /usr/lib/postgresql/*/bin.
+
+    python local_postgres.py -- python benchmarks/bench_backends.py
+    python local_postgres.py            # print the URL and keep running until Ctrl-C
+"""
+import argparse
+import contextlib
+import glob
+import logging
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+logging.basicConfig(level=logging.INFO)
+
+DATABASE_NAME = "lifecoach"
+
+
+def find_pg_bin() -> str | None:
+    candidates = [os.getenv("PG_BIN")]
+    initdb = shutil.which("initdb")
+    if initdb:
+        candidates.append(os.path.dirname(initdb))
+    candidates += sorted(glob.glob("/usr/lib/postgresql/*/bin"), reverse=True)
+    candidates += sorted(glob.glob("/usr/local/opt/postgresql*/bin"), reverse=True)
+    for path in candidates:
+        if path and os.path.exists(os.path.join(path, "pg_ctl")):
+            return path
+    return None
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@contextlib.contextmanager
+def local_postgres():
+    """Start a temporary cluster and yield its asyncpg DATABASE_URL"""
+    pg_bin = find_pg_bin()
+    if pg_bin is None:
+        raise RuntimeError("PostgreSQL binaries not found; install PostgreSQL or set PG_BIN")
+
+    tmp = tempfile.mkdtemp(prefix="lifecoach-pg-")
+    data_dir = os.path.join(tmp, "data")
+    port = _free_port()
+
+    def run(*cmd):
+        subprocess.run([os.path.join(pg_bin, cmd[0]), *cmd[1:]], check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+    try:
+        run("initdb", "-D", data_dir, "-U", "postgres", "-A", "trust", "-E", "UTF8", "--no-sync")
+        # Durability is irrelevant for a scratch server; fsync off keeps it fast
+        options = f"-p {port} -k {tmp} -c listen_addresses=127.0.0.1 -c fsync=off -c full_page_writes=off"
+        run("pg_ctl", "-D", data_dir, "-l", os.path.join(tmp, "server.log"), "-o", options, "-w", "start")
+        run("createdb", "-h", "127.0.0.1", "-p", str(port), "-U", "postgres", DATABASE_NAME)
+        yield f"postgresql+asyncpg://postgres@127.0.0.1:{port}/{DATABASE_NAME}"
+    finally:
+        if os.path.exists(os.path.join(data_dir, "postmaster.pid")):
+            subprocess.run([os.path.join(pg_bin, "pg_ctl"), "-D", data_dir, "-m", "immediate", "stop"],
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a command against a temporary local PostgreSQL")
+    parser.add_argument("command", nargs=argparse.REMAINDER,
+                        help="command to run with DATABASE_URL pointing at the server")
+    args = parser.parse_args()
+    command = args.command[1:] if args.command[:1] == ["--"] else args.command
+
+    try:
+        with local_postgres() as url:
+            if not command:
+                print(url)
+                try:
+                    while True:
+                        time.sleep(3600)
+                except KeyboardInterrupt:
+                    return
+            env = dict(os.environ, DATABASE_URL=url)
+            sys.exit(subprocess.run(command, env=env).returncode)
+    except (RuntimeError, subprocess.CalledProcessError) as e:
+        logging.error(f"Local PostgreSQL failed: {str(e)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
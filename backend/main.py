@@ -1,4 +1,4 @@
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from pathlib import Path
@@ -13,26 +13,88 @@ load_dotenv(dotenv_path=env_path)
 
 sys.path.append(os.path.dirname(__file__))
 
-from auth import router as auth_router
+from auth import router as auth_router, require_metrics_key
 from chat import router as chat_router
 from journal import router as journal_router
 from goals import router as goals_router
-from database import engine, Base
+from stats import router as stats_router
+from database import engine, db_settings, load_compression_dictionaries
+from migrations import upgrade
+from chat_partitions import ensure_upcoming
+from writer import write_queue
+from purger import purge_loop
+from backup import backup_loop
+import maintenance
+from maintenance import maintenance_loop
+import query_cache
+from shards import shard_engines
+from replicas import replica_set
+import replicas
+import sql_metrics
+from sql_metrics import router as metrics_router
 import asyncio
-
-# Create all tables on startup
-async def create_tables():
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+import time
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    """Create all database tables on startup"""
-    await create_tables()
+    """Bring the schema up to date on startup (a single query when already at head)"""
+    await upgrade()
+    await ensure_upcoming(engine)
+    await load_compression_dictionaries()
+    if write_queue is not None:
+        write_queue.start()
+    replica_monitor = None
+    if replica_set is not None:
+        replica_monitor = asyncio.create_task(replica_set.health_loop(db_settings.replica_health_interval))
+    purger = asyncio.create_task(purge_loop(db_settings.purge_interval)) if db_settings.purge_interval else None
+    backups = asyncio.create_task(backup_loop(db_settings.backup_interval)) if db_settings.backup_interval else None
+    maintainer = None
+    if db_settings.scheduler_interval:
+        maintainer = asyncio.create_task(maintenance_loop(db_settings.scheduler_interval))
     yield
+    if maintainer:
+        maintainer.cancel()
+    if backups:
+        backups.cancel()
+    if purger:
+        purger.cancel()
+    if replica_monitor:
+        replica_monitor.cancel()
+        await replica_set.dispose()
+    if write_queue is not None:
+        await write_queue.stop()
+    if shard_engines is not None:
+        await shard_engines.dispose()
 
 app = FastAPI(lifespan=lifespan)
 
+sql_metrics.instrument(engine)
+if replica_set is not None:
+    for replica in replica_set.replicas:
+        sql_metrics.instrument(replica.engine)
+
+@app.middleware("http")
+async def sql_timing(request: Request, call_next):
+    """Report the request's SQL count and time (Server-Timing) and keep per-endpoint totals"""
+    stats = sql_metrics.start_request()
+    start = time.perf_counter()
+    response = await call_next(request)
+    response.headers["Server-Timing"] = stats.server_timing()
+    endpoint = sql_metrics.endpoint_name(request.scope)
+    if endpoint is not None:
+        sql_metrics.finish_request(endpoint, stats)
+        # Load and latency signal for the maintenance scheduler
+        maintenance.record_request(time.perf_counter() - start)
+    return response
+
+@app.middleware("http")
+async def read_your_writes(request: Request, call_next):
+    """Tell every worker, through a cookie, that this client's reads need the primary for a while"""
+    writes = replicas.start_request()
+    response = await call_next(request)
+    replicas.finish_request(response, writes)
+    return response
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -45,6 +107,12 @@ app.include_router(auth_router, prefix="/auth", tags=["auth"])
 app.include_router(chat_router, tags=["chat"])
 app.include_router(journal_router, tags=["journal"])
 app.include_router(goals_router, tags=["goals"])
+app.include_router(stats_router, tags=["stats"])
+# Operational data about every user: API keys with the metrics scope only
+metrics_access = [Depends(require_metrics_key)]
+app.include_router(metrics_router, tags=["metrics"], dependencies=metrics_access)
+app.include_router(maintenance.router, tags=["metrics"], dependencies=metrics_access)
+app.include_router(query_cache.router, tags=["metrics"], dependencies=metrics_access)
 
 # Serve frontend files (index.html, script.js, style.css) from project root.
 # Mount this after API routers so API endpoints like /chat, /auth take precedence.
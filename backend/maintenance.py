@@ -0,0 +1,280 @@
+"""
+Background SQLite maintenance for LifeCoach AI
+Keeps the query planner's statistics fresh and the files compact without
+a cron job. The scheduler runs the tasks that are due on DATABASE_URL and
+then every shard, waking at the shorter of DB_MAINTENANCE_INTERVAL and
+DB_SQLITE_CHECKPOINT_INTERVAL:
+
+    checkpoint  PRAGMA wal_checkpoint                   DB_SQLITE_CHECKPOINT_INTERVAL
+    vacuum      PRAGMA incremental_vacuum, in chunks, until no free pages are left   every pass
+    analyze     ANALYZE, one table at a time            DB_MAINTENANCE_ANALYZE_INTERVAL
+    optimize    PRAGMA optimize                         DB_MAINTENANCE_OPTIMIZE_INTERVAL
+
+The checkpoint runs whatever the traffic, so commits rarely pay for one:
+PASSIVE under load, which never waits on readers or writers, and TRUNCATE in
+a quiet window, which also shrinks the WAL file. DB_MAINTENANCE_INTERVAL=0
+turns off every task but the checkpoint. The other tasks only start
+in a low-traffic window: at most DB_MAINTENANCE_QUIET_RPS API requests per
+second over the last minute. Between steps they check the p95 latency of
+the requests finished in the last few seconds; above
+DB_MAINTENANCE_PAUSE_LATENCY_MS they stop and are retried in a later window.
+While the scheduler runs, the purger leaves vacuuming to it.
+Requests are recorded by the middleware in main.py. The duration and outcome
+of every task are served at GET /metrics/maintenance. Shards are covered
+while their engine is open.
+
+PostgreSQL runs autovacuum and autoanalyze itself, so the scheduler only
+runs on SQLite. A full pass over every file can also be run by hand,
+ignoring traffic:
+
+    python maintenance.py
+    python maintenance.py --task analyze
+"""
+import argparse
+import asyncio
+import logging
+import sys
+import os
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Callable, NamedTuple
+sys.path.append(os.path.dirname(__file__))
+
+from fastapi import APIRouter
+from sqlalchemy import inspect
+
+from database import engine, db_settings
+from purger import incremental_vacuum
+from shards import shard_engines, databases
+
+logging.basicConfig(level=logging.INFO)
+
+# Requests per second are averaged over this long
+LOAD_WINDOW_SECONDS = 60
+# The pause check looks at requests finished this recently
+LATENCY_WINDOW_SECONDS = 5
+VACUUM_CHUNK_PAGES = 500
+
+# (monotonic time finished, seconds) of recent API requests
+_requests: deque = deque(maxlen=10_000)
+
+
+def record_request(seconds: float):
+    """Called by the middleware in main.py for every API request"""
+    _requests.append((time.monotonic(), seconds))
+
+
+def requests_per_second(window: float = LOAD_WINDOW_SECONDS) -> float:
+    since = time.monotonic() - window
+    return sum(1 for finished, _ in reversed(_requests) if finished >= since) / window
+
+
+def recent_latency_ms(window: float = LATENCY_WINDOW_SECONDS) -> float | None:
+    """p95 of the requests finished in the last `window` seconds (None: no requests)"""
+    since = time.monotonic() - window
+    recent = sorted(seconds for finished, seconds in _requests if finished >= since)
+    if not recent:
+        return None
+    return recent[int(len(recent) * 0.95)] * 1000 if len(recent) > 1 else recent[0] * 1000
+
+
+def is_quiet() -> bool:
+    return requests_per_second() <= db_settings.maintenance_quiet_rps
+
+
+def latency_high() -> bool:
+    latency = recent_latency_ms()
+    return latency is not None and latency > db_settings.maintenance_pause_latency_ms
+
+
+async def _autocommit(db_engine, sql: str):
+    async with db_engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        result = await conn.exec_driver_sql(sql)
+        return result.first() if result.returns_rows else None
+
+
+async def _checkpoint(db_engine):
+    mode = "TRUNCATE" if is_quiet() else "PASSIVE"
+    busy, wal_pages, checkpointed = await _autocommit(db_engine, f"PRAGMA wal_checkpoint({mode})")
+    if wal_pages < 0:
+        yield "not in WAL mode"
+    else:
+        yield f"{mode}: {checkpointed}/{wal_pages} WAL pages" + (" (busy)" if busy else "")
+
+
+async def _vacuum(db_engine):
+    previous = None
+    while True:
+        remaining = await incremental_vacuum(VACUUM_CHUNK_PAGES, db_engine)
+        yield f"{remaining} free pages left"
+        # Stuck: auto_vacuum is not INCREMENTAL on this file
+        if not remaining or remaining == previous:
+            return
+        previous = remaining
+
+
+async def _analyze(db_engine):
+    async with db_engine.connect() as conn:
+        tables = await conn.run_sync(lambda sync: inspect(sync).get_table_names())
+    for done, table in enumerate(tables, 1):
+        await _autocommit(db_engine, f'ANALYZE "{table}"')
+        yield f"{done}/{len(tables)} tables"
+
+
+async def _optimize(db_engine):
+    await _autocommit(db_engine, "PRAGMA optimize")
+    yield "optimized"
+
+
+class Task(NamedTuple):
+    name: str
+    steps: Callable  # async generator function taking an engine, yielding after each step
+    interval: Callable[[], int]  # seconds between runs; 0 disables the task
+    quiet_only: bool = True  # wait for a low-traffic window
+
+
+def _quiet_interval(seconds: int) -> int:
+    # DB_MAINTENANCE_INTERVAL=0 leaves only the checkpoint running
+    return seconds if db_settings.maintenance_interval else 0
+
+
+TASKS = (
+    Task("checkpoint", _checkpoint, lambda: db_settings.checkpoint_interval, quiet_only=False),
+    Task("vacuum", _vacuum, lambda: db_settings.maintenance_interval),
+    Task("analyze", _analyze, lambda: _quiet_interval(db_settings.maintenance_analyze_interval)),
+    Task("optimize", _optimize, lambda: _quiet_interval(db_settings.maintenance_optimize_interval)),
+)
+
+# "main/analyze" -> outcome of the task's latest run on that database
+task_status: dict[str, dict] = {}
+
+
+def _due(status: dict, task: Task) -> bool:
+    interval = task.interval()
+    if not interval:
+        return False
+    finished = status.get("_completed_at")
+    return finished is None or time.monotonic() - finished >= interval
+
+
+async def run_task(task: Task, db_name: str, db_engine, check_latency: bool = True) -> bool:
+    """Run one task to completion or until latency rises; returns whether it completed"""
+    status = task_status.setdefault(f"{db_name}/{task.name}",
+                                    {"runs": 0, "pauses": 0, "last_status": None, "_completed_at": None})
+    start = time.perf_counter()
+    steps, result = 0, None
+    run = task.steps(db_engine)
+    try:
+        async for result in run:
+            steps += 1
+            if check_latency and latency_high():
+                status["pauses"] += 1
+                status["last_status"] = "paused"
+                logging.info(f"Maintenance {task.name} on {db_name} paused after {steps} steps: "
+                             f"p95 request latency {recent_latency_ms():.0f} ms")
+                return False
+    except Exception:
+        status["last_status"] = "failed"
+        raise
+    finally:
+        await run.aclose()
+        status["last_run"] = datetime.now(timezone.utc).isoformat()
+        status["last_duration_ms"] = round((time.perf_counter() - start) * 1000, 2)
+        status["last_steps"] = steps
+
+    status.update(runs=status["runs"] + 1, last_status="done", last_result=result,
+                  _completed_at=time.monotonic())
+    logging.debug(f"Maintenance {task.name} on {db_name}: {result} ({status['last_duration_ms']} ms)")
+    return True
+
+
+async def run_due() -> int:
+    """One scheduler pass; returns the tasks completed. Quiet-only tasks are
+    skipped while traffic is up.
+
+    Shards are only maintained while their engine is open; a shard that has
+    not been used since it was evicted has nothing new to checkpoint or analyze.
+    """
+    completed = 0
+    shard_indexes = range(db_settings.shard_count) if shard_engines is not None else ()
+    for index in (None, *shard_indexes):
+        if index is not None and not shard_engines.is_open(index):
+            continue
+        db_name = "main" if index is None else f"shard {index}"
+        due = [task for task in TASKS if _due(task_status.get(f"{db_name}/{task.name}", {}), task)]
+        if not due:
+            continue
+        if index is None:
+            completed += await _run_tasks(due, db_name, engine)
+        else:
+            async with shard_engines.use(index) as (db_engine, _):
+                completed += await _run_tasks(due, db_name, db_engine)
+    return completed
+
+
+async def _run_tasks(due: list[Task], db_name: str, db_engine) -> int:
+    completed = 0
+    for task in due:
+        if task.quiet_only and (not is_quiet() or latency_high()):
+            continue
+        try:
+            if not await run_task(task, db_name, db_engine, check_latency=task.quiet_only):
+                continue
+        except Exception as e:
+            # Retried next pass; the other tasks still run
+            logging.error(f"Maintenance {task.name} on {db_name} failed: {str(e)}")
+            continue
+        completed += 1
+    return completed
+
+
+async def maintenance_loop(interval: int):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await run_due()
+        except Exception as e:
+            logging.error(f"Maintenance failed: {str(e)}")
+
+
+router = APIRouter()
+
+
+@router.get("/metrics/maintenance")
+async def get_maintenance_metrics():
+    """Latest outcome and duration of each maintenance task, plus the current load"""
+    latency = recent_latency_ms()
+    return {
+        "requests_per_second": round(requests_per_second(), 3),
+        "p95_latency_ms": round(latency, 2) if latency is not None else None,
+        "quiet": is_quiet(),
+        "tasks": {key: {k: v for k, v in status.items() if not k.startswith("_")}
+                  for key, status in sorted(task_status.items())},
+    }
+
+
+async def main(task_names: list[str]):
+    if not db_settings.is_sqlite:
+        sys.exit("Maintenance covers SQLite; PostgreSQL runs autovacuum and autoanalyze itself")
+    try:
+        async for db_name, db_engine in databases():
+            for task in TASKS:
+                if task.name in task_names:
+                    await run_task(task, db_name, db_engine, check_latency=False)
+                    status = task_status[f"{db_name}/{task.name}"]
+                    logging.info(f"{db_name} {task.name}: {status['last_result']} "
+                                 f"in {status['last_duration_ms']} ms")
+    finally:
+        if shard_engines is not None:
+            await shard_engines.dispose()
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run SQLite maintenance tasks now")
+    names = [task.name for task in TASKS]
+    parser.add_argument("--task", action="append", choices=names, help="task to run (repeatable; default: all)")
+    args = parser.parse_args()
+    asyncio.run(main(args.task or names))
@@ -0,0 +1,328 @@
+"""
+Versioned schema migrations for LifeCoach AI
+The schema version lives in a one-row schema_version table. Startup only reads
+that row; when it already equals the newest revision nothing else happens.
+Otherwise the pending revisions run in order, each in its own transaction,
+and the version is bumped after each one.
+
+    python migrations.py status
+    python migrations.py upgrade
+
+A database created before migrations existed (tables but no schema_version)
+is treated as revision 0 and runs every revision, starting with the baseline
+that creates whichever original tables it lacks. A brand-new database gets
+the whole current schema from the models and is stamped with the newest
+revision directly.
+
+On PostgreSQL workers serialize on an advisory lock while upgrading. SQLite
+has no equivalent, so every revision must be idempotent (IF NOT EXISTS,
+column checks) and a worker that races another one through it does no harm.
+"""
+import asyncio
+import logging
+import sys
+import os
+from typing import Callable, NamedTuple
+sys.path.append(os.path.dirname(__file__))
+
+from sqlalchemy import inspect
+
+from database import engine, db_settings, Base
+
+logging.basicConfig(level=logging.INFO)
+
+
+class Revision(NamedTuple):
+    version: int
+    description: str
+    upgrade: Callable  # upgrade(sync_connection)
+    # Non-transactional revisions run in autocommit mode, which PostgreSQL
+    # needs for CREATE INDEX CONCURRENTLY
+    transactional: bool = True
+
+
+def has_table(conn, table: str) -> bool:
+    return inspect(conn).has_table(table)
+
+
+def has_column(conn, table: str, column: str) -> bool:
+    return any(c["name"] == column for c in inspect(conn).get_columns(table))
+
+
+def add_column(conn, table: str, column: str, ddl_type: str):
+    if not has_column(conn, table, column):
+        conn.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN {column} {ddl_type}")
+
+
+def create_index_online(conn, name: str, table: str, columns: str, where: str = None):
+    """Build an index without blocking writes where the database allows it.
+
+    PostgreSQL uses CREATE INDEX CONCURRENTLY (the revision must be
+    non-transactional). SQLite has no online index build; in WAL mode readers
+    keep going and writers wait only for the build itself.
+    """
+    concurrently = "CONCURRENTLY " if conn.dialect.name == "postgresql" else ""
+    sql = f"CREATE INDEX {concurrently}IF NOT EXISTS {name} ON {table} ({columns})"
+    if where:
+        sql += f" WHERE {where}"
+    conn.exec_driver_sql(sql)
+
+
+def drop_index_online(conn, name: str):
+    concurrently = "CONCURRENTLY " if conn.dialect.name == "postgresql" else ""
+    conn.exec_driver_sql(f"DROP INDEX {concurrently}IF EXISTS {name}")
+
+
+def _baseline(conn):
+    for table in ("users", "chat_history", "journal_entries", "goals"):
+        Base.metadata.tables[table].create(conn, checkfirst=True)
+
+
+def _profile_version(conn):
+    add_column(conn, "users", "profile_version", "INTEGER DEFAULT 1")
+
+
+def _api_keys(conn):
+    Base.metadata.tables["api_keys"].create(conn, checkfirst=True)
+
+
+def _per_user_list_indexes(conn):
+    create_index_online(conn, "ix_chat_history_user_email_created_at", "chat_history", "user_email, created_at")
+    create_index_online(conn, "ix_journal_entries_user_email_created_at", "journal_entries", "user_email, created_at")
+    create_index_online(conn, "ix_goals_user_email_created_at", "goals", "user_email, created_at")
+
+
+def backfill_in_batches(conn, table: str, set_sql: str, where_sql: str, batch_size: int = 5000):
+    """UPDATE a large table in id-ordered batches, committing after each one
+
+    Run from a non-transactional revision so every batch is its own short
+    transaction and writers are never blocked for the whole backfill.
+    """
+    max_id = conn.exec_driver_sql(f"SELECT MAX(id) FROM {table}").scalar() or 0
+    for start in range(0, max_id + 1, batch_size):
+        conn.exec_driver_sql(
+            f"UPDATE {table} SET {set_sql} WHERE id >= {start} AND id < {start + batch_size} AND {where_sql}"
+        )
+
+
+def _user_id_keys(conn):
+    for table in ("chat_history", "journal_entries", "goals"):
+        add_column(conn, table, "user_id", "INTEGER REFERENCES users(id)")
+        backfill_in_batches(
+            conn, table,
+            f"user_id = (SELECT users.id FROM users WHERE users.email = {table}.user_email)",
+            "user_id IS NULL",
+        )
+        create_index_online(conn, f"ix_{table}_user_id_created_at", table, "user_id, created_at")
+
+
+def _recent_first_indexes(conn):
+    # Replaces the (key, created_at) indexes from revisions 4 and 5 and the
+    # single-column user_email indexes, which the new ones make redundant
+    for table in ("chat_history", "journal_entries", "goals"):
+        for key in ("user_email", "user_id"):
+            create_index_online(conn, f"ix_{table}_{key}_created_at_id", table, f"{key}, created_at DESC, id DESC")
+            drop_index_online(conn, f"ix_{table}_{key}_created_at")
+        drop_index_online(conn, f"ix_{table}_user_email")
+
+
+# Frozen as written for revision 7: later revisions add columns (deleted_at)
+# and tables (chat partitions) that stats.computed_stats() now reads
+_SEED_USER_STATS = """
+INSERT INTO user_stats (user_id, journal_entries, journal_week, journal_week_count, goals, goals_completed,
+                        progress_sum, messages, messages_day, messages_day_count, updated_at)
+SELECT users.id,
+       (SELECT count(*) FROM journal_entries j WHERE j.user_id = users.id),
+       :week,
+       (SELECT count(*) FROM journal_entries j WHERE j.user_id = users.id AND j.created_at >= :week_start),
+       (SELECT count(*) FROM goals g WHERE g.user_id = users.id),
+       (SELECT count(*) FROM goals g WHERE g.user_id = users.id AND g.progress >= 100),
+       (SELECT coalesce(sum(g.progress), 0) FROM goals g WHERE g.user_id = users.id),
+       (SELECT count(*) FROM chat_history c WHERE c.user_id = users.id),
+       :day,
+       (SELECT count(*) FROM chat_history c WHERE c.user_id = users.id AND c.created_at >= :day_start),
+       :now
+FROM users
+"""
+
+
+def _user_stats(conn):
+    from datetime import datetime, time, timedelta, timezone
+    from sqlalchemy import DateTime, bindparam, text
+
+    Base.metadata.tables["user_stats"].create(conn, checkfirst=True)
+    # Seed the counters for existing users; delete first so a rerun is harmless
+    conn.exec_driver_sql("DELETE FROM user_stats")
+    now = datetime.now(timezone.utc)
+    iso = now.isocalendar()
+    moments = [bindparam(name, type_=DateTime(timezone=True)) for name in ("week_start", "day_start", "now")]
+    conn.execute(text(_SEED_USER_STATS).bindparams(*moments), {
+        "week": f"{iso.year}-W{iso.week:02d}",
+        "day": now.date().isoformat(),
+        "week_start": datetime.combine((now - timedelta(days=now.weekday())).date(), time(), tzinfo=timezone.utc),
+        "day_start": datetime.combine(now.date(), time(), tzinfo=timezone.utc),
+        "now": now,
+    })
+
+
+def _soft_delete(conn):
+    for table in ("journal_entries", "goals"):
+        add_column(conn, table, "deleted_at", "TIMESTAMP WITH TIME ZONE")
+        for key in ("user_email", "user_id"):
+            create_index_online(conn, f"ix_{table}_{key}_live", table, f"{key}, created_at DESC, id DESC",
+                                where="deleted_at IS NULL")
+            drop_index_online(conn, f"ix_{table}_{key}_created_at_id")
+        create_index_online(conn, f"ix_{table}_deleted_at", table, "deleted_at", where="deleted_at IS NOT NULL")
+    if conn.dialect.name == "sqlite" and conn.exec_driver_sql("PRAGMA auto_vacuum").scalar() != 2:
+        # auto_vacuum can only change on an empty database or through a full
+        # VACUUM, which rewrites the file once; the purger needs it to give
+        # freed pages back with PRAGMA incremental_vacuum
+        logging.info("Rebuilding the database file for incremental vacuum")
+        conn.exec_driver_sql("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.exec_driver_sql("VACUUM")
+
+
+def _compressed_text(conn):
+    from compression import COMPRESSED_COLUMNS, recompress_column
+
+    Base.metadata.tables["compression_dictionaries"].create(conn, checkfirst=True)
+    if conn.dialect.name != "sqlite" or db_settings.compression == "OFF":
+        return
+    # Existing long values; new ones are compressed as they are written
+    for table, column in COMPRESSED_COLUMNS:
+        totals = recompress_column(conn, table, column)
+        if totals["rows"]:
+            logging.info(f"Compressed {totals['rows']} {table}.{column} values: "
+                         f"{totals['before']} -> {totals['after']} bytes")
+
+
+def _chat_partitions(conn):
+    from chat_partitions import move_legacy_rows
+
+    moved = move_legacy_rows(conn)
+    if moved:
+        logging.info(f"Moved {moved} chat_history rows into monthly partitions")
+
+
+REVISIONS = [
+    Revision(1, "baseline schema", _baseline),
+    Revision(2, "users.profile_version", _profile_version),
+    Revision(3, "api_keys table", _api_keys),
+    Revision(4, "per-user list indexes", _per_user_list_indexes, transactional=False),
+    Revision(5, "integer user_id keys with backfill", _user_id_keys, transactional=False),
+    Revision(6, "(key, created_at DESC, id DESC) list indexes", _recent_first_indexes, transactional=False),
+    Revision(7, "user_stats counters", _user_stats),
+    Revision(8, "soft delete for journal entries and goals", _soft_delete, transactional=False),
+    Revision(9, "compressed chat and journal text", _compressed_text, transactional=False),
+    Revision(10, "monthly chat_history partitions", _chat_partitions, transactional=False),
+]
+HEAD = REVISIONS[-1].version
+# Arbitrary application-wide key for pg_advisory_lock
+MIGRATION_LOCK_ID = 0x4C434D47
+
+
+def _create_schema(conn):
+    # Chat history partitions also live on Base.metadata; they are created per month
+    Base.metadata.create_all(conn, tables=[t for t in Base.metadata.sorted_tables if "month" not in t.info])
+
+
+async def current_version(db_engine=engine) -> int | None:
+    """Schema version, 0 for a pre-migrations database, None for an empty one"""
+    async with db_engine.connect() as conn:
+        try:
+            result = await conn.exec_driver_sql("SELECT version FROM schema_version")
+            return result.scalar()
+        except Exception:
+            await conn.rollback()
+        has_users = await conn.run_sync(lambda c: has_table(c, "users"))
+    return 0 if has_users else None
+
+
+async def _stamp(conn, version: int):
+    await conn.exec_driver_sql("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)")
+    await conn.exec_driver_sql("DELETE FROM schema_version")
+    await conn.exec_driver_sql(f"INSERT INTO schema_version (version) VALUES ({int(version)})")
+
+
+async def upgrade(db_engine=engine) -> int:
+    """Bring the schema to HEAD; returns the number of revisions applied"""
+    if await current_version(db_engine) == HEAD:
+        return 0
+    if db_engine.dialect.name != "postgresql":
+        return await _upgrade(db_engine)
+
+    async with db_engine.connect() as lock_conn:
+        # Session-level lock taken outside a transaction: CREATE INDEX
+        # CONCURRENTLY waits for every open transaction, this one included
+        lock_conn = await lock_conn.execution_options(isolation_level="AUTOCOMMIT")
+        await lock_conn.exec_driver_sql(f"SELECT pg_advisory_lock({MIGRATION_LOCK_ID})")
+        try:
+            return await _upgrade(db_engine)
+        finally:
+            await lock_conn.exec_driver_sql(f"SELECT pg_advisory_unlock({MIGRATION_LOCK_ID})")
+
+
+async def _upgrade(db_engine) -> int:
+    # Re-read under the lock: another worker may have just finished
+    version = await current_version(db_engine)
+    if version == HEAD:
+        return 0
+
+    if version is None:
+        async with db_engine.begin() as conn:
+            await conn.run_sync(_create_schema)
+            await _stamp(conn, HEAD)
+        logging.info(f"Created schema at revision {HEAD}")
+        return 0
+
+    if version == 0:
+        logging.info("Database predates migrations; applying every revision")
+
+    applied = 0
+    for revision in REVISIONS:
+        if revision.version <= version:
+            continue
+        logging.info(f"Applying revision {revision.version}: {revision.description}")
+        if revision.transactional:
+            async with db_engine.begin() as conn:
+                await conn.run_sync(revision.upgrade)
+                await _stamp(conn, revision.version)
+        else:
+            async with db_engine.connect() as conn:
+                conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+                await conn.run_sync(revision.upgrade)
+                await _stamp(conn, revision.version)
+        applied += 1
+    return applied
+
+
+async def status(db_engine=engine):
+    version = await current_version(db_engine)
+    if version is None:
+        print(f"Empty database; head is {HEAD}")
+    elif version == 0:
+        print(f"Database predates migrations; head is {HEAD}")
+    else:
+        print(f"At revision {version}; head is {HEAD}")
+    for revision in REVISIONS:
+        mark = "x" if version and revision.version <= version else " "
+        print(f"  [{mark}] {revision.version}: {revision.description}")
+
+
+async def run_command(command: str):
+    try:
+        if command == "upgrade":
+            applied = await upgrade()
+            logging.info(f"Schema is at revision {HEAD} ({applied} revisions applied)")
+        else:
+            await status()
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "status"
+    if command not in ("status", "upgrade"):
+        print("usage: python migrations.py [status|upgrade]")
+        sys.exit(2)
+    asyncio.run(run_command(command))
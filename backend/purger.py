@@ -0,0 +1,137 @@
+"""
+Background purge of soft-deleted rows for LifeCoach AI
+Deleting a journal entry or goal only stamps deleted_at, a single indexed
+UPDATE; list queries skip those rows through partial indexes. This module
+removes them for good once they are DB_PURGE_GRACE_SECONDS old:
+DB_PURGE_BATCH_SIZE rows per short transaction, with a pause between batches
+so user requests get the write lock in between. Batches go through
+submit_write, so with DB_SINGLE_WRITER they queue behind user writes. On
+SQLite the freed pages are then handed back to the filesystem with PRAGMA
+incremental_vacuum, a bounded number per pass (outside the single writer;
+it is short and waits on busy_timeout like any other writer), unless the
+maintenance scheduler runs in this process and vacuums in quiet periods.
+
+Each pass also drops the chat history partitions that fell out of
+DB_CHAT_RETENTION_MONTHS and creates next month's partition ahead of time
+(see chat_partitions.py).
+
+With DB_SHARD_COUNT set, every shard is purged the same way, one after the
+other. main.py runs purge_loop() every DB_PURGE_INTERVAL seconds. A full pass can
+also be run by hand or from cron:
+
+    python purger.py
+"""
+import asyncio
+import logging
+import sys
+import os
+from datetime import datetime, timedelta, timezone
+sys.path.append(os.path.dirname(__file__))
+
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import engine, db_settings, JournalEntry, Goal
+from writer import submit_write
+from shards import shard_engines, each_shard_engine
+import chat_partitions
+
+logging.basicConfig(level=logging.INFO)
+
+SOFT_DELETE_MODELS = (JournalEntry, Goal)
+# Pause between batches, so purging yields to foreground writes
+BATCH_PAUSE_SECONDS = 0.05
+
+
+async def purge_batch(model, cutoff: datetime, batch_size: int, db_engine=engine) -> int:
+    """Hard-delete up to batch_size rows soft-deleted before cutoff"""
+    async def remove(session):
+        doomed = (select(model.id)
+                  .where(model.deleted_at.is_not(None), model.deleted_at < cutoff)
+                  .limit(batch_size))
+        result = await session.execute(
+            delete(model).where(model.id.in_(doomed)).execution_options(synchronize_session=False)
+        )
+        return result.rowcount
+
+    if db_engine is engine:
+        return await submit_write(remove)
+    async with AsyncSession(db_engine) as session:
+        removed = await remove(session)
+        await session.commit()
+    return removed
+
+
+async def incremental_vacuum(pages: int, db_engine=engine) -> int:
+    """Return up to `pages` free pages to the filesystem; returns the pages left"""
+    async with db_engine.connect() as conn:
+        # The pragma frees one page per step and sqlite3's execute() steps
+        # once, so run it as a script, which steps it to completion
+        raw = await conn.get_raw_connection()
+        await raw.driver_connection.executescript(f"PRAGMA incremental_vacuum({int(pages)})")
+        return (await conn.exec_driver_sql("PRAGMA freelist_count")).scalar()
+
+
+async def purge(batch_size: int = None, grace_seconds: int = None, vacuum: bool = None) -> int:
+    """One pass over every soft-delete table; returns the rows removed
+
+    vacuum defaults to on unless the maintenance scheduler runs in this process.
+    """
+    batch_size = batch_size or db_settings.purge_batch_size
+    if vacuum is None:
+        vacuum = not db_settings.runs_maintenance
+    if grace_seconds is None:
+        grace_seconds = db_settings.purge_grace_seconds
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=grace_seconds)
+
+    purged = await _purge(engine, cutoff, batch_size, vacuum)
+    if shard_engines is not None:
+        async for _, shard_engine in each_shard_engine():
+            purged += await _purge(shard_engine, cutoff, batch_size, vacuum)
+    return purged
+
+
+async def _purge(db_engine, cutoff: datetime, batch_size: int, vacuum: bool) -> int:
+    purged = 0
+    for model in SOFT_DELETE_MODELS:
+        while True:
+            removed = await purge_batch(model, cutoff, batch_size, db_engine)
+            purged += removed
+            if removed < batch_size:
+                break
+            await asyncio.sleep(BATCH_PAUSE_SECONDS)
+
+    dropped = await chat_partitions.drop_expired(db_engine)
+    if dropped:
+        logging.info(f"Dropped expired chat history partitions: {', '.join(dropped)}")
+    await chat_partitions.ensure_upcoming(db_engine)
+
+    if (purged or dropped) and vacuum and db_settings.is_sqlite and db_settings.sqlite_incremental_vacuum_pages:
+        remaining = await incremental_vacuum(db_settings.sqlite_incremental_vacuum_pages, db_engine)
+        logging.debug(f"Incremental vacuum done, {remaining} free pages left")
+    return purged
+
+
+async def purge_loop(interval: int):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            purged = await purge()
+            if purged:
+                logging.info(f"Purged {purged} soft-deleted rows")
+        except Exception as e:
+            logging.error(f"Purge failed: {str(e)}")
+
+
+async def main():
+    try:
+        purged = await purge(vacuum=True)
+        logging.info(f"Purged {purged} soft-deleted rows")
+    finally:
+        if shard_engines is not None:
+            await shard_engines.dispose()
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,181 @@
+"""
+Per-user query result cache for LifeCoach AI
+The frontend fetches /journal/entries, /goals and /chat/history again on
+every tab switch, while a user writes far less often than they look. The
+list handlers pass their query to cached_json(), which keeps the encoded
+JSON body per (user, query, parameters) together with the user's version
+counter of every table the query reads. Write operations call
+bump_on_commit() with the session they write through, and the counters move
+once that session's transaction has committed (request session, single
+writer or shard session alike); an entry whose versions no longer match is
+dropped on its next lookup. A hit runs no SQL at all.
+
+Memory is bounded by DB_QUERY_CACHE_MB (least recently used entries are
+evicted first; 0 disables the cache). Counters live in this process, so with
+several workers a write is only seen at once by the worker that made it;
+DB_QUERY_CACHE_TTL caps how long the others keep serving their copy. Hits,
+misses, evictions and invalidations are served at GET /metrics/query-cache.
+"""
+import itertools
+import sys
+import os
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, NamedTuple
+sys.path.append(os.path.dirname(__file__))
+
+from fastapi import APIRouter
+from fastapi.responses import Response
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from database import db_settings
+from fast_json import FastJSONResponse, dumps
+
+# (user, table) counters kept before all of them are reset at once
+VERSIONS_MAX = 100_000
+# Key tuple, OrderedDict node and entry object, on top of the body
+ENTRY_OVERHEAD_BYTES = 256
+# session.info key of the bumps waiting for the session's commit
+PENDING_KEY = "query_cache_bumps"
+
+
+class _Entry(NamedTuple):
+    versions: tuple
+    body: bytes
+    size: int
+    stored_at: float
+
+
+# Versions come from one clock, so a reset counter never repeats a value an
+# entry was stored under; users without a counter are at _floor
+_clock = itertools.count(1)
+_floor = 0
+_versions: dict[tuple[str, str], int] = {}
+
+_entries: OrderedDict = OrderedDict()
+_bytes = 0
+counters = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0, "expirations": 0, "too_large": 0}
+
+
+def max_bytes() -> int:
+    return db_settings.query_cache_mb * 1024 * 1024
+
+
+def _current(email: str, tables: tuple) -> tuple:
+    return tuple(_versions.get((email, table), _floor) for table in tables)
+
+
+def bump(email: str, *tables: str):
+    """Move the user's counters for these tables; their changes must be committed"""
+    if len(_versions) >= VERSIONS_MAX:
+        clear()
+    version = next(_clock)
+    for table in tables:
+        _versions[(email, table)] = version
+
+
+def bump_on_commit(session, email: str, *tables: str):
+    """bump() once session's current transaction commits; nothing if it rolls back
+
+    Bumping before the commit would let a read in between store the old
+    rows under the new versions, where no later lookup would notice.
+    """
+    sync_session = getattr(session, "sync_session", session)
+    sync_session.info.setdefault(PENDING_KEY, []).append((email, tables))
+
+
+@event.listens_for(Session, "after_commit")
+def _bump_committed(session):
+    for email, tables in session.info.pop(PENDING_KEY, ()):
+        bump(email, *tables)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _forget_rolled_back(session, previous_transaction):
+    # Only the outermost transaction; a savepoint rolled back by the single
+    # writer leaves the rest of its batch to commit (an extra bump is harmless)
+    if previous_transaction.parent is None:
+        session.info.pop(PENDING_KEY, None)
+
+
+def clear():
+    """Forget every entry and counter, e.g. after rows were removed for many users"""
+    global _floor, _bytes
+    _floor = next(_clock)
+    _versions.clear()
+    _entries.clear()
+    _bytes = 0
+
+
+def _drop(key):
+    global _bytes
+    _bytes -= _entries.pop(key).size
+
+
+def _lookup(key, versions: tuple) -> bytes | None:
+    entry = _entries.get(key)
+    if entry is None:
+        return None
+    if entry.versions != versions:
+        _drop(key)
+        counters["invalidations"] += 1
+        return None
+    if db_settings.query_cache_ttl and time.monotonic() - entry.stored_at > db_settings.query_cache_ttl:
+        _drop(key)
+        counters["expirations"] += 1
+        return None
+    _entries.move_to_end(key)
+    return entry.body
+
+
+def _store(key, tables: tuple, versions: tuple, body: bytes):
+    global _bytes
+    # A write committed while the query ran: its result may already be stale
+    if _current(key[0], tables) != versions:
+        return
+    size = len(body) + ENTRY_OVERHEAD_BYTES
+    if size > max_bytes():
+        counters["too_large"] += 1
+        return
+    if key in _entries:
+        _drop(key)
+    _entries[key] = _Entry(versions, body, size, time.monotonic())
+    _bytes += size
+    while _bytes > max_bytes():
+        _drop(next(iter(_entries)))
+        counters["evictions"] += 1
+
+
+async def cached_json(email: str, name: str, tables: tuple, fetch: Callable[[], Awaitable], params: tuple = ()) -> Response:
+    """JSON response for fetch()'s content, from memory while none of tables changed for the user"""
+    if not db_settings.query_cache_mb:
+        return FastJSONResponse(await fetch())
+    key = (email, name, params)
+    versions = _current(email, tables)
+    body = _lookup(key, versions)
+    if body is not None:
+        counters["hits"] += 1
+    else:
+        counters["misses"] += 1
+        body = dumps(await fetch())
+        _store(key, tables, versions, body)
+    return Response(content=body, media_type="application/json")
+
+
+router = APIRouter()
+
+
+@router.get("/metrics/query-cache")
+async def get_query_cache_metrics():
+    """Hit ratio, size and eviction counts of the query result cache"""
+    lookups = counters["hits"] + counters["misses"]
+    return {
+        **counters,
+        "hit_ratio": round(counters["hits"] / lookups, 4) if lookups else None,
+        "entries": len(_entries),
+        "bytes": _bytes,
+        "max_bytes": max_bytes(),
+        "version_counters": len(_versions),
+    }
+
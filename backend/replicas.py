@@ -0,0 +1,174 @@
+"""
+Read/write session routing for LifeCoach AI
+Read-only handlers get their session from get_read_db (auth.py), which uses
+pick_replica(user_email) to choose a healthy replica from DATABASE_REPLICA_URLS
+round-robin and falls back to the request's primary session when none is
+usable; read_session() does the same for code outside a request. A background task checks every replica
+with SELECT 1 and, on PostgreSQL, measures replication lag; replicas that fail
+or lag more than DB_REPLICA_MAX_LAG_SECONDS are skipped until they recover.
+
+Writes always use the primary. After a user writes (mark_write), that user's
+reads stay on the primary for DB_READ_YOUR_WRITES_SECONDS so they never see
+their own change missing from a lagging replica. The worker that took the
+write remembers it in memory, and the response sets the PRIMARY_UNTIL_COOKIE
+with the deadline, so a read served by any other worker honours it too.
+Clients without a cookie jar only get the guarantee from the worker that
+took their write.
+"""
+import asyncio
+import itertools
+import logging
+import math
+import time
+from contextvars import ContextVar
+
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from database import async_session, db_settings
+from settings import engine_options
+
+# Carries the read-your-writes deadline (Unix time) to every worker
+PRIMARY_UNTIL_COOKIE = "lc_primary_until"
+# Emails of the users who wrote during the current request
+_request_writes: ContextVar[list | None] = ContextVar("request_writes", default=None)
+
+# Zero when the replica has replayed everything it received, otherwise the
+# age of the last replayed transaction
+PG_LAG_QUERY = """
+SELECT CASE
+    WHEN pg_last_wal_receive_lsn() IS NULL
+      OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+END
+"""
+
+
+class Replica:
+    def __init__(self, url: str):
+        self.url = url
+        self.engine = create_async_engine(url, **engine_options(db_settings))
+        self.sessionmaker = async_sessionmaker(self.engine, expire_on_commit=False)
+        self.healthy = True  # optimistic until the first check says otherwise
+        self.lag_seconds = 0.0
+
+    @property
+    def name(self) -> str:
+        return self.engine.url.render_as_string(hide_password=True)
+
+    async def check(self, max_lag: float):
+        try:
+            async with self.engine.connect() as conn:
+                await conn.exec_driver_sql("SELECT 1")
+                if self.engine.dialect.name == "postgresql":
+                    self.lag_seconds = float((await conn.exec_driver_sql(PG_LAG_QUERY)).scalar() or 0)
+            healthy = self.lag_seconds <= max_lag
+        except Exception as e:
+            if self.healthy:
+                logging.warning(f"Replica {self.name} failed health check: {str(e)}")
+            healthy = False
+        if healthy != self.healthy:
+            logging.info(f"Replica {self.name} is now {'healthy' if healthy else 'unhealthy'} "
+                         f"(lag {self.lag_seconds:.1f}s)")
+        self.healthy = healthy
+
+
+class ReplicaSet:
+    def __init__(self, urls: list[str], max_lag: float, stickiness_seconds: float):
+        self.replicas = [Replica(url) for url in urls]
+        self.max_lag = max_lag
+        self.stickiness_seconds = stickiness_seconds
+        self._next = itertools.count()
+        # user email -> monotonic time until which their reads go to the primary
+        self._recent_writers: dict[str, float] = {}
+
+    def mark_write(self, user_email: str):
+        if self.stickiness_seconds:
+            self._recent_writers[user_email] = time.monotonic() + self.stickiness_seconds
+
+    def _sticky(self, user_email: str) -> bool:
+        until = self._recent_writers.get(user_email)
+        if until is None:
+            return False
+        if until < time.monotonic():
+            del self._recent_writers[user_email]
+            return False
+        return True
+
+    def pick(self, user_email: str = None, primary_until: float = 0) -> Replica | None:
+        if primary_until > time.time() or (user_email and self._sticky(user_email)):
+            return None
+        healthy = [r for r in self.replicas if r.healthy]
+        if not healthy:
+            return None
+        return healthy[next(self._next) % len(healthy)]
+
+    async def health_loop(self, interval: float):
+        while True:
+            await asyncio.gather(*(r.check(self.max_lag) for r in self.replicas))
+            # Forget expired read-your-writes windows so the map stays small
+            now = time.monotonic()
+            for email in [e for e, until in self._recent_writers.items() if until < now]:
+                self._recent_writers.pop(email, None)
+            await asyncio.sleep(interval)
+
+    async def dispose(self):
+        for r in self.replicas:
+            await r.engine.dispose()
+
+
+replica_set = None
+if db_settings.replica_urls:
+    replica_set = ReplicaSet(
+        db_settings.replica_urls,
+        max_lag=db_settings.replica_max_lag_seconds,
+        stickiness_seconds=db_settings.read_your_writes_seconds,
+    )
+
+
+def mark_write(user_email: str):
+    """Record that a user just wrote, so their next reads see it"""
+    if replica_set is not None and user_email:
+        replica_set.mark_write(user_email)
+        writes = _request_writes.get()
+        if writes is not None:
+            writes.append(user_email)
+
+
+def start_request() -> list:
+    """Collect the current request's writes (called by the middleware in main.py)"""
+    writes = []
+    _request_writes.set(writes)
+    return writes
+
+
+def finish_request(response, writes: list):
+    """Set the read-your-writes cookie on the response of a request that wrote"""
+    if writes and replica_set is not None and replica_set.stickiness_seconds:
+        seconds = replica_set.stickiness_seconds
+        response.set_cookie(PRIMARY_UNTIL_COOKIE, f"{time.time() + seconds:.3f}", max_age=math.ceil(seconds),
+                            httponly=True, samesite="lax")
+
+
+def primary_until(cookies) -> float:
+    """Read-your-writes deadline from the request cookies, 0 when none applies"""
+    try:
+        until = float(cookies.get(PRIMARY_UNTIL_COOKIE, 0))
+    except ValueError:
+        return 0
+    # A forged far-future deadline would pin the client to the primary
+    if replica_set is None or until > time.time() + replica_set.stickiness_seconds:
+        return 0
+    return until
+
+
+def pick_replica(user_email: str = None, primary_until: float = 0) -> Replica | None:
+    """Healthy replica for this user's reads, or None to use the primary"""
+    return replica_set.pick(user_email, primary_until) if replica_set is not None else None
+
+
+def read_session(user_email: str = None):
+    """Session for read-only work: a healthy replica, or the primary"""
+    replica = pick_replica(user_email)
+    if replica is None:
+        return async_session()
+    return replica.sessionmaker()
@@ -0,0 +1,349 @@
+"""
+Database engine settings for LifeCoach AI
+APP_ENV selects a profile (dev, test, prod); individual DB_* variables
+override single values. Settings are validated when database.py is imported,
+so a bad value stops the server at startup instead of at the first query.
+"""
+import logging
+import os
+
+from dotenv import load_dotenv
+from typing import Literal
+
+from pydantic import BaseModel, Field, ValidationError, field_validator, model_validator
+from sqlalchemy.engine import make_url
+
+load_dotenv()
+
+PROFILES = {
+    "dev": {
+        "echo": True,
+        "pool_size": 5,
+        "max_overflow": 10,
+        "pool_recycle": -1,
+        "pool_pre_ping": False,
+        "pool_timeout": 30.0,
+        "statement_timeout_ms": 0,
+        "compiled_cache_size": 500,
+        "query_budget": 25,
+    },
+    "test": {
+        "echo": False,
+        "pool_size": 2,
+        "max_overflow": 2,
+        "pool_recycle": -1,
+        "pool_pre_ping": False,
+        "pool_timeout": 10.0,
+        "statement_timeout_ms": 0,
+        "compiled_cache_size": 100,
+        "query_budget": 25,
+    },
+    "prod": {
+        "echo": False,
+        "pool_size": 20,
+        "max_overflow": 10,
+        "pool_recycle": 1800,
+        "pool_pre_ping": True,
+        "pool_timeout": 10.0,
+        "statement_timeout_ms": 5000,
+        "compiled_cache_size": 1000,
+        "query_budget": 0,
+    },
+}
+
+# Environment variable overriding each setting
+ENV_OVERRIDES = {
+    "echo": "DB_ECHO",
+    "pool_size": "DB_POOL_SIZE",
+    "max_overflow": "DB_MAX_OVERFLOW",
+    "pool_recycle": "DB_POOL_RECYCLE",
+    "pool_pre_ping": "DB_POOL_PRE_PING",
+    "pool_timeout": "DB_POOL_TIMEOUT",
+    "statement_timeout_ms": "DB_STATEMENT_TIMEOUT_MS",
+    "compiled_cache_size": "DB_COMPILED_CACHE_SIZE",
+    "sqlite_journal_mode": "DB_SQLITE_JOURNAL_MODE",
+    "sqlite_synchronous": "DB_SQLITE_SYNCHRONOUS",
+    "sqlite_mmap_size": "DB_SQLITE_MMAP_SIZE",
+    "sqlite_cache_size": "DB_SQLITE_CACHE_SIZE",
+    "sqlite_temp_store": "DB_SQLITE_TEMP_STORE",
+    "sqlite_busy_timeout_ms": "DB_SQLITE_BUSY_TIMEOUT_MS",
+    "sqlite_wal_autocheckpoint": "DB_SQLITE_WAL_AUTOCHECKPOINT",
+    "sqlite_checkpoint_interval": "DB_SQLITE_CHECKPOINT_INTERVAL",
+    "single_writer": "DB_SINGLE_WRITER",
+    "writer_max_batch": "DB_WRITER_MAX_BATCH",
+    "pg_prepared_statement_cache_size": "DB_PG_PREPARED_STATEMENT_CACHE_SIZE",
+    "replica_urls": "DATABASE_REPLICA_URLS",
+    "replica_max_lag_seconds": "DB_REPLICA_MAX_LAG_SECONDS",
+    "replica_health_interval": "DB_REPLICA_HEALTH_INTERVAL",
+    "read_your_writes_seconds": "DB_READ_YOUR_WRITES_SECONDS",
+    "user_key": "DB_USER_KEY",
+    "query_budget": "DB_QUERY_BUDGET",
+    "n_plus_one_threshold": "DB_N_PLUS_ONE_THRESHOLD",
+    "purge_interval": "DB_PURGE_INTERVAL",
+    "purge_batch_size": "DB_PURGE_BATCH_SIZE",
+    "purge_grace_seconds": "DB_PURGE_GRACE_SECONDS",
+    "sqlite_incremental_vacuum_pages": "DB_SQLITE_INCREMENTAL_VACUUM_PAGES",
+    "shard_count": "DB_SHARD_COUNT",
+    "shard_dir": "DB_SHARD_DIR",
+    "shard_max_open": "DB_SHARD_MAX_OPEN",
+    "compression": "DB_COMPRESSION",
+    "compression_min_bytes": "DB_COMPRESSION_MIN_BYTES",
+    "compression_level": "DB_COMPRESSION_LEVEL",
+    "compression_dictionary_id": "DB_COMPRESSION_DICTIONARY_ID",
+    "chat_retention_months": "DB_CHAT_RETENTION_MONTHS",
+    "backup_interval": "DB_BACKUP_INTERVAL",
+    "backup_dir": "DB_BACKUP_DIR",
+    "backup_keep": "DB_BACKUP_KEEP",
+    "backup_pages_per_step": "DB_BACKUP_PAGES_PER_STEP",
+    "backup_step_pause_ms": "DB_BACKUP_STEP_PAUSE_MS",
+    "backup_compression": "DB_BACKUP_COMPRESSION",
+    "maintenance_interval": "DB_MAINTENANCE_INTERVAL",
+    "maintenance_quiet_rps": "DB_MAINTENANCE_QUIET_RPS",
+    "maintenance_pause_latency_ms": "DB_MAINTENANCE_PAUSE_LATENCY_MS",
+    "maintenance_optimize_interval": "DB_MAINTENANCE_OPTIMIZE_INTERVAL",
+    "maintenance_analyze_interval": "DB_MAINTENANCE_ANALYZE_INTERVAL",
+    "query_cache_mb": "DB_QUERY_CACHE_MB",
+    "query_cache_ttl": "DB_QUERY_CACHE_TTL",
+}
+
+SUPPORTED_DRIVERS = ("sqlite+aiosqlite", "postgresql+asyncpg")
+
+
+def _normalize_url(value):
+    # Hosting providers hand out postgres:// URLs; the app needs the asyncpg driver
+    if isinstance(value, str):
+        for prefix in ("postgres://", "postgresql://"):
+            if value.startswith(prefix):
+                value = "postgresql+asyncpg://" + value[len(prefix):]
+        if not value.startswith(tuple(f"{d}:" for d in SUPPORTED_DRIVERS)):
+            raise ValueError(f"database URLs must use one of {', '.join(SUPPORTED_DRIVERS)}")
+    return value
+
+
+class DatabaseSettings(BaseModel):
+    profile: str
+    url: str = Field(min_length=1)
+    echo: bool
+    pool_size: int = Field(ge=1)
+    max_overflow: int = Field(ge=0)
+    pool_recycle: int = Field(ge=-1)  # seconds, -1 keeps connections forever
+    pool_pre_ping: bool
+    pool_timeout: float = Field(gt=0)
+    statement_timeout_ms: int = Field(ge=0)  # 0 disables the timeout
+    compiled_cache_size: int = Field(ge=0)  # SQLAlchemy query_cache_size
+    # Warn when one request runs more statements than this (see sql_metrics.py); 0 disables
+    query_budget: int = Field(ge=0)
+
+    # Applied to every new SQLite connection (see database.py). WAL lets readers
+    # run while a write is in progress; NORMAL sync is durable across app crashes
+    # and only loses the last commits on power loss.
+    sqlite_journal_mode: Literal["DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF"] = "WAL"
+    sqlite_synchronous: Literal["OFF", "NORMAL", "FULL", "EXTRA"] = "NORMAL"
+    sqlite_mmap_size: int = Field(default=256 * 1024 * 1024, ge=0)  # bytes
+    sqlite_cache_size: int = -64000  # negative: KiB (64 MB), positive: pages
+    sqlite_temp_store: Literal["DEFAULT", "FILE", "MEMORY"] = "MEMORY"
+    sqlite_busy_timeout_ms: int = Field(default=5000, ge=0)
+    sqlite_wal_autocheckpoint: int = Field(default=1000, ge=0)  # pages, 0 disables
+    sqlite_checkpoint_interval: int = Field(default=60, ge=0)  # seconds, 0 disables
+
+    # Route all writes through one writer task that group-commits them (see writer.py)
+    single_writer: bool = False
+    writer_max_batch: int = Field(default=256, ge=1)
+
+    # asyncpg prepares each distinct statement once per connection and reuses it
+    pg_prepared_statement_cache_size: int = Field(default=500, ge=0)
+
+    # Read replicas for read-only handlers (see replicas.py)
+    replica_urls: list[str] = []
+    replica_max_lag_seconds: float = Field(default=5.0, ge=0)
+    replica_health_interval: float = Field(default=10.0, gt=0)
+    # After a user writes, their reads stay on the primary for this long
+    read_your_writes_seconds: float = Field(default=5.0, ge=0)
+
+    # Column that per-user queries filter on. Rows carry both user_email and
+    # user_id while the integer key rolls out; switch to "id" once the
+    # backfill migration has run everywhere.
+    user_key: Literal["email", "id"] = "email"
+
+    # Warn when one request runs the same statement this many times; 0 disables
+    n_plus_one_threshold: int = Field(default=10, ge=0)
+
+    # Hard delete of soft-deleted rows in the background (see purger.py)
+    purge_interval: int = Field(default=300, ge=0)  # seconds, 0 disables
+    purge_batch_size: int = Field(default=500, ge=1)  # rows per transaction
+    purge_grace_seconds: int = Field(default=3600, ge=0)  # soft-deleted rows are kept this long
+    sqlite_incremental_vacuum_pages: int = Field(default=1000, ge=0)  # freed pages returned per pass, 0 disables
+
+    # Per-user tables split across this many SQLite files by a hash of the
+    # user id (see shards.py); 0 keeps everything in DATABASE_URL
+    shard_count: int = Field(default=0, ge=0, le=4096)
+    shard_dir: str = "./shards"
+    shard_max_open: int = Field(default=16, ge=1)  # shard engines kept open (LRU)
+
+    # Chat messages/responses and journal content at least compression_min_bytes
+    # long are stored compressed on SQLite (see compression.py); existing
+    # compressed rows stay readable whatever these are set to
+    compression: Literal["OFF", "ZLIB", "ZSTD"] = "ZLIB"
+    compression_min_bytes: int = Field(default=512, ge=1)
+    compression_level: int | None = None  # None: zlib 6, zstd 3
+    compression_dictionary_id: int = Field(default=0, ge=0)  # zstd dictionary to compress with, 0: none
+
+    # Chat history is stored in monthly partitions (see chat_partitions.py);
+    # the current month and this many before it are kept, 0 keeps everything
+    chat_retention_months: int = Field(default=0, ge=0)
+
+    # Online snapshots of the SQLite files (see backup.py), copied a few pages
+    # at a time with a pause in between so writers keep the lock
+    backup_interval: int = Field(default=0, ge=0)  # seconds, 0 disables
+    backup_dir: str = "./backups"
+    backup_keep: int = Field(default=7, ge=1)  # snapshots kept per database file
+    backup_pages_per_step: int = Field(default=1000, ge=1)
+    backup_step_pause_ms: int = Field(default=20, ge=0)
+    backup_compression: Literal["OFF", "GZIP", "ZSTD"] = "GZIP"
+
+    # SQLite upkeep (see maintenance.py): every maintenance_interval seconds the
+    # due tasks run, but only while the API serves at most maintenance_quiet_rps
+    # requests/s, and a task pauses when recent request latency goes above
+    # maintenance_pause_latency_ms. WAL checkpoints follow
+    # sqlite_checkpoint_interval on their own.
+    maintenance_interval: int = Field(default=60, ge=0)  # seconds, 0 disables all but checkpoints
+    maintenance_quiet_rps: float = Field(default=1.0, ge=0)
+    maintenance_pause_latency_ms: float = Field(default=250.0, gt=0)  # p95 over the last few seconds
+    maintenance_optimize_interval: int = Field(default=3600, ge=0)  # seconds between PRAGMA optimize runs, 0 disables
+    maintenance_analyze_interval: int = Field(default=86400, ge=0)  # seconds between full ANALYZE runs, 0 disables
+
+    # Per-user list responses kept in memory (see query_cache.py); writes in
+    # this process invalidate them at once, query_cache_ttl bounds how long
+    # another worker's writes can go unseen
+    query_cache_mb: int = Field(default=64, ge=0)  # 0 disables
+    query_cache_ttl: int = Field(default=60, ge=0)  # seconds, 0 keeps entries until a write or eviction
+
+    @field_validator("url", mode="before")
+    @classmethod
+    def _async_driver(cls, value):
+        return _normalize_url(value)
+
+    @field_validator("replica_urls", mode="before")
+    @classmethod
+    def _replica_list(cls, value):
+        if isinstance(value, str):
+            value = [u.strip() for u in value.split(",") if u.strip()]
+        return [_normalize_url(u) for u in value]
+
+    @field_validator("sqlite_journal_mode", "sqlite_synchronous", "sqlite_temp_store", "compression",
+                     "backup_compression", mode="before")
+    @classmethod
+    def _upper(cls, value):
+        return value.upper() if isinstance(value, str) else value
+
+    @model_validator(mode="after")
+    def _sharding_supported(self):
+        if self.shard_count and not self.is_sqlite:
+            raise ValueError("DB_SHARD_COUNT is only supported with SQLite")
+        if self.shard_count and self.single_writer:
+            # The writer task commits to DATABASE_URL only
+            raise ValueError("DB_SHARD_COUNT and DB_SINGLE_WRITER cannot be combined")
+        return self
+
+    @model_validator(mode="after")
+    def _backups_need_sqlite_file(self):
+        if self.backup_interval and (not self.is_sqlite or self.is_memory_sqlite):
+            raise ValueError("DB_BACKUP_INTERVAL needs a SQLite database file; use pg_dump for PostgreSQL")
+        return self
+
+    @model_validator(mode="after")
+    def _dictionary_needs_zstd(self):
+        if self.compression_dictionary_id and self.compression != "ZSTD":
+            raise ValueError("DB_COMPRESSION_DICTIONARY_ID requires DB_COMPRESSION=zstd")
+        return self
+
+    @property
+    def is_sqlite(self) -> bool:
+        return self.url.startswith("sqlite")
+
+    @property
+    def is_postgres(self) -> bool:
+        return self.url.startswith("postgresql")
+
+    @property
+    def runs_maintenance(self) -> bool:
+        """Whether the scheduler vacuums, analyzes and optimizes (maintenance.py);
+        the purger vacuums after itself otherwise"""
+        return self.is_sqlite and self.maintenance_interval > 0
+
+    @property
+    def checkpoint_interval(self) -> int:
+        """Seconds between the scheduler's WAL checkpoints, 0 for none"""
+        return self.sqlite_checkpoint_interval if self.is_sqlite and self.sqlite_journal_mode == "WAL" else 0
+
+    @property
+    def scheduler_interval(self) -> int:
+        """Seconds between maintenance scheduler passes, 0 when it does not run"""
+        intervals = [i for i in (self.checkpoint_interval, self.maintenance_interval if self.is_sqlite else 0) if i]
+        return min(intervals, default=0)
+
+    @property
+    def is_memory_sqlite(self) -> bool:
+        return self.is_sqlite and make_url(self.url).database in (None, "", ":memory:")
+
+
+def load_database_settings() -> DatabaseSettings:
+    profile = os.getenv("APP_ENV", "dev")
+    if profile not in PROFILES:
+        raise ValueError(f"APP_ENV must be one of {', '.join(PROFILES)}, got {profile!r}")
+
+    values = dict(PROFILES[profile])
+    for name, env_var in ENV_OVERRIDES.items():
+        raw = os.getenv(env_var)
+        if raw not in (None, ""):
+            values[name] = raw
+    values["url"] = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./lifecoach.db")
+
+    try:
+        return DatabaseSettings(profile=profile, **values)
+    except ValidationError as e:
+        raise ValueError(f"Invalid database settings for profile {profile!r}: {e}") from e
+
+
+def sqlite_pragmas(settings: DatabaseSettings) -> list[str]:
+    """PRAGMA statements to run on each new SQLite connection"""
+    return [
+        # First, so the pragmas below wait for a concurrent writer too
+        f"PRAGMA busy_timeout={settings.sqlite_busy_timeout_ms}",
+        # Only takes effect on a new database; migrations.py converts old ones
+        "PRAGMA auto_vacuum=INCREMENTAL",
+        f"PRAGMA journal_mode={settings.sqlite_journal_mode}",
+        f"PRAGMA synchronous={settings.sqlite_synchronous}",
+        f"PRAGMA mmap_size={settings.sqlite_mmap_size}",
+        f"PRAGMA cache_size={settings.sqlite_cache_size}",
+        f"PRAGMA temp_store={settings.sqlite_temp_store}",
+        f"PRAGMA wal_autocheckpoint={settings.sqlite_wal_autocheckpoint}",
+    ]
+
+
+def engine_options(settings: DatabaseSettings) -> dict:
+    """Keyword arguments for create_async_engine"""
+    options = {
+        "echo": settings.echo,
+        "query_cache_size": settings.compiled_cache_size,
+    }
+    # In-memory SQLite uses a single static connection; pool settings do not apply
+    if not settings.is_memory_sqlite:
+        options.update(
+            pool_size=settings.pool_size,
+            max_overflow=settings.max_overflow,
+            pool_recycle=settings.pool_recycle,
+            pool_pre_ping=settings.pool_pre_ping,
+            pool_timeout=settings.pool_timeout,
+        )
+    if settings.is_postgres:
+        server_settings = {"application_name": "lifecoach"}
+        if settings.statement_timeout_ms:
+            server_settings["statement_timeout"] = str(settings.statement_timeout_ms)
+        options["connect_args"] = {
+            "prepared_statement_cache_size": settings.pg_prepared_statement_cache_size,
+            "server_settings": server_settings,
+        }
+    elif settings.statement_timeout_ms:
+        logging.warning("statement_timeout_ms is not supported for SQLite; ignoring it")
+    return options
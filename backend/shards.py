@@ -0,0 +1,358 @@
+"""
+Per-user SQLite sharding for LifeCoach AI
+SQLite takes one writer per file, so with DB_SHARD_COUNT > 0 the per-user
+tables (chat history, journal entries, goals, user_stats) live in that many
+files under DB_SHARD_DIR instead of DATABASE_URL, and writes of users on
+different shards commit in parallel. Accounts (users, api_keys) stay in
+DATABASE_URL, which acts as the directory.
+
+A user's shard is jump_hash(user id, DB_SHARD_COUNT). Jump consistent hashing
+needs no lookup table, and growing from N to N+1 shards moves only about
+1/(N+1) of the users. Each shard file has the full schema (migrations.py
+creates or upgrades it when it is first opened) and a copy of the users row
+of every user it holds, so owner_id() and stats reconciliation work inside
+one shard. At most DB_SHARD_MAX_OPEN shard engines stay open; the least
+recently used one is evicted when another is needed, and disposed once the
+requests and jobs still using it are done.
+
+Handlers get the user's shard session from get_user_db / get_read_db
+(auth.py). Sharding cannot be combined with DB_SINGLE_WRITER.
+
+Admin commands:
+
+    python shards.py status
+    python shards.py fanout "SELECT COUNT(*) FROM journal_entries"
+    python shards.py rebalance --from 0 --to 4     # split DATABASE_URL into 4 shards
+    python shards.py rebalance --from 4 --to 6
+
+Rebalancing copies each moving user's rows to the new shard, then deletes
+them from the old one, one user per transaction; rerunning it after a crash
+is safe. Run it with the API stopped and restart with the new DB_SHARD_COUNT.
+Row ids are kept unless the target shard already uses one; those rows get a
+new id (and a new URL in the API), which the command reports.
+"""
+import argparse
+import asyncio
+import logging
+import sys
+import os
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+sys.path.append(os.path.dirname(__file__))
+
+from sqlalchemy import delete, event, func, insert, select, text
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from database import engine, db_settings, apply_sqlite_pragmas, load_compression_dictionaries, Base, User
+from migrations import upgrade
+import chat_partitions
+from settings import engine_options
+import sql_metrics
+
+logging.basicConfig(level=logging.INFO)
+
+SHARDED_TABLES = ("chat_history", "journal_entries", "goals", "user_stats")
+MIRRORED_USERS_MAX = 100_000
+
+
+def jump_hash(key: int, buckets: int) -> int:
+    """Jump consistent hash (Lamping and Veach, 2014): key -> [0, buckets)"""
+    b, j = -1, 0
+    key &= 0xFFFFFFFFFFFFFFFF
+    while j < buckets:
+        b = j
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        j = int((b + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return b
+
+
+def shard_of(user_id: int, shard_count: int = None) -> int:
+    return jump_hash(user_id, shard_count or db_settings.shard_count)
+
+
+class ShardEngines:
+    """Engines for the shard files, at most max_open of them open at once
+
+    Callers hold an engine with use(); an evicted engine that is still held
+    is only disposed when its last user leaves.
+    """
+
+    def __init__(self, directory: str, max_open: int):
+        self.directory = directory
+        self.max_open = max_open
+        self._open: OrderedDict[int, tuple] = OrderedDict()
+        self._lock = asyncio.Lock()
+        # engine -> number of use() blocks holding it
+        self._users: dict = {}
+        # Evicted engines waiting for their users to leave
+        self._retired: set = set()
+        self.opened = 0
+        self.evicted = 0
+
+    def path(self, index: int) -> str:
+        return os.path.join(self.directory, f"shard_{index:03d}.db")
+
+    def is_open(self, index: int) -> bool:
+        return index in self._open
+
+    @asynccontextmanager
+    async def use(self, index: int):
+        """(engine, sessionmaker) for a shard, opening it if needed; the
+        engine is not disposed before the block exits"""
+        entry = self._open.get(index)
+        if entry is None:
+            async with self._lock:
+                entry = self._open.get(index) or await self._open_shard(index)
+        self._open.move_to_end(index)
+        shard_engine = entry[0]
+        self._users[shard_engine] = self._users.get(shard_engine, 0) + 1
+        try:
+            yield entry
+        finally:
+            self._users[shard_engine] -= 1
+            if not self._users[shard_engine]:
+                del self._users[shard_engine]
+                if shard_engine in self._retired:
+                    self._retired.discard(shard_engine)
+                    await shard_engine.dispose()
+
+    async def _open_shard(self, index: int):
+        os.makedirs(self.directory, exist_ok=True)
+        shard_engine = create_async_engine(f"sqlite+aiosqlite:///{self.path(index)}", **engine_options(db_settings))
+        event.listen(shard_engine.sync_engine, "connect", apply_sqlite_pragmas)
+        sql_metrics.instrument(shard_engine)
+        await upgrade(shard_engine)
+        await chat_partitions.ensure_upcoming(shard_engine)
+
+        entry = (shard_engine, async_sessionmaker(shard_engine, expire_on_commit=False))
+        self._open[index] = entry
+        self.opened += 1
+        while len(self._open) > self.max_open:
+            _, (old_engine, _) = self._open.popitem(last=False)
+            if old_engine in self._users:
+                self._retired.add(old_engine)
+            else:
+                await old_engine.dispose()
+            self.evicted += 1
+        return entry
+
+    async def dispose(self):
+        while self._open:
+            _, (shard_engine, _) = self._open.popitem()
+            await shard_engine.dispose()
+        while self._retired:
+            await self._retired.pop().dispose()
+
+
+shard_engines = None
+if db_settings.shard_count:
+    shard_engines = ShardEngines(db_settings.shard_dir, db_settings.shard_max_open)
+
+# (shard, user id) pairs whose users row is known to exist on the shard
+_mirrored_users: OrderedDict[tuple, None] = OrderedDict()
+
+
+def _user_row(user_id: int, email: str):
+    """Upsert of the users row a shard keeps for each of its users"""
+    return (sqlite.insert(User).values(id=user_id, email=email)
+            .on_conflict_do_update(index_elements=["id"], set_={"email": email}))
+
+
+@asynccontextmanager
+async def user_session(user_id: int, email: str):
+    """Unit of work on the user's shard, committed on exit like get_db"""
+    index = shard_of(user_id)
+    async with shard_engines.use(index) as (_, sessionmaker):
+        key = (index, user_id)
+        if key not in _mirrored_users:
+            # Its own short transaction, so a slow handler does not hold the
+            # shard's write lock from the start
+            async with sessionmaker() as session:
+                await session.execute(_user_row(user_id, email))
+                await session.commit()
+        _mirrored_users[key] = None
+        _mirrored_users.move_to_end(key)
+        if len(_mirrored_users) > MIRRORED_USERS_MAX:
+            _mirrored_users.popitem(last=False)
+
+        async with sessionmaker() as session:
+            try:
+                yield session
+                await session.commit()
+            except Exception:
+                await session.rollback()
+                raise
+
+
+async def each_shard_engine(engines: ShardEngines = None):
+    """Yield (index, engine) for every shard, one at a time"""
+    engines = engines or shard_engines
+    for index in range(db_settings.shard_count):
+        async with engines.use(index) as (shard_engine, _):
+            yield index, shard_engine
+
+
+async def databases():
+    """Yield (name, engine) for DATABASE_URL and every shard"""
+    yield "main", engine
+    if shard_engines is not None:
+        async for index, shard_engine in each_shard_engine():
+            yield f"shard {index}", shard_engine
+
+
+async def fanout(sql: str, engines: ShardEngines = None) -> list[tuple[int, list]]:
+    """Run one statement on every shard; returns [(shard, rows)]"""
+    results = []
+    async for index, shard_engine in each_shard_engine(engines):
+        async with shard_engine.connect() as conn:
+            result = await conn.execute(text(sql))
+            results.append((index, result.all() if result.returns_rows else []))
+    return results
+
+
+def _table(name: str):
+    return Base.metadata.tables[name]
+
+
+async def _user_tables(conn) -> list:
+    """SHARDED_TABLES plus the chat history partitions present on a database"""
+    return [_table(name) for name in SHARDED_TABLES] + await chat_partitions.all_partitions(conn)
+
+
+async def _copy_user(user_id: int, email: str, source, target, target_is_shard: bool) -> int:
+    """Copy one user's rows from source to target; returns how many got new ids"""
+    async with source.connect() as conn:
+        data = {
+            table: [dict(row) for row in (await conn.execute(
+                select(table).where(table.c.user_id == user_id))).mappings()]
+            for table in await _user_tables(conn)
+        }
+
+    renumbered = 0
+    async with target.begin() as conn:
+        if target_is_shard:
+            await conn.execute(_user_row(user_id, email))
+        for table, rows in data.items():
+            if "month" in table.info:
+                await conn.run_sync(chat_partitions.create_partition, table.info["month"])
+            # Leftovers of an interrupted earlier run
+            await conn.execute(delete(table).where(table.c.user_id == user_id))
+            if not rows:
+                continue
+            fresh = []
+            if "id" in table.c:
+                ids = [row["id"] for row in rows]
+                taken = set((await conn.execute(select(table.c.id).where(table.c.id.in_(ids)))).scalars())
+                fresh = [{k: v for k, v in row.items() if k != "id"} for row in rows if row["id"] in taken]
+                rows = [row for row in rows if row["id"] not in taken]
+            if rows:
+                await conn.execute(insert(table), rows)
+            if fresh:
+                # After the rows that keep their ids, so new ids cannot take those
+                await conn.execute(insert(table), fresh)
+                renumbered += len(fresh)
+    return renumbered
+
+
+async def _remove_user(user_id: int, source, source_is_shard: bool):
+    async with source.begin() as conn:
+        for table in await _user_tables(conn):
+            await conn.execute(delete(table).where(table.c.user_id == user_id))
+        if source_is_shard:
+            await conn.execute(delete(User).where(User.id == user_id))
+
+
+async def rebalance(old_count: int, new_count: int, dry_run: bool = False) -> dict:
+    """Move users whose shard differs between the two layouts (0 = DATABASE_URL)"""
+    engines = ShardEngines(db_settings.shard_dir, max(db_settings.shard_max_open, 2))
+
+    @asynccontextmanager
+    async def locate(user_id: int, count: int):
+        if count == 0:
+            yield engine, False
+            return
+        async with engines.use(jump_hash(user_id, count)) as (shard_engine, _):
+            yield shard_engine, True
+
+    async with engine.connect() as conn:
+        users = (await conn.execute(select(User.id, User.email).order_by(User.id))).all()
+
+    moves = {}
+    renumbered = 0
+    try:
+        for user_id, email in users:
+            source_index = jump_hash(user_id, old_count) if old_count else None
+            target_index = jump_hash(user_id, new_count) if new_count else None
+            if source_index == target_index:
+                continue
+            moves[(source_index, target_index)] = moves.get((source_index, target_index), 0) + 1
+            if dry_run:
+                continue
+            async with locate(user_id, old_count) as (source, source_is_shard), \
+                    locate(user_id, new_count) as (target, target_is_shard):
+                renumbered += await _copy_user(user_id, email, source, target, target_is_shard)
+                await _remove_user(user_id, source, source_is_shard)
+    finally:
+        await engines.dispose()
+    return {"users": len(users), "moved": sum(moves.values()), "moves": moves, "renumbered": renumbered}
+
+
+async def shard_status() -> list[dict]:
+    rows = []
+    async for index, shard_engine in each_shard_engine():
+        async with shard_engine.connect() as conn:
+            counts = {name: (await conn.execute(select(func.count()).select_from(_table(name)))).scalar()
+                      for name in ("users",) + SHARDED_TABLES}
+            for table in await chat_partitions.all_partitions(conn):
+                counts["chat_history"] += (await conn.execute(select(func.count()).select_from(table))).scalar()
+        path = shard_engines.path(index)
+        rows.append({"shard": index, "size_mb": round(os.path.getsize(path) / 1e6, 2), **counts})
+    return rows
+
+
+def _name(index) -> str:
+    return "DATABASE_URL" if index is None else f"shard {index}"
+
+
+async def run_command(args):
+    try:
+        if args.command == "rebalance":
+            # Moving rows decompresses and recompresses their text
+            await load_compression_dictionaries()
+            summary = await rebalance(args.old_count, args.new_count, args.dry_run)
+            for (source, target), count in sorted(summary["moves"].items(), key=str):
+                print(f"{_name(source)} -> {_name(target)}: {count} users")
+            verb = "would move" if args.dry_run else "moved"
+            print(f"{verb} {summary['moved']} of {summary['users']} users; "
+                  f"{summary['renumbered']} rows got new ids")
+            return
+
+        if shard_engines is None:
+            sys.exit("Sharding is off; set DB_SHARD_COUNT")
+        if args.command == "status":
+            for row in await shard_status():
+                print("  ".join(f"{k}={v}" for k, v in row.items()))
+        elif args.command == "fanout":
+            for index, rows in await fanout(args.sql):
+                for row in rows:
+                    print(index, *row, sep="\t")
+    finally:
+        if shard_engines is not None:
+            await shard_engines.dispose()
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect and rebalance SQLite shards")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("status", help="row counts and file size per shard")
+    fanout_parser = commands.add_parser("fanout", help="run one SQL statement on every shard")
+    fanout_parser.add_argument("sql")
+    rebalance_parser = commands.add_parser("rebalance", help="move users between shard layouts")
+    rebalance_parser.add_argument("--from", dest="old_count", type=int, required=True,
+                                  help="current shard count (0: everything in DATABASE_URL)")
+    rebalance_parser.add_argument("--to", dest="new_count", type=int, required=True,
+                                  help="new shard count (0: back into DATABASE_URL)")
+    rebalance_parser.add_argument("--dry-run", action="store_true")
+    asyncio.run(run_command(parser.parse_args()))
@@ -0,0 +1,152 @@
+"""
+Per-request SQL instrumentation for LifeCoach AI
+Cursor events on the engine add every statement's count and duration to the
+stats of the request being served (held in a contextvar). The middleware in
+main.py reports them in a Server-Timing header and folds them into
+per-endpoint totals served at GET /metrics/sql.
+
+A request that runs more than DB_QUERY_BUDGET statements, or the same
+statement DB_N_PLUS_ONE_THRESHOLD times or more (the usual shape of an N+1
+loop), emits a QueryBudgetWarning. Tests can turn these into failures with
+`python -W error::sql_metrics.QueryBudgetWarning ...` or pytest's -W option.
+
+Writes that go through the single writer (writer.py) run in the writer task
+and are not attributed to the request that queued them.
+"""
+import logging
+import time
+import warnings
+from collections import Counter
+from contextvars import ContextVar
+
+from fastapi import APIRouter
+from sqlalchemy import event
+
+from database import db_settings
+
+# Statements longer than this are cut in the metrics output
+STATEMENT_PREVIEW_CHARS = 200
+
+
+class QueryBudgetWarning(UserWarning):
+    """An endpoint ran more statements than its budget allows"""
+
+
+class RequestStats:
+    __slots__ = ("queries", "db_seconds", "slowest_seconds", "slowest_statement", "statements")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.slowest_seconds = 0.0
+        self.slowest_statement = None
+        self.statements = Counter()
+
+    def record(self, statement: str, seconds: float):
+        self.queries += 1
+        self.db_seconds += seconds
+        self.statements[statement] += 1
+        if seconds > self.slowest_seconds:
+            self.slowest_seconds = seconds
+            self.slowest_statement = statement
+
+    def server_timing(self) -> str:
+        return f'db;dur={self.db_seconds * 1000:.1f};desc="{self.queries} queries"'
+
+
+_current: ContextVar[RequestStats | None] = ContextVar("sql_request_stats", default=None)
+
+# endpoint ("GET /goals") -> running totals
+endpoint_metrics: dict[str, dict] = {}
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    if stats is None:
+        return
+    starts = conn.info.get("query_start")
+    if starts:
+        stats.record(statement, time.perf_counter() - starts.pop())
+
+
+def instrument(engine):
+    """Attach the cursor hooks to an AsyncEngine (or a sync Engine)"""
+    target = getattr(engine, "sync_engine", engine)
+    event.listen(target, "before_cursor_execute", _before_cursor_execute)
+    event.listen(target, "after_cursor_execute", _after_cursor_execute)
+
+
+def endpoint_name(scope: dict) -> str | None:
+    """"GET /journal/entries/{entry_id}" for API routes, None for anything else
+
+    Built from the concrete path rather than route.path, which leaves out
+    the prefix of an included router (/auth).
+    """
+    route = scope.get("route")
+    if route is None or not hasattr(route, "methods"):
+        return None
+    path = scope["path"]
+    for name, value in scope.get("path_params", {}).items():
+        head, sep, tail = path.rpartition(f"/{value}")
+        if sep:
+            path = f"{head}/{{{name}}}{tail}"
+    return f"{scope['method']} {path}"
+
+
+def start_request() -> RequestStats:
+    stats = RequestStats()
+    _current.set(stats)
+    return stats
+
+
+def finish_request(endpoint: str, stats: RequestStats):
+    """Fold one request into the endpoint totals and check its budget"""
+    totals = endpoint_metrics.setdefault(endpoint, {
+        "requests": 0, "queries": 0, "db_ms": 0.0, "max_queries": 0,
+        "slowest_ms": 0.0, "slowest_statement": None,
+    })
+    totals["requests"] += 1
+    totals["queries"] += stats.queries
+    totals["db_ms"] += stats.db_seconds * 1000
+    totals["max_queries"] = max(totals["max_queries"], stats.queries)
+    if stats.slowest_seconds * 1000 > totals["slowest_ms"]:
+        totals["slowest_ms"] = stats.slowest_seconds * 1000
+        totals["slowest_statement"] = stats.slowest_statement[:STATEMENT_PREVIEW_CHARS]
+
+    budget = db_settings.query_budget
+    if budget and stats.queries > budget:
+        _warn(f"{endpoint} ran {stats.queries} SQL statements (budget {budget})")
+    threshold = db_settings.n_plus_one_threshold
+    if threshold:
+        statement, count = stats.statements.most_common(1)[0] if stats.statements else (None, 0)
+        if count >= threshold:
+            _warn(f"{endpoint} ran the same statement {count} times, likely an N+1 query: "
+                  f"{statement[:STATEMENT_PREVIEW_CHARS]}")
+
+
+def _warn(message: str):
+    logging.warning(message)
+    warnings.warn(message, QueryBudgetWarning, stacklevel=3)
+
+
+router = APIRouter()
+
+
+@router.get("/metrics/sql")
+async def get_sql_metrics():
+    """Per-endpoint query counts and database time since startup"""
+    return {
+        endpoint: {
+            **totals,
+            "db_ms": round(totals["db_ms"], 3),
+            "slowest_ms": round(totals["slowest_ms"], 3),
+            "avg_queries": round(totals["queries"] / totals["requests"], 2),
+            "avg_db_ms": round(totals["db_ms"] / totals["requests"], 3),
+        }
+        for endpoint, totals in sorted(endpoint_metrics.items())
+    }
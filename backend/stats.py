@@ -0,0 +1,248 @@
+"""
+Per-user dashboard statistics for LifeCoach AI
+GET /stats answers from one user_stats row instead of counting chat history,
+journal entries and goals on every page view. The journal, goals and chat
+write paths call update_stats() in the same transaction as their own change,
+so the counters move together with the rows they count.
+
+Weekly and daily counts are bucketed: the row remembers which ISO week
+(journal) and UTC day (messages) its count belongs to, and a count from an
+earlier bucket reads as zero and restarts at the next write.
+
+Counters can still drift (manual SQL, a crash between deploys, rows written
+by older code), so a nightly job recomputes them from the source tables:
+
+    python stats.py reconcile
+"""
+import argparse
+import asyncio
+import logging
+import sys
+import os
+from datetime import datetime, time, timedelta, timezone
+sys.path.append(os.path.dirname(__file__))
+
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import DateTime, case, delete, exists, func, literal, select, true, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from auth import get_current_claims, TokenClaims, ReadDbSession
+from database import engine, Goal, JournalEntry, User, UserStats, owned_by, owner_id
+from shards import shard_engines, each_shard_engine
+import chat_partitions
+
+logging.basicConfig(level=logging.INFO)
+
+COMPLETED_PROGRESS = 100
+STAT_COLUMNS = [
+    "user_id", "journal_entries", "journal_week", "journal_week_count", "goals", "goals_completed",
+    "progress_sum", "messages", "messages_day", "messages_day_count", "updated_at",
+]
+
+
+def week_key(moment: datetime) -> str:
+    iso = moment.isocalendar()
+    return f"{iso.year}-W{iso.week:02d}"
+
+
+def day_key(moment: datetime) -> str:
+    return moment.date().isoformat()
+
+
+def _as_utc(moment: datetime) -> datetime:
+    # SQLite hands back naive datetimes; everything is stored in UTC
+    return moment if moment.tzinfo else moment.replace(tzinfo=timezone.utc)
+
+
+def upsert(dialect_name: str):
+    if dialect_name == "sqlite":
+        return sqlite.insert(UserStats)
+    if dialect_name == "postgresql":
+        return postgresql.insert(UserStats)
+    raise RuntimeError(f"user_stats does not support the {dialect_name} dialect")
+
+
+async def update_stats(session, email: str, user_id: int | None, *, journal: int = 0,
+                       journal_created_at: datetime = None, goals: int = 0, completed: int = 0,
+                       progress: int = 0, messages: int = 0):
+    """Apply counter deltas to the user's row in the caller's transaction
+
+    journal_created_at is the creation time of the entry being added or
+    removed; it only changes this week's count if it falls in this week.
+    """
+    now = datetime.now(timezone.utc)
+    week, day = week_key(now), day_key(now)
+    week_delta = journal if journal and week_key(_as_utc(journal_created_at or now)) == week else 0
+    t = UserStats.__table__
+
+    stmt = upsert(engine.dialect.name).values(
+        user_id=owner_id(email, user_id),
+        journal_entries=max(journal, 0),
+        journal_week=week,
+        journal_week_count=max(week_delta, 0),
+        goals=max(goals, 0),
+        goals_completed=max(completed, 0),
+        progress_sum=max(progress, 0),
+        messages=max(messages, 0),
+        messages_day=day,
+        messages_day_count=max(messages, 0),
+        updated_at=now,
+    )
+    stmt = stmt.on_conflict_do_update(index_elements=["user_id"], set_={
+        "journal_entries": t.c.journal_entries + journal,
+        "journal_week": week,
+        "journal_week_count": case((t.c.journal_week == week, t.c.journal_week_count + week_delta),
+                                   else_=max(week_delta, 0)),
+        "goals": t.c.goals + goals,
+        "goals_completed": t.c.goals_completed + completed,
+        "progress_sum": t.c.progress_sum + progress,
+        "messages": t.c.messages + messages,
+        "messages_day": day,
+        "messages_day_count": case((t.c.messages_day == day, t.c.messages_day_count + messages),
+                                   else_=max(messages, 0)),
+        "updated_at": now,
+    })
+    await session.execute(stmt)
+
+
+async def update_progress_stats(session, email: str, user_id: int | None, goal_id: int, progress: int):
+    """Move progress_sum and goals_completed for a goal about to get `progress`
+
+    Run it before the goal's own UPDATE: the old progress is read inside this
+    statement, so the goal does not have to be loaded first. Nothing changes
+    if the goal does not exist or belongs to someone else.
+    """
+    goal = (Goal.id == goal_id, owned_by(Goal, email, user_id), Goal.deleted_at.is_(None))
+    old = select(func.coalesce(Goal.progress, 0)).where(*goal).scalar_subquery()
+    t = UserStats.__table__
+    await session.execute(
+        update(t)
+        .where(t.c.user_id == owner_id(email, user_id), exists().where(*goal))
+        .values(
+            progress_sum=t.c.progress_sum + (progress - old),
+            goals_completed=t.c.goals_completed + int(is_completed(progress))
+            - case((old >= COMPLETED_PROGRESS, 1), else_=0),
+            updated_at=datetime.now(timezone.utc),
+        )
+    )
+
+
+def is_completed(progress: int | None) -> bool:
+    return (progress or 0) >= COMPLETED_PROGRESS
+
+
+def computed_stats(now: datetime, chat_tables: list, user_ids: list[int] = None):
+    """SELECT producing fresh user_stats rows from the source tables
+
+    chat_tables are the chat history tables to count (the monthly partitions);
+    only the ones that can hold today's rows are read for messages today.
+    """
+    week_start = datetime.combine((now - timedelta(days=now.weekday())).date(), time(), tzinfo=timezone.utc)
+    day_start = datetime.combine(now.date(), time(), tzinfo=timezone.utc)
+
+    def count(model, *conditions):
+        return (select(func.count()).select_from(model)
+                .where(model.user_id == User.id, *conditions).scalar_subquery())
+
+    def count_chat(tables, *conditions):
+        counts = [select(func.count()).select_from(table)
+                  .where(table.c.user_id == User.id, *(condition(table.c) for condition in conditions))
+                  .scalar_subquery() for table in tables]
+        return sum(counts[1:], counts[0]) if counts else literal(0)
+
+    query = select(
+        User.id,
+        count(JournalEntry, JournalEntry.deleted_at.is_(None)),
+        literal(week_key(now)),
+        count(JournalEntry, JournalEntry.deleted_at.is_(None), JournalEntry.created_at >= week_start),
+        count(Goal, Goal.deleted_at.is_(None)),
+        count(Goal, Goal.deleted_at.is_(None), Goal.progress >= COMPLETED_PROGRESS),
+        select(func.coalesce(func.sum(Goal.progress), 0))
+        .where(Goal.user_id == User.id, Goal.deleted_at.is_(None)).scalar_subquery(),
+        count_chat(chat_tables),
+        literal(day_key(now)),
+        count_chat([table for table in chat_tables if chat_partitions.overlaps(table, day_start)],
+                   lambda c: c.created_at >= day_start),
+        literal(now, DateTime(timezone=True)),
+    )
+    # SQLite needs a WHERE before ON CONFLICT to parse INSERT ... SELECT
+    return query.where(User.id.in_(user_ids) if user_ids is not None else true())
+
+
+async def reconcile(batch_size: int = 500) -> int:
+    """Recompute every user's row, on every shard when sharded; returns the users processed"""
+    if shard_engines is None:
+        return await _reconcile(engine, batch_size)
+    users = 0
+    async for _, shard_engine in each_shard_engine():
+        users += await _reconcile(shard_engine, batch_size)
+    return users
+
+
+async def _reconcile(db_engine, batch_size: int) -> int:
+    now = datetime.now(timezone.utc)
+    async with db_engine.connect() as conn:
+        user_ids = (await conn.execute(select(User.id).order_by(User.id))).scalars().all()
+        chat_tables = await chat_partitions.partitions(conn)
+
+    for start in range(0, len(user_ids), batch_size):
+        batch = user_ids[start:start + batch_size]
+        async with db_engine.begin() as conn:
+            # Deleting first takes the write lock (SQLite) or the row locks
+            # (PostgreSQL), so no increment lands between the recount and the write
+            await conn.execute(delete(UserStats).where(UserStats.user_id.in_(batch)))
+            stmt = upsert(db_engine.dialect.name).from_select(STAT_COLUMNS, computed_stats(now, chat_tables, batch))
+            stmt = stmt.on_conflict_do_update(
+                index_elements=["user_id"],
+                set_={c: stmt.excluded[c] for c in STAT_COLUMNS if c != "user_id"},
+            )
+            await conn.execute(stmt)
+    return len(user_ids)
+
+
+router = APIRouter()
+
+
+@router.get("/stats")
+async def get_stats(session: ReadDbSession, claims: TokenClaims = Depends(get_current_claims)):
+    try:
+        query = select(UserStats)
+        if claims.user_id is not None:
+            query = query.where(UserStats.user_id == claims.user_id)
+        else:
+            query = query.join(User, User.id == UserStats.user_id).where(User.email == claims.email)
+        row = (await session.execute(query)).scalar_one_or_none()
+
+        now = datetime.now(timezone.utc)
+        if row is None:
+            return {"journal_entries": 0, "journal_entries_this_week": 0, "goals": 0, "goals_completed": 0,
+                    "average_progress": 0, "messages": 0, "messages_today": 0}
+        return {
+            "journal_entries": row.journal_entries,
+            "journal_entries_this_week": row.journal_week_count if row.journal_week == week_key(now) else 0,
+            "goals": row.goals,
+            "goals_completed": row.goals_completed,
+            "average_progress": round(row.progress_sum / row.goals, 1) if row.goals else 0,
+            "messages": row.messages,
+            "messages_today": row.messages_day_count if row.messages_day == day_key(now) else 0,
+        }
+    except Exception as e:
+        logging.error(f"Stats error: {str(e)}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+async def run_command(args):
+    try:
+        users = await reconcile(args.batch_size)
+        logging.info(f"Reconciled statistics for {users} users")
+    finally:
+        if shard_engines is not None:
+            await shard_engines.dispose()
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recompute user_stats from the source tables")
+    parser.add_argument("command", choices=["reconcile"])
+    parser.add_argument("--batch-size", type=int, default=500)
+    asyncio.run(run_command(parser.parse_args()))
@@ -0,0 +1,43 @@
+"""
+Test settings for the backend
+The modules read their settings from the environment at import time, so a
+scratch SQLite database, secrets and a missing hash policy file (the legacy
+pbkdf2_sha256 defaults) are set here before any test imports them.
+
+    cd backend && python -m pytest -q tests
+"""
+import os
+import sys
+import tempfile
+
+TEST_DIR = tempfile.mkdtemp(prefix="lifecoach-tests-")
+TEST_DATABASE = os.path.join(TEST_DIR, "test.db")
+
+os.environ.update({
+    "APP_ENV": "dev",
+    "DATABASE_URL": f"sqlite+aiosqlite:///{TEST_DATABASE}",
+    "JWT_SECRET_KEY": "test-secret",
+    "JWT_ALGORITHM": "HS256",
+    "API_KEY_SECRET": "test-api-key-secret",
+    "GEMINI_API_KEY": "",
+    "HASH_POLICY_FILE": os.path.join(TEST_DIR, "hash_policy.json"),
+    "DB_ECHO": "0",
+    "DB_QUERY_CACHE_MB": "0",
+    "DB_SINGLE_WRITER": "0",
+    "DB_SHARD_COUNT": "0",
+    "DB_PURGE_INTERVAL": "0",
+    "DB_MAINTENANCE_INTERVAL": "0",
+})
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+
+@pytest.fixture(scope="module")
+def client():
+    """The API on the scratch database, with its startup and shutdown run"""
+    from fastapi.testclient import TestClient
+    import main
+
+    with TestClient(main.app) as test_client:
+        yield test_client
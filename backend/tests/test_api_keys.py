@@ -0,0 +1,72 @@
+import sqlite3
+from datetime import datetime, timezone
+
+import pytest
+
+import api_keys
+from api_keys import generate_api_key
+from conftest import TEST_DATABASE
+
+EMAIL = "integration@example.com"
+
+
+@pytest.fixture(scope="module")
+def make_key(client):
+    """Create an API key for EMAIL straight in the database: make_key(scopes, rate_limit) -> headers"""
+    assert client.post("/auth/register", json={"email": EMAIL, "password": "pw"}).status_code == 200
+
+    def make_key(scopes: str, rate_limit: int = 0) -> dict:
+        full_key, prefix, digest = generate_api_key()
+        with sqlite3.connect(TEST_DATABASE) as conn:
+            conn.execute(
+                "INSERT INTO api_keys (prefix, digest, user_email, name, scopes, rate_limit_per_minute, created_at) "
+                "VALUES (?, ?, ?, 'test', ?, ?, ?)",
+                (prefix, digest, EMAIL, scopes, rate_limit, datetime.now(timezone.utc).isoformat()),
+            )
+        return {"X-API-Key": full_key}
+
+    return make_key
+
+
+def test_key_reaches_only_its_scopes(client, make_key):
+    headers = make_key("goals")
+    assert client.get("/goals", headers=headers).status_code == 200
+    assert client.get("/journal/entries", headers=headers).status_code == 403
+    # Also accepted as the bearer token
+    bearer = {"Authorization": f"Bearer {headers['X-API-Key']}"}
+    assert client.get("/goals", headers=bearer).status_code == 200
+
+
+def test_wrong_secret_is_rejected(client, make_key):
+    full_key = make_key("*")["X-API-Key"]
+    assert client.get("/goals", headers={"X-API-Key": full_key[:-2] + "xx"}).status_code == 401
+
+
+def test_metrics_need_the_explicit_scope(client, make_key):
+    assert client.get("/metrics/sql", headers=make_key("*")).status_code == 403
+    assert client.get("/metrics/sql", headers=make_key("metrics")).status_code == 200
+    assert client.get("/goals", headers=make_key("metrics")).status_code == 403
+
+
+def test_no_key_can_change_the_account(client, make_key):
+    response = client.put("/auth/me", json={"language": "en"}, headers=make_key("auth"))
+    assert response.status_code == 403
+    assert client.get("/auth/me", headers=make_key("auth")).status_code == 200
+
+
+def test_rate_limit_answers_429(client, make_key):
+    headers = make_key("goals", rate_limit=2)
+    assert [client.get("/goals", headers=headers).status_code for _ in range(3)] == [200, 200, 429]
+
+
+def test_rate_bucket_refills_over_time(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(api_keys.time, "monotonic", lambda: now[0])
+    assert api_keys._take_rate_token("refill", 60)
+    for _ in range(59):
+        api_keys._take_rate_token("refill", 60)
+    assert not api_keys._take_rate_token("refill", 60)
+    now[0] += 1  # one token per second at 60/min
+    assert api_keys._take_rate_token("refill", 60)
+    assert not api_keys._take_rate_token("refill", 60)
+    assert all(api_keys._take_rate_token("unlimited", 0) for _ in range(1000))
@@ -0,0 +1,39 @@
+import sqlite3
+
+from passlib.hash import bcrypt, pbkdf2_sha256
+
+from conftest import TEST_DATABASE
+from hashing import build_crypt_context
+
+
+def test_off_policy_hashes_need_update():
+    context = build_crypt_context({"scheme": "bcrypt", "cost": 5})
+    assert not context.needs_update(bcrypt.using(rounds=5).hash("pw"))
+    assert context.needs_update(bcrypt.using(rounds=4).hash("pw"))  # too weak
+    assert context.needs_update(bcrypt.using(rounds=6).hash("pw"))  # too slow
+    assert context.needs_update(pbkdf2_sha256.hash("pw"))  # other scheme
+
+
+def test_recalibrated_scheme_still_verifies_old_hashes():
+    old_hash = pbkdf2_sha256.hash("pw")
+    valid, new_hash = build_crypt_context({"scheme": "bcrypt", "cost": 4}).verify_and_update("pw", old_hash)
+    assert valid
+    assert new_hash.startswith("$2b$04$")
+
+
+def _stored_password(email):
+    with sqlite3.connect(TEST_DATABASE) as conn:
+        return conn.execute("SELECT password FROM users WHERE email = ?", (email,)).fetchone()[0]
+
+
+def test_login_rehashes_off_policy_password(client):
+    email = "rehash@example.com"
+    assert client.post("/auth/register", json={"email": email, "password": "pw"}).status_code == 200
+    with sqlite3.connect(TEST_DATABASE) as conn:
+        conn.execute("UPDATE users SET password = ? WHERE email = ?", (bcrypt.using(rounds=4).hash("pw"), email))
+
+    response = client.post("/auth/login", json={"email": email, "password": "pw"})
+    assert response.status_code == 200
+    # No policy file: the legacy pbkdf2_sha256 defaults are the policy
+    assert _stored_password(email).startswith("$pbkdf2-sha256$")
+    assert client.post("/auth/login", json={"email": email, "password": "wrong"}).status_code == 400
@@ -0,0 +1,62 @@
+import os
+
+import pytest
+from jose import JWTError, jwt
+
+import auth
+import jwt_keys
+from jwt_keys import KeyRing, rotate
+
+
+@pytest.fixture
+def key_ring(tmp_path, monkeypatch):
+    """auth signing and verifying with an ES256 key ring in tmp_path"""
+    monkeypatch.setattr(jwt_keys, "RELOAD_INTERVAL_SECONDS", 0)
+    ring = KeyRing(str(tmp_path / "jwks.json"), str(tmp_path))
+    monkeypatch.setattr(auth, "ALGORITHM", "ES256")
+    monkeypatch.setattr(auth, "key_ring", ring)
+    return ring
+
+
+def _rotate(key_dir, activate_in_seconds=0, token_lifetime_seconds=3600):
+    kid = rotate(str(key_dir), "ES256", activate_in_seconds, token_lifetime_seconds)
+    # Every rotation counts as new, even within the file system's mtime resolution
+    os.utime(key_dir / "jwks.json", ns=(os.stat(key_dir / "jwks.json").st_mtime_ns + 1_000_000_000,) * 2)
+    return kid
+
+
+def _kid(token):
+    return jwt.get_unverified_header(token)["kid"]
+
+
+def test_tokens_signed_before_rotation_still_verify(key_ring, tmp_path):
+    first = _rotate(tmp_path)
+    old_token = auth.create_access_token({"sub": "a@example.com"})
+    assert _kid(old_token) == first
+
+    second = _rotate(tmp_path)
+    new_token = auth.create_access_token({"sub": "a@example.com"})
+    assert _kid(new_token) == second
+    assert auth.decode_access_token(old_token)["sub"] == "a@example.com"
+    assert auth.decode_access_token(new_token)["sub"] == "a@example.com"
+
+
+def test_pending_key_is_published_but_does_not_sign(key_ring, tmp_path):
+    active = _rotate(tmp_path)
+    pending = _rotate(tmp_path, activate_in_seconds=3600)
+    assert {entry["kid"] for entry in key_ring.jwks()["keys"]} == {active, pending}
+    assert _kid(auth.create_access_token({"sub": "a@example.com"})) == active
+
+
+def test_retired_and_unknown_keys_are_rejected(key_ring, tmp_path):
+    _rotate(tmp_path)
+    old_token = auth.create_access_token({"sub": "a@example.com"})
+    _rotate(tmp_path)
+    # The second key has been active longer than a token lives, so the first is retired
+    _rotate(tmp_path, activate_in_seconds=3600, token_lifetime_seconds=-1)
+    with pytest.raises(JWTError):
+        auth.decode_access_token(old_token)
+
+    forged = jwt.encode({"sub": "a@example.com"}, "secret", algorithm="HS256", headers={"kid": "nope"})
+    with pytest.raises(JWTError):
+        auth.decode_access_token(forged)
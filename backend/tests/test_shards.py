@@ -0,0 +1,46 @@
+import asyncio
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from shards import ShardEngines, jump_hash
+
+
+def test_jump_hash_moves_few_keys():
+    keys = range(10_000)
+    moved = sum(jump_hash(key, 10) != jump_hash(key, 11) for key in keys)
+    assert all(0 <= jump_hash(key, 11) < 11 for key in keys)
+    assert moved < len(keys) / 11 * 1.2  # about 1/(N+1) of the keys
+
+
+def test_evicted_engine_is_disposed_after_its_last_user(tmp_path, monkeypatch):
+    disposed = []
+    dispose = AsyncEngine.dispose
+
+    async def record_dispose(self, *args, **kwargs):
+        disposed.append(self)
+        await dispose(self, *args, **kwargs)
+
+    monkeypatch.setattr(AsyncEngine, "dispose", record_dispose)
+    engines = ShardEngines(str(tmp_path), max_open=2)
+
+    async def scenario():
+        async with engines.use(0) as (held, _):
+            async with engines.use(1) as (idle, _):
+                pass
+            async with engines.use(0):
+                pass  # 0 is now the most recently used, 1 the least
+            async with engines.use(2):
+                pass
+            assert not engines.is_open(1) and idle in disposed  # unused, disposed right away
+
+            async with engines.use(3):
+                pass
+            assert not engines.is_open(0) and held not in disposed  # still held below
+            async with held.connect() as conn:
+                assert (await conn.execute(text("SELECT 1"))).scalar() == 1
+        assert held in disposed
+        assert engines.evicted == 2
+        await engines.dispose()
+
+    asyncio.run(scenario())
@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+import writer
+from database import Base, User
+from writer import WriteQueue
+
+
+def add_user(email):
+    async def operation(session):
+        user = User(email=email, password="x")
+        session.add(user)
+        await session.flush()
+        return user.id
+    return operation
+
+
+async def fail(session):
+    raise ValueError("rejected by the handler")
+
+
+async def run_batch(*operations):
+    """Submit operations together to a writer on writer.DATABASE_URL; returns (outcomes, emails, queue)"""
+    writer_engine = writer._create_writer_engine()
+    try:
+        async with writer_engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        queue = WriteQueue(async_sessionmaker(writer_engine, expire_on_commit=False))
+        queue.start()
+        outcomes = await asyncio.gather(*(queue.submit(op) for op in operations), return_exceptions=True)
+        await queue.stop()
+        async with writer_engine.connect() as conn:
+            emails = (await conn.execute(select(User.email).order_by(User.email))).scalars().all()
+    finally:
+        await writer_engine.dispose()
+    return outcomes, emails, queue
+
+
+@pytest.fixture(autouse=True)
+def writer_database(tmp_path, monkeypatch):
+    monkeypatch.setattr(writer, "DATABASE_URL", f"sqlite+aiosqlite:///{tmp_path / 'writer.db'}")
+
+
+def test_batch_commits_once():
+    outcomes, emails, queue = asyncio.run(run_batch(add_user("a@x.com"), add_user("b@x.com")))
+    assert all(isinstance(outcome, int) for outcome in outcomes)
+    assert emails == ["a@x.com", "b@x.com"]
+    assert (queue.transactions, queue.operations) == (1, 2)
+
+
+def test_failed_operation_is_isolated_by_savepoint_replay():
+    outcomes, emails, queue = asyncio.run(run_batch(
+        add_user("a@x.com"), add_user("a@x.com"), fail, add_user("b@x.com"),
+    ))
+    first, duplicate, failed, last = outcomes
+    assert isinstance(first, int) and isinstance(last, int)
+    assert isinstance(duplicate, IntegrityError)
+    assert isinstance(failed, ValueError)
+    # The replay rolled back the first attempt, so nothing was written twice
+    assert emails == ["a@x.com", "b@x.com"]
+    assert (queue.transactions, queue.operations) == (1, 4)
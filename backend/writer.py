@@ -0,0 +1,174 @@
+"""
+Single-writer task with group commit
+SQLite allows one writer at a time, so independent commits from every request
+just queue up on the database lock. With DB_SINGLE_WRITER enabled, mutating
+operations are submitted to one writer coroutine instead; it takes everything
+queued since its last commit and commits it all in one transaction. If any
+operation fails, the batch is rolled back and replayed with one SAVEPOINT per
+operation, so each caller still gets its own result or exception back.
+Operations may therefore run twice and must not have side effects outside
+the session.
+
+Operations are async callables taking a session:
+
+    async def add_entry(session):
+        session.add(entry)
+        await session.flush()
+        return entry.id
+
+    entry_id = await submit_write(add_entry)
+"""
+import asyncio
+import logging
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from database import DATABASE_URL, async_session, db_settings, engine, apply_sqlite_pragmas
+from replicas import mark_write
+from settings import engine_options
+
+
+class WriteQueue:
+    def __init__(self, session_factory, max_batch: int = 256):
+        self.session_factory = session_factory
+        self.max_batch = max_batch
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._task = None
+        self.transactions = 0
+        self.operations = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        if not self.running:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Finish everything already queued, then stop the writer"""
+        if not self.running:
+            return
+        await self._queue.join()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def submit(self, operation):
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((operation, future))
+        return await future
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            # Everything that queued up during the previous commit goes into this one
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                await self._commit_batch(batch)
+            except Exception as e:
+                logging.exception("Writer transaction failed")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _commit_batch(self, batch):
+        batch = [(operation, future) for operation, future in batch if not future.cancelled()]
+        try:
+            outcomes = await self._run_batch(batch, isolate=False)
+        except Exception:
+            # Something in the batch failed; replay it with one savepoint per
+            # operation so only the failing caller sees the error
+            outcomes = await self._run_batch(batch, isolate=True)
+
+        self.transactions += 1
+        self.operations += len(outcomes)
+        for future, result, error in outcomes:
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    async def _run_batch(self, batch, isolate: bool):
+        """Run every operation in one transaction; operations must be safe to re-run"""
+        outcomes = []
+        async with self.session_factory() as session:
+            for operation, future in batch:
+                if not isolate:
+                    outcomes.append((future, await operation(session), None))
+                    continue
+                try:
+                    async with session.begin_nested():
+                        result = await operation(session)
+                except Exception as e:
+                    outcomes.append((future, None, e))
+                else:
+                    outcomes.append((future, result, None))
+            await session.commit()
+        return outcomes
+
+
+def _create_writer_engine():
+    if not db_settings.is_sqlite or db_settings.is_memory_sqlite:
+        # PostgreSQL savepoints need no special handling; an in-memory SQLite
+        # database only exists on the main engine's single connection
+        return engine
+    # One connection that opens its transactions with BEGIN IMMEDIATE. The
+    # sqlite3 driver's own transaction handling is switched off, otherwise it
+    # would not emit BEGIN before the first SAVEPOINT and each release would commit.
+    options = engine_options(db_settings)
+    if "pool_size" in options:
+        options.update(pool_size=1, max_overflow=0)
+    writer_engine = create_async_engine(DATABASE_URL, **options)
+
+    @event.listens_for(writer_engine.sync_engine, "connect")
+    def disable_driver_transactions(dbapi_connection, connection_record):
+        apply_sqlite_pragmas(dbapi_connection, connection_record)
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(writer_engine.sync_engine, "begin")
+    def begin_immediate(conn):
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+    return writer_engine
+
+
+write_queue = None
+if db_settings.single_writer:
+    writer_engine = _create_writer_engine()
+    write_queue = WriteQueue(
+        async_sessionmaker(writer_engine, expire_on_commit=False),
+        max_batch=db_settings.writer_max_batch,
+    )
+
+
+async def submit_write(operation, user_email: str = None, session=None):
+    """Run operation(session) and commit it, through the single writer when enabled.
+
+    Without the single writer, handlers pass their request session (see
+    get_db); the operation is flushed there and committed with the rest of
+    the request. Scripts pass no session and get a commit of their own.
+    Pass the acting user's email so their reads stick to the primary for a
+    moment afterwards (see replicas.py).
+    """
+    if write_queue is not None and write_queue.running:
+        result = await write_queue.submit(operation)
+    elif session is not None:
+        result = await operation(session)
+        await session.flush()
+    else:
+        async with async_session() as session:
+            result = await operation(session)
+            await session.commit()
+    mark_write(user_email)
+    return result